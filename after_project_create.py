@@ -21,10 +21,232 @@ the following keyword arguments:
 * log -        A logger instance to which progress can be reported via
                standard logger methods (info, warning, error etc)
 
+This config seeds the asset types, pipeline steps and cache published file
+types it relies on from config_constants. Every entity type is fetched once,
+only the missing records are created and they are sent with sg.batch in
+chunks, so running it again on an already seeded site makes no changes.
+
+    python after_project_create.py    seeds a mock shotgun twice, checking the
+                                      round trips, chunking and that the second
+                                      run creates nothing
 """
+import os
+import sys
+
+CONFIG_ROOT = os.path.dirname(os.path.abspath(__file__))
+if CONFIG_ROOT not in sys.path:
+    sys.path.append(CONFIG_ROOT)
+
+import config_constants as configCONST
+
+# max number of requests sent in one sg.batch call
+BATCH_CHUNK_SIZE = 50
+
+
+def asset_type_names():
+    """
+    :returns: The sg_asset_type list values this config names its assets with
+    """
+    return [
+        configCONST.SG_BLD_TYPE_NAME,
+        configCONST.SG_ENV_TYPE_NAME,
+        configCONST.SG_CHAR_TYPE_NAME,
+        configCONST.SG_LND_TYPE_NAME,
+        configCONST.SG_PROP_TYPE_NAME,
+        configCONST.SG_VEH_TYPE_NAME,
+    ]
+
+
+def step_definitions():
+    """
+    :returns: list of (entity type, step short name) the schema folders use
+    """
+    return [
+        ("Asset", configCONST.MODEL_SHORTNAME),
+        ("Asset", configCONST.RIG_SHORTNAME),
+        ("Asset", configCONST.SURFACE_SHORTNAME),
+        ("Asset", configCONST.ART_SHORTNAME),
+        ("Shot", configCONST.LAYOUT_SHORTNAME),
+        ("Shot", configCONST.ANIM_SHORTNAME),
+        ("Shot", configCONST.FX_SHORTNAME),
+        ("Shot", configCONST.LIGHT_SHORTNAME),
+        ("Shot", configCONST.COMP_SHORTNAME),
+    ]
+
+
+def published_file_type_names():
+    """
+    :returns: The cache published file types, one per CACHETAGS cache type
+    """
+    return sorted(set(configCONST.CACHETAGS.values()))
+
+
+def _batch(sg, requests, log):
+    """
+    Sends the requests in chunks of BATCH_CHUNK_SIZE.
+
+    :returns: list of the created / updated records
+    """
+    results = []
+    for start in range(0, len(requests), BATCH_CHUNK_SIZE):
+        chunk = requests[start:start + BATCH_CHUNK_SIZE]
+        log.debug("Sending batch of %d shotgun requests" % len(chunk))
+        results.extend(sg.batch(chunk))
+    return results
+
+
+def seed_asset_types(sg, log):
+    """
+    Adds any missing asset types to the Asset sg_asset_type list field.
+
+    :returns: list of the values added
+    """
+    field = sg.schema_field_read("Asset", "sg_asset_type")["sg_asset_type"]
+    valid_values = list(field["properties"]["valid_values"]["value"])
+    missing = [name for name in asset_type_names() if name not in valid_values]
+    if missing:
+        log.info("Adding asset types: %s" % ", ".join(missing))
+        sg.schema_field_update(
+            "Asset", "sg_asset_type", {"valid_values": valid_values + missing})
+    return missing
+
+
+def seed_steps(sg, log):
+    """
+    Creates any missing pipeline steps, matched on entity type and short name.
+
+    :returns: list of the created Step records
+    """
+    existing = set(
+        (each["entity_type"], each["short_name"])
+        for each in sg.find("Step", [], ["short_name", "entity_type"])
+    )
+    requests = [
+        {
+            "request_type": "create",
+            "entity_type": "Step",
+            "data": {
+                "code": short_name,
+                "short_name": short_name,
+                "entity_type": entity_type,
+            },
+        }
+        for (entity_type, short_name) in step_definitions()
+        if (entity_type, short_name) not in existing
+    ]
+    if requests:
+        log.info("Creating %d pipeline steps" % len(requests))
+    return _batch(sg, requests, log)
+
+
+def seed_published_file_types(sg, log):
+    """
+    Creates any missing cache published file types.
+
+    :returns: list of the created PublishedFileType records
+    """
+    existing = set(
+        each["code"] for each in sg.find("PublishedFileType", [], ["code"])
+    )
+    requests = [
+        {
+            "request_type": "create",
+            "entity_type": "PublishedFileType",
+            "data": {"code": name},
+        }
+        for name in published_file_type_names()
+        if name not in existing
+    ]
+    if requests:
+        log.info("Creating %d published file types" % len(requests))
+    return _batch(sg, requests, log)
+
 
 def create(sg, project_id, log, **kwargs):
     """
-    Insert post-project code here
+    Seeds the site with what this config's schema and apps expect: the
+    config_constants SG_*_TYPE_NAME asset types on the Asset sg_asset_type
+    list, the *_SHORTNAME pipeline steps for assets and shots, and a
+    PublishedFileType for every CACHETAGS cache type. Anything already there
+    is left alone.
     """
-    pass
+    log.info("Seeding shotgun with the %s config entities..." % configCONST.SHOTGUN_CONFIG_NAME)
+    seed_asset_types(sg, log)
+    seed_steps(sg, log)
+    seed_published_file_types(sg, log)
+
+
+if __name__ == "__main__":
+    import logging
+
+    class MockShotgun(object):
+        """
+        Keeps the records in memory and counts round trips per entity type.
+        """
+
+        def __init__(self):
+            self.asset_types = [configCONST.SG_CHAR_TYPE_NAME]
+            self.records = {
+                "Step": [{"type": "Step", "id": 1, "entity_type": "Asset",
+                          "short_name": configCONST.MODEL_SHORTNAME}],
+                "PublishedFileType": [],
+            }
+            self.calls = {}
+            self.batch_sizes = []
+
+        def _count(self, entity_type):
+            self.calls[entity_type] = self.calls.get(entity_type, 0) + 1
+
+        def schema_field_read(self, entity_type, field_name):
+            self._count(entity_type)
+            return {field_name: {"properties": {"valid_values": {"value": list(self.asset_types)}}}}
+
+        def schema_field_update(self, entity_type, field_name, properties):
+            self._count(entity_type)
+            self.asset_types = list(properties["valid_values"])
+
+        def find(self, entity_type, filters, fields):
+            self._count(entity_type)
+            return [dict(each) for each in self.records[entity_type]]
+
+        def batch(self, requests):
+            self.batch_sizes.append(len(requests))
+            created = []
+            for request in requests:
+                records = self.records[request["entity_type"]]
+                record = dict(request["data"], type=request["entity_type"], id=len(records) + 1)
+                records.append(record)
+                created.append(record)
+            # one round trip however many requests went in it
+            for entity_type in set(each["entity_type"] for each in requests):
+                self._count(entity_type)
+            return created
+
+    logging.basicConfig(level=logging.INFO)
+    mock_log = logging.getLogger("after_project_create")
+    BATCH_CHUNK_SIZE = 2
+
+    mock_sg = MockShotgun()
+    create(mock_sg, 1, mock_log)
+    step_count = len(step_definitions())
+    file_type_count = len(published_file_type_names())
+    assert set(mock_sg.asset_types) == set(asset_type_names()), mock_sg.asset_types
+    assert len(mock_sg.asset_types) == len(set(mock_sg.asset_types)), "duplicate asset types %s" % mock_sg.asset_types
+    assert len(mock_sg.records["Step"]) == step_count, mock_sg.records["Step"]
+    assert len(mock_sg.records["PublishedFileType"]) == file_type_count
+    assert max(mock_sg.batch_sizes) <= BATCH_CHUNK_SIZE, mock_sg.batch_sizes
+    # a find / read, then the chunked batches of what was missing
+    assert mock_sg.calls == {
+        "Asset": 2,
+        "Step": 1 + (step_count - 1 + BATCH_CHUNK_SIZE - 1) // BATCH_CHUNK_SIZE,
+        "PublishedFileType": 1 + (file_type_count + BATCH_CHUNK_SIZE - 1) // BATCH_CHUNK_SIZE,
+    }, mock_sg.calls
+    print("first seed: %s round trips per entity type" % mock_sg.calls)
+
+    mock_sg.calls = {}
+    mock_sg.batch_sizes = []
+    create(mock_sg, 1, mock_log)
+    assert not mock_sg.batch_sizes, "the second seed created %s" % mock_sg.batch_sizes
+    assert mock_sg.calls == {"Asset": 1, "Step": 1, "PublishedFileType": 1}, mock_sg.calls
+    assert len(mock_sg.records["Step"]) == step_count
+    print("second seed: %s round trips, nothing created" % mock_sg.calls)
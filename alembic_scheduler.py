@@ -0,0 +1,341 @@
+"""
+Parallel alembic export scheduler.
+
+Animation and FX caching used to write a windows .bat (ALEMBIC_BATCH_NAME / FX_BATCH_NAME) into TEMP_FOLDER that ran
+one mayapy export per group after another. This runs the same per group exports on a pool of headless worker
+processes on any platform:
+    - every {grp_name} is its own job writing to the maya_shot_anim_alembic / maya_shot_static_alembic path
+    - long shots can be split into frame range chunks that are stitched back together once they are all done
+    - failed jobs are retried
+    - progress and an ETA are written as json next to where the .bat used to go so tools can poll it
+    - exported caches are added to their shots cache_manifest
+
+The worker command is pluggable, the default runs mayapy with EXPORT_SCRIPT. Pass command=fake_command to run
+FAKE_EXPORT_SCRIPT with this python instead, it just writes the job json to the output path, so the scheduler can be
+run without maya.
+
+Usage:
+    jobs = [ExportJob(scene, 'charHero_hrc', '/path/shotA_charHero_hrc.v003.abc', 1001, 1240) for ...]
+    scheduler = ExportScheduler(jobs, workers=4, chunk_size=500)
+    result = scheduler.run()
+"""
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import cache_manifest
+import config_constants as configCONST
+
+DEFAULT_WORKERS = 4
+DEFAULT_RETRIES = 2
+POLL_INTERVAL = 0.25
+PROGRESS_NAME = '{}_cacheExport.json'
+## Stitches chunk files back together, comes with the alembic tools not maya
+STITCHER = 'AbcStitcher'
+
+## Run by mayapy for every job, gets the job json as its only argument
+EXPORT_SCRIPT = '''
+import json, sys
+job = json.loads(sys.argv[1])
+import maya.standalone
+maya.standalone.initialize(name='python')
+import maya.cmds as cmds
+cmds.loadPlugin('AbcExport', quiet=True)
+cmds.file(job['scene'], open=True, force=True)
+cmds.AbcExport(j='-frameRange {} {} {} -root {} -file {}'.format(
+    job['start'], job['end'], job['options'], job['root'], job['output'].replace('\\\\', '/')))
+maya.standalone.uninitialize()
+'''
+
+## Stand in for EXPORT_SCRIPT, FAKE_FRAME_TIME seconds per frame and fails when the root is in FAKE_FAIL_ROOTS
+FAKE_EXPORT_SCRIPT = '''
+import json, os, sys, time
+job = json.loads(sys.argv[1])
+if job['root'] in os.environ.get('FAKE_FAIL_ROOTS', '').split(','):
+    sys.exit(1)
+time.sleep(float(os.environ.get('FAKE_FRAME_TIME', '0')) * (job['end'] - job['start'] + 1))
+with open(job['output'], 'w') as f:
+    json.dump(job, f)
+'''
+
+
+class ExportJob(object):
+    """
+    One group to cache.
+    """
+
+    def __init__(self, scene, root, output, start, end, options='-uvWrite -worldSpace -writeVisibility'):
+        """
+        :param scene: (str) maya scene to open
+        :param root: (str) the {grp_name} group to export
+        :param output: (str) final alembic path, eg from the maya_shot_anim_alembic template
+        :param start: (int) first frame
+        :param end: (int) last frame
+        :param options: (str) extra AbcExport job flags
+        """
+        self.scene = scene
+        self.root = root
+        self.output = output
+        self.start = int(start)
+        self.end = int(end)
+        self.options = options
+
+    def chunks(self, chunk_size):
+        """
+        :return: (list) of ExportTask covering the frame range, one task when chunking is off or not needed
+        """
+        if not chunk_size or self.end - self.start + 1 <= chunk_size:
+            return [ExportTask(self, self.start, self.end, self.output)]
+
+        tasks = []
+        for start in range(self.start, self.end + 1, chunk_size):
+            end = min(start + chunk_size - 1, self.end)
+            base, ext = os.path.splitext(self.output)
+            tasks.append(ExportTask(self, start, end, '{}.chunk{}-{}{}'.format(base, start, end, ext)))
+        return tasks
+
+
+class ExportTask(object):
+    """
+    A frame range of a job, the unit the workers run.
+    """
+
+    def __init__(self, job, start, end, output):
+        self.job = job
+        self.start = start
+        self.end = end
+        self.output = output
+        self.attempts = 0
+        self.state = 'pending'
+        self.error = None
+        self.started = None
+        self.duration = None
+
+    def payload(self):
+        return {'scene': self.job.scene, 'root': self.job.root, 'output': self.output, 'start': self.start,
+                'end': self.end, 'options': self.job.options}
+
+
+def mayapy_path():
+    """
+    :return: (str) mayapy for the current MAYA_LOCATION, or just mayapy off the PATH
+    """
+    executable = 'mayapy.exe' if sys.platform == 'win32' else 'mayapy'
+    maya_location = os.environ.get('MAYA_LOCATION')
+    if maya_location:
+        return os.path.join(maya_location, 'bin', executable)
+    return executable
+
+
+def mayapy_command(task):
+    """
+    Default worker command, a headless mayapy running EXPORT_SCRIPT.
+    """
+    return [mayapy_path(), '-c', EXPORT_SCRIPT, json.dumps(task.payload())]
+
+
+def fake_command(task):
+    """
+    Worker command running FAKE_EXPORT_SCRIPT instead of mayapy.
+    """
+    return [sys.executable, '-c', FAKE_EXPORT_SCRIPT, json.dumps(task.payload())]
+
+
+def stitch_command(inputs, output):
+    return [STITCHER] + list(inputs) + [output]
+
+
+class ExportScheduler(object):
+    def __init__(self, jobs, workers=DEFAULT_WORKERS, chunk_size=None, retries=DEFAULT_RETRIES,
+                 command=mayapy_command, stitcher=stitch_command, progress_path=None, log_folder=None):
+        """
+        :param jobs: (list) of ExportJob
+        :param workers: (int) number of exports run at once
+        :param chunk_size: (int) max frames per task, None to export each group in one go
+        :param retries: (int) how many times a failed task is retried
+        :param command: callable taking an ExportTask and returning the argv to run it
+        :param stitcher: callable taking the chunk paths and the final path and returning the argv to merge them
+        :param progress_path: (str) where the progress json goes, defaults to TEMP_FOLDER
+        :param log_folder: (str) where each task's output is logged, defaults to a new temp folder
+        """
+        self.jobs = jobs
+        self.workers = max(1, workers)
+        self.retries = retries
+        self.command = command
+        self.stitcher = stitcher
+        self.progress_path = progress_path or os.path.join(configCONST.TEMP_FOLDER,
+                                                           PROGRESS_NAME.format(configCONST.USER_NAME))
+        self.log_folder = log_folder or tempfile.mkdtemp(prefix='cacheExport_')
+        self.tasks = []
+        self._job_tasks = []
+        for job in jobs:
+            tasks = job.chunks(chunk_size)
+            self._job_tasks.append((job, tasks))
+            self.tasks.extend(tasks)
+        self._started = None
+
+    def _log_path(self, task):
+        return os.path.join(self.log_folder, '{}.{}-{}.attempt{}.log'.format(
+            os.path.basename(task.output), task.start, task.end, task.attempts))
+
+    def _launch(self, task):
+        """
+        :return: (tuple) of (process, log file), or (None, error) if the worker couldn't be started eg no mayapy
+                 or out of file handles
+        """
+        task.attempts += 1
+        task.state = 'running'
+        task.started = time.time()
+        log_file = None
+        try:
+            log_file = open(self._log_path(task), 'w')
+            process = subprocess.Popen(self.command(task), stdout=log_file, stderr=subprocess.STDOUT)
+        except (IOError, OSError) as e:
+            if log_file is not None:
+                log_file.close()
+            return None, 'failed to start: {}'.format(e)
+        return process, log_file
+
+    def _finish(self, task, error, pending, logged=True):
+        """
+        Marks a task that ran done, or retries it / fails it when error is set.
+        :param logged: (bool) the worker ran and its output is in the task's log
+        """
+        task.duration = time.time() - task.started
+        if not error:
+            task.state = 'done'
+            task.error = None
+        elif task.attempts <= self.retries:
+            task.state = 'pending'
+            task.error = error
+            pending.append(task)
+        else:
+            task.state = 'failed'
+            task.error = '{} after {} attempts'.format(error, task.attempts)
+            if logged:
+                task.error += ', see {}'.format(self._log_path(task))
+
+    def _stop(self, running):
+        """
+        Kills the workers still running when run() is left early, eg on an exception or ctrl+c.
+        """
+        for task, process, log_file in running:
+            if process.poll() is None:
+                process.kill()
+            process.wait()
+            log_file.close()
+            task.state = 'failed'
+            task.error = 'stopped before it finished'
+            task.duration = time.time() - task.started
+
+    def _eta(self):
+        finished = [task.duration for task in self.tasks if task.state == 'done' and task.duration is not None]
+        remaining = len([task for task in self.tasks if task.state in ('pending', 'running')])
+        if not finished or not remaining:
+            return None
+        return (sum(finished) / len(finished)) * remaining / float(self.workers)
+
+    def write_progress(self):
+        counts = {}
+        for task in self.tasks:
+            counts[task.state] = counts.get(task.state, 0) + 1
+        progress = {
+            'total': len(self.tasks),
+            'counts': counts,
+            'elapsed': time.time() - self._started if self._started else 0.0,
+            'eta': self._eta(),
+            'tasks': [{'root': task.job.root, 'output': task.output, 'start': task.start, 'end': task.end,
+                       'state': task.state, 'attempts': task.attempts, 'error': task.error}
+                      for task in self.tasks],
+        }
+        tmp_path = '{}.tmp'.format(self.progress_path)
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump(progress, f, indent=2)
+            if os.path.isfile(self.progress_path):
+                os.remove(self.progress_path)
+            os.rename(tmp_path, self.progress_path)
+        except (IOError, OSError) as e:
+            print('Failed to write cache export progress {}: {}'.format(self.progress_path, e))
+        return progress
+
+    def _stitch(self, job, tasks):
+        if len(tasks) == 1:
+            return None
+        log_path = os.path.join(self.log_folder, '{}.stitch.log'.format(os.path.basename(job.output)))
+        try:
+            with open(log_path, 'w') as log_file:
+                returncode = subprocess.call(self.stitcher([task.output for task in tasks], job.output),
+                                             stdout=log_file, stderr=subprocess.STDOUT)
+        except (IOError, OSError) as e:
+            return 'stitching failed to start: {}'.format(e)
+        if returncode != 0:
+            return 'stitching failed with exit code {}, see {}'.format(returncode, log_path)
+        for task in tasks:
+            if os.path.isfile(task.output):
+                os.remove(task.output)
+        return None
+
+    def run(self):
+        """
+        Runs every task, blocking until they are all done or out of retries.
+        :return: (dict) of 'exported': [output paths], 'failed': {output path: error}
+        """
+        self._started = time.time()
+        pending = list(self.tasks)
+        running = []
+        self.write_progress()
+
+        try:
+            while pending or running:
+                changed = False
+                while pending and len(running) < self.workers:
+                    task = pending.pop(0)
+                    process, log_file = self._launch(task)
+                    if process is None:
+                        self._finish(task, log_file, pending, logged=False)
+                        changed = True
+                        if pending and pending[-1] is task:
+                            ## nothing running will free anything up, don't spin on a launch that keeps failing
+                            time.sleep(POLL_INTERVAL)
+                        continue
+                    running.append((task, process, log_file))
+
+                for entry in list(running):
+                    task, process, log_file = entry
+                    returncode = process.poll()
+                    if returncode is None:
+                        continue
+
+                    log_file.close()
+                    running.remove(entry)
+                    changed = True
+                    if returncode == 0 and os.path.isfile(task.output):
+                        self._finish(task, None, pending)
+                    else:
+                        self._finish(task, 'exit code {}'.format(returncode), pending)
+
+                if changed:
+                    self.write_progress()
+                else:
+                    time.sleep(POLL_INTERVAL)
+        finally:
+            if running:
+                self._stop(running)
+                self.write_progress()
+
+        result = {'exported': [], 'failed': {}}
+        for job, tasks in self._job_tasks:
+            failed = [task.error for task in tasks if task.state != 'done']
+            error = failed[0] if failed else self._stitch(job, tasks)
+            if error:
+                result['failed'][job.output] = error
+            else:
+                result['exported'].append(job.output)
+                cache_manifest.record_publish(job.output)
+
+        self.write_progress()
+        return result
@@ -0,0 +1,185 @@
+"""
+Non-blocking logging to TEMP_FOLDER/tankLog.
+
+With DEBUGGING on, toolkit's verbose logging used to be written to the tankLog straight from the maya main thread, and
+the launcher deleted the log on every launch, losing whatever led up to a crash. AsyncLogHandler instead:
+    - only formats and queues a record on the calling thread, a background thread does the file writes
+    - rotates the log by size (LOG_MAX_BYTES, LOG_BACKUP_COUNT) instead of it being deleted
+    - keeps the last LOG_RING_SIZE records of every level in memory, even ones below the file level, and dumps them
+      to {LOGFILE_NAME}.error.{time}.log when an error is logged so the context around it isn't lost
+
+BeforeAppLaunch rolls the log over at launch and installs the handler for the launch itself, maya's userSetup.py
+installs it for the session.
+
+Usage:
+    async_log.install()                         # on the sgtk logger
+    async_log.install(logging.getLogger('myTool'), file_level=logging.INFO)
+"""
+import atexit
+import collections
+import copy
+import logging
+import logging.handlers
+import os
+import threading
+import time
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+import config_constants as configCONST
+
+LOG_FORMAT = '%(asctime)s %(levelname)-8s %(name)s: %(message)s'
+QUEUE_SIZE = 10000
+_STOP = object()
+## logger name: the AsyncLogHandler installed on it
+_HANDLERS = {}
+
+
+def log_path():
+    return os.path.join(configCONST.TEMP_FOLDER, configCONST.LOGFILE_NAME)
+
+
+def rotate_log(path=None, max_bytes=None, backup_count=None):
+    """
+    Rolls the log over if it has grown past max_bytes, used at launch in place of deleting it.
+    :return: (bool) True if it was rolled over
+    """
+    path = path or log_path()
+    max_bytes = configCONST.LOG_MAX_BYTES if max_bytes is None else max_bytes
+    backup_count = configCONST.LOG_BACKUP_COUNT if backup_count is None else backup_count
+    if any(handler.path == path for handler in _HANDLERS.values()):
+        ## already being written by this process, its handler rolls it over itself
+        return False
+    if not os.path.isfile(path) or os.path.getsize(path) < max_bytes:
+        return False
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count, delay=True)
+    try:
+        handler.doRollover()
+    finally:
+        handler.close()
+    return True
+
+
+class AsyncLogHandler(logging.Handler):
+    def __init__(self, path=None, file_level=logging.DEBUG, max_bytes=None, backup_count=None, ring_size=None,
+                 queue_size=QUEUE_SIZE):
+        """
+        :param path: (str) the log file, defaults to TEMP_FOLDER/LOGFILE_NAME
+        :param file_level: (int) records below this only go to the ring buffer
+        :param ring_size: (int) number of records kept for the error dump
+        :param queue_size: (int) records waiting for the writer before new ones are dropped
+        """
+        logging.Handler.__init__(self, logging.DEBUG)
+        self.path = path or log_path()
+        self.file_level = file_level
+        self.ring = collections.deque(maxlen=configCONST.LOG_RING_SIZE if ring_size is None else ring_size)
+        self.dropped = 0
+        self.setFormatter(logging.Formatter(LOG_FORMAT))
+
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        self._file_handler = logging.handlers.RotatingFileHandler(
+            self.path,
+            maxBytes=configCONST.LOG_MAX_BYTES if max_bytes is None else max_bytes,
+            backupCount=configCONST.LOG_BACKUP_COUNT if backup_count is None else backup_count,
+            delay=True)
+        self._file_handler.setFormatter(logging.Formatter('%(message)s'))
+        self._queue = queue.Queue(queue_size)
+        self._thread = threading.Thread(target=self._write, name='AsyncLogHandler')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _prepare(self, record):
+        """
+        Formats on the calling thread so the writer never touches the record's args or traceback.
+        """
+        message = self.format(record)
+        record = copy.copy(record)
+        record.msg = message
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        return record
+
+    def emit(self, record):
+        try:
+            prepared = self._prepare(record)
+        except Exception:
+            self.handleError(record)
+            return
+
+        self.ring.append(prepared.msg)
+        if record.levelno >= logging.ERROR:
+            self._put(('dump', list(self.ring)))
+        elif record.levelno >= self.file_level:
+            self._put(('record', prepared))
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            ## never block the caller, the ring buffer still has it
+            self.dropped += 1
+
+    def _write(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is _STOP:
+                    return
+                kind, payload = item
+                if kind == 'record':
+                    self._file_handler.emit(payload)
+                else:
+                    self._dump(payload)
+            finally:
+                self._queue.task_done()
+
+    def _dump(self, lines):
+        ## the error itself is the last line, write it to the log as usual too
+        record = logging.makeLogRecord({'msg': lines[-1], 'levelno': logging.ERROR, 'levelname': 'ERROR'})
+        self._file_handler.emit(record)
+        dump_path = '{}.error.{}.log'.format(self.path, time.strftime('%Y%m%d_%H%M%S'))
+        try:
+            with open(dump_path, 'a') as f:
+                if self.dropped:
+                    f.write('({} records were dropped while the log queue was full)\n'.format(self.dropped))
+                f.write('\n'.join(lines))
+                f.write('\n')
+        except (IOError, OSError) as e:
+            print('Failed to dump the log ring buffer to {}: {}'.format(dump_path, e))
+
+    def flush(self):
+        """
+        Blocks until everything queued has been written.
+        """
+        if self._thread.is_alive():
+            self._queue.join()
+        self._file_handler.flush()
+
+    def close(self):
+        if self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join()
+        self._file_handler.close()
+        logging.Handler.close(self)
+
+
+def install(logger=None, **kwargs):
+    """
+    Adds an AsyncLogHandler to the logger once, the sgtk logger by default.
+    :return: (AsyncLogHandler)
+    """
+    logger = logger or logging.getLogger('sgtk')
+    handler = _HANDLERS.get(logger.name)
+    if handler is None:
+        handler = _HANDLERS[logger.name] = AsyncLogHandler(**kwargs)
+        logger.addHandler(handler)
+        if configCONST.DEBUGGING and logger.getEffectiveLevel() > logging.DEBUG:
+            logger.setLevel(logging.DEBUG)
+        atexit.register(handler.close)
+    return handler
@@ -0,0 +1,451 @@
+"""
+Headless batch publish runner.
+
+Republishing hundreds of scenes overnight, eg after a naming change enforced by INSIST_PREFIX_IN_ROOT, used to mean
+opening each one and running the publisher by hand. This runs the same collect / validate / publish / finalize the
+publisher UI does (the MayaSessionCollector and the configured publish plugins, through the tk-multi-publish2
+publish manager) for a list of scenes on a pool of headless worker processes:
+    - every scene is its own worker process, a crash only loses that scene and is retried
+    - a scene that fails validation isn't published and isn't retried, the failures are in its result
+    - each scene's result is streamed as a json line to the results file as soon as it finishes
+    - a checkpoint json records every finished scene so a stopped run picks up where it left off
+
+The maya side is a swappable layer. MayaLayer starts toolkit with the SHOTGUN_TOOLKIT_NAME script user in mayapy.
+FakeLayer stands in for it with this python, so the runner can be tried without maya:
+    FAKE_PUBLISH_ITEMS      items collected per scene, default 3
+    FAKE_PUBLISH_TIME       seconds each scene takes, default 0
+    FAKE_INVALID_SCENES     comma separated scene names that fail validation
+    FAKE_CRASH_SCENES       comma separated scene names whose worker dies
+    FAKE_CRASH_ONCE_SCENES  comma separated scene names whose worker dies the first time only
+
+Usage:
+    runner = BatchPublishRunner(scenes, workers=4, checkpoint_path='/tmp/republish.json')
+    summary = runner.run()
+
+    python batch_publish.py run scenes.txt [--workers 4] [--checkpoint path] [--results path] [--fake]
+                                           [--retry-failed] [--comment text]
+    python batch_publish.py check    runs a few fake scenes through the runner and checks retry, resume and results
+"""
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import config_constants as configCONST
+from alembic_scheduler import mayapy_path
+
+DEFAULT_WORKERS = 4
+DEFAULT_RETRIES = 1
+POLL_INTERVAL = 0.25
+## seconds before a worker that hangs is killed
+SCENE_TIMEOUT = 2 * 60 * 60
+CHECKPOINT_NAME = '{}_batchPublish.checkpoint.json'
+RESULTS_NAME = '{}_batchPublish.results.jsonl'
+PUBLISH_APP = 'tk-multi-publish2'
+## scene results that are final, anything else is run again on resume
+PUBLISHED = 'published'
+INVALID = 'invalid'
+FAILED = 'failed'
+
+
+class BatchPublishError(Exception):
+    pass
+
+
+class MayaLayer(object):
+    """
+    Opens a scene in mayapy and drives the publisher's publish manager on it.
+    """
+    name = 'maya'
+
+    def __init__(self):
+        self.engine = None
+        self.manager = None
+
+    def open(self, scene):
+        import maya.standalone
+        maya.standalone.initialize(name='python')
+        import maya.cmds as cmds
+        cmds.file(scene, open=True, force=True)
+
+        sys.path.append(configCONST.TANKCORE_PYTHON_PATH)
+        import sgtk
+        authenticator = sgtk.authentication.ShotgunAuthenticator()
+        user = authenticator.create_script_user(api_script=configCONST.SHOTGUN_TOOLKIT_NAME,
+                                                api_key=configCONST.SHOTGUN_TOOLKIT_API_KEY,
+                                                host=configCONST.SHOTGUN_URL)
+        sgtk.set_authenticated_user(user)
+        tk = sgtk.sgtk_from_path(scene)
+        context = tk.context_from_path(scene)
+        self.engine = sgtk.platform.start_engine('tk-maya', tk, context)
+        app = self.engine.apps.get(PUBLISH_APP)
+        if app is None:
+            raise BatchPublishError('{} is not configured for {}'.format(PUBLISH_APP, context))
+        self.manager = app.create_publish_manager()
+
+    def collect(self):
+        """
+        :return: (list) of the collected item names
+        """
+        self.manager.collect_session()
+        return [item.name for item in self.manager.tree]
+
+    def set_comment(self, comment):
+        for item in self.manager.tree:
+            item.description = comment
+
+    def validate(self):
+        """
+        :return: (list) of 'item: error' strings for every task that failed
+        """
+        return ['{}: {}'.format(task.item.name, error) for task, error in self.manager.validate() or []]
+
+    def publish(self):
+        self.manager.publish()
+
+    def finalize(self):
+        self.manager.finalize()
+
+    def close(self):
+        if self.engine is not None:
+            self.engine.destroy()
+        import maya.standalone
+        maya.standalone.uninitialize()
+
+
+class FakeLayer(object):
+    """
+    Stand in for MayaLayer, see the FAKE_* env vars.
+    """
+    name = 'fake'
+
+    def __init__(self):
+        self.scene = None
+
+    def _listed(self, env_var):
+        return os.path.basename(self.scene) in os.environ.get(env_var, '').split(',')
+
+    def open(self, scene):
+        if not os.path.isfile(scene):
+            raise BatchPublishError('Scene {} does not exist'.format(scene))
+        self.scene = scene
+        if self._listed('FAKE_CRASH_SCENES'):
+            os._exit(3)
+        if self._listed('FAKE_CRASH_ONCE_SCENES'):
+            marker = '{}.crashed'.format(scene)
+            if not os.path.isfile(marker):
+                open(marker, 'w').close()
+                os._exit(3)
+
+    def collect(self):
+        count = int(os.environ.get('FAKE_PUBLISH_ITEMS', '3'))
+        return ['{}_item{}'.format(os.path.basename(self.scene), index) for index in range(count)]
+
+    def set_comment(self, comment):
+        pass
+
+    def validate(self):
+        if self._listed('FAKE_INVALID_SCENES'):
+            return ['{}: root name is missing its prefix'.format(os.path.basename(self.scene))]
+        return []
+
+    def publish(self):
+        time.sleep(float(os.environ.get('FAKE_PUBLISH_TIME', '0')))
+
+    def finalize(self):
+        pass
+
+    def close(self):
+        pass
+
+
+LAYERS = {MayaLayer.name: MayaLayer, FakeLayer.name: FakeLayer}
+
+
+def publish_scene(scene, layer, comment=None):
+    """
+    Runs one scene through the publisher, in the worker process.
+    :param layer: (MayaLayer or FakeLayer)
+    :return: (dict) the scene's result
+    """
+    result = {'scene': scene, 'status': FAILED, 'items': [], 'errors': [], 'timings': {}}
+    phase = 'open'
+    try:
+        start = time.time()
+        layer.open(scene)
+        result['timings'][phase] = time.time() - start
+        for phase in ('collect', 'validate', 'publish', 'finalize'):
+            start = time.time()
+            if phase == 'collect':
+                result['items'] = layer.collect()
+                if comment:
+                    layer.set_comment(comment)
+            elif phase == 'validate':
+                result['errors'] = layer.validate()
+            else:
+                getattr(layer, phase)()
+            result['timings'][phase] = time.time() - start
+            if phase == 'validate' and result['errors']:
+                result['status'] = INVALID
+                return result
+        result['status'] = PUBLISHED
+    except Exception as e:
+        result['errors'].append('{} failed: {}'.format(phase, e))
+    finally:
+        try:
+            layer.close()
+        except Exception as e:
+            result['errors'].append('close failed: {}'.format(e))
+    return result
+
+
+def worker_command(scene, layer_name, result_path, comment=None):
+    """
+    :return: (list) the argv running one scene, in mayapy for the maya layer
+    """
+    python = mayapy_path() if layer_name == MayaLayer.name else sys.executable
+    command = [python, os.path.abspath(__file__), 'worker', scene, '--layer', layer_name, '--result', result_path]
+    if comment:
+        command.extend(['--comment', comment])
+    return command
+
+
+def _write_json(path, data):
+    tmp_path = '{}.tmp'.format(path)
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+    if os.path.isfile(path):
+        os.remove(path)
+    os.rename(tmp_path, path)
+
+
+class BatchPublishRunner(object):
+    def __init__(self, scenes, workers=DEFAULT_WORKERS, layer=MayaLayer.name, checkpoint_path=None,
+                 results_path=None, retries=DEFAULT_RETRIES, retry_failed=False, comment=None, log_folder=None,
+                 on_result=None):
+        """
+        :param scenes: (list) of scene paths
+        :param workers: (int) number of scenes published at once
+        :param layer: (str) maya or fake
+        :param checkpoint_path: (str) json of the finished scenes, defaults to TEMP_FOLDER
+        :param results_path: (str) json lines file each scene's result is appended to, defaults to TEMP_FOLDER
+        :param retries: (int) how many times a scene whose worker died is run again
+        :param retry_failed: (bool) on resume also run the scenes that failed or were invalid last time
+        :param comment: (str) publish comment for every item
+        :param log_folder: (str) where each worker's output goes, defaults to a new temp folder
+        :param on_result: callable given each scene's result dict as it finishes
+        """
+        if layer not in LAYERS:
+            raise BatchPublishError('Unknown layer {}, expected one of {}'.format(layer, sorted(LAYERS)))
+        self.scenes = list(scenes)
+        self.workers = max(1, workers)
+        self.layer = layer
+        self.checkpoint_path = checkpoint_path or os.path.join(configCONST.TEMP_FOLDER,
+                                                               CHECKPOINT_NAME.format(configCONST.USER_NAME))
+        self.results_path = results_path or os.path.join(configCONST.TEMP_FOLDER,
+                                                         RESULTS_NAME.format(configCONST.USER_NAME))
+        self.retries = retries
+        self.retry_failed = retry_failed
+        self.comment = comment
+        self.log_folder = log_folder or tempfile.mkdtemp(prefix='batchPublish_')
+        self.on_result = on_result
+        self.checkpoint = self._read_checkpoint()
+
+    def _read_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, 'r') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {'scenes': {}}
+
+    def _todo(self):
+        finished = self.checkpoint.setdefault('scenes', {})
+        final = (PUBLISHED,) if self.retry_failed else (PUBLISHED, INVALID, FAILED)
+        return [scene for scene in self.scenes if finished.get(scene, {}).get('status') not in final]
+
+    def _scene_name(self, scene):
+        return '{}.{}'.format(os.path.basename(scene), hashlib.sha1(scene.encode('utf-8')).hexdigest()[:8])
+
+    def _launch(self, scene, attempt):
+        name = self._scene_name(scene)
+        result_path = os.path.join(self.log_folder, '{}.result.json'.format(name))
+        if os.path.isfile(result_path):
+            os.remove(result_path)
+        log_path = os.path.join(self.log_folder, '{}.attempt{}.log'.format(name, attempt))
+        log_file = open(log_path, 'w')
+        process = subprocess.Popen(worker_command(scene, self.layer, result_path, self.comment),
+                                   stdout=log_file, stderr=subprocess.STDOUT)
+        return {'scene': scene, 'attempt': attempt, 'process': process, 'log_file': log_file,
+                'log_path': log_path, 'result_path': result_path, 'started': time.time()}
+
+    def _collect(self, running, returncode):
+        try:
+            with open(running['result_path'], 'r') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {'scene': running['scene'], 'status': FAILED, 'items': [], 'timings': {},
+                    'errors': ['worker exited with code {} without a result, see {}'.format(
+                        returncode, running['log_path'])]}
+
+    def _finish(self, result, summary):
+        self.checkpoint['scenes'][result['scene']] = {'status': result['status'], 'attempts': result['attempts'],
+                                                      'time': time.time()}
+        try:
+            with open(self.results_path, 'a') as f:
+                f.write(json.dumps(result, sort_keys=True))
+                f.write('\n')
+            _write_json(self.checkpoint_path, self.checkpoint)
+        except (IOError, OSError) as e:
+            print('Failed to record the batch publish result for {}: {}'.format(result['scene'], e))
+        summary[result['status']] = summary.get(result['status'], 0) + 1
+        if self.on_result is not None:
+            self.on_result(result)
+
+    def run(self):
+        """
+        Publishes every scene not already finished in the checkpoint, blocking until they are all done.
+        :return: (dict) of status: number of scenes, plus 'skipped' for the ones finished by an earlier run
+        """
+        pending = [(scene, 1) for scene in self._todo()]
+        summary = {'skipped': len(self.scenes) - len(pending)}
+        running = []
+
+        while pending or running:
+            while pending and len(running) < self.workers:
+                scene, attempt = pending.pop(0)
+                running.append(self._launch(scene, attempt))
+
+            changed = False
+            for each in list(running):
+                returncode = each['process'].poll()
+                if returncode is None:
+                    if time.time() - each['started'] < SCENE_TIMEOUT:
+                        continue
+                    each['process'].kill()
+                    returncode = each['process'].wait()
+
+                each['log_file'].close()
+                running.remove(each)
+                changed = True
+                result = self._collect(each, returncode)
+                result['attempts'] = each['attempt']
+                result['duration'] = time.time() - each['started']
+                if returncode != 0 and result['status'] == FAILED and each['attempt'] <= self.retries:
+                    ## the worker died, try the scene again in a fresh process
+                    pending.append((each['scene'], each['attempt'] + 1))
+                    continue
+                self._finish(result, summary)
+
+            if not changed:
+                time.sleep(POLL_INTERVAL)
+
+        return summary
+
+
+def _stream(data):
+    sys.stdout.write('{}\n'.format(json.dumps(data, sort_keys=True)))
+    sys.stdout.flush()
+
+
+def _worker(args):
+    layer = LAYERS[args.layer]()
+    result = publish_scene(args.scene, layer, args.comment)
+    _write_json(args.result, result)
+    ## a failed scene is still a clean exit, only a crash or a missing result means retry
+    return 0
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Publish maya scenes headless')
+    subparsers = parser.add_subparsers(dest='action')
+    run_parser = subparsers.add_parser('run', help='publish every scene listed in a file, one per line')
+    run_parser.add_argument('scene_list')
+    run_parser.add_argument('--workers', type=int, default=DEFAULT_WORKERS)
+    run_parser.add_argument('--checkpoint')
+    run_parser.add_argument('--results')
+    run_parser.add_argument('--fake', action='store_true', help='use the fake maya layer')
+    run_parser.add_argument('--retry-failed', action='store_true', help='run scenes that failed last time again')
+    run_parser.add_argument('--comment')
+    subparsers.add_parser('check', help='run fake scenes through the runner and check the results')
+    worker_parser = subparsers.add_parser('worker', help='publish one scene, run by the runner')
+    worker_parser.add_argument('scene')
+    worker_parser.add_argument('--layer', default=MayaLayer.name)
+    worker_parser.add_argument('--result', required=True)
+    worker_parser.add_argument('--comment')
+    args = parser.parse_args()
+
+    if args.action == 'worker':
+        sys.exit(_worker(args))
+
+    if args.action == 'check':
+        import shutil
+
+        check_folder = tempfile.mkdtemp(prefix='batchPublishCheck_')
+        try:
+            check_scenes = []
+            for scene_name in ('ok1.ma', 'ok2.ma', 'invalid.ma', 'crash.ma', 'flaky.ma', 'ok3.ma'):
+                check_scenes.append(os.path.join(check_folder, scene_name))
+                open(check_scenes[-1], 'w').close()
+            os.environ.update({'FAKE_PUBLISH_ITEMS': '2', 'FAKE_INVALID_SCENES': 'invalid.ma',
+                               'FAKE_CRASH_SCENES': 'crash.ma', 'FAKE_CRASH_ONCE_SCENES': 'flaky.ma'})
+            check_checkpoint = os.path.join(check_folder, 'checkpoint.json')
+            check_results = os.path.join(check_folder, 'results.jsonl')
+
+            def _runner(scenes, **kwargs):
+                streamed = []
+                return streamed, BatchPublishRunner(scenes, workers=2, layer=FakeLayer.name,
+                                                    checkpoint_path=check_checkpoint, results_path=check_results,
+                                                    log_folder=check_folder, on_result=streamed.append, **kwargs)
+
+            ## a run stopped after the first four scenes
+            streamed, runner = _runner(check_scenes[:4])
+            summary = runner.run()
+            assert summary == {'skipped': 0, PUBLISHED: 2, INVALID: 1, FAILED: 1}, summary
+            by_scene = dict((os.path.basename(each['scene']), each) for each in streamed)
+            assert by_scene['ok1.ma']['items'] == ['ok1.ma_item0', 'ok1.ma_item1'], by_scene['ok1.ma']
+            assert by_scene['invalid.ma']['errors'] and 'publish' not in by_scene['invalid.ma']['timings'], \
+                'an invalid scene was published'
+            assert by_scene['invalid.ma']['attempts'] == 1, 'an invalid scene was retried'
+            assert by_scene['crash.ma']['attempts'] == DEFAULT_RETRIES + 1, 'a crashed scene wasn\'t retried'
+            with open(check_results, 'r') as f:
+                lines = [json.loads(line) for line in f]
+            assert lines == streamed, 'the results file doesn\'t match the results streamed'
+
+            ## resuming with the full list only runs the rest, and a worker dying once is retried to a publish
+            streamed, runner = _runner(check_scenes)
+            summary = runner.run()
+            assert summary == {'skipped': 4, PUBLISHED: 2}, summary
+            by_scene = dict((os.path.basename(each['scene']), each) for each in streamed)
+            assert sorted(by_scene) == ['flaky.ma', 'ok3.ma'], sorted(by_scene)
+            assert by_scene['flaky.ma']['status'] == PUBLISHED and by_scene['flaky.ma']['attempts'] == 2, \
+                by_scene['flaky.ma']
+            with open(check_results, 'r') as f:
+                assert len(f.readlines()) == 6, 'results weren\'t appended'
+
+            ## --retry-failed runs the invalid and failed scenes again and nothing else
+            os.environ['FAKE_INVALID_SCENES'] = ''
+            streamed, runner = _runner(check_scenes, retry_failed=True)
+            summary = runner.run()
+            assert summary == {'skipped': 4, PUBLISHED: 1, FAILED: 1}, summary
+            assert sorted(os.path.basename(each['scene']) for each in streamed) == ['crash.ma', 'invalid.ma']
+            with open(check_checkpoint, 'r') as f:
+                finished = json.load(f)['scenes']
+            assert len(finished) == 6 and finished[check_scenes[2]]['status'] == PUBLISHED, finished
+        finally:
+            shutil.rmtree(check_folder)
+        print('checkpoint resume, crash retry, invalid scenes and the results stream ok')
+        sys.exit(0)
+
+    with open(args.scene_list, 'r') as f:
+        scene_paths = [line.strip() for line in f if line.strip()]
+    runner = BatchPublishRunner(scene_paths, workers=args.workers,
+                                layer=FakeLayer.name if args.fake else MayaLayer.name,
+                                checkpoint_path=args.checkpoint, results_path=args.results,
+                                retry_failed=args.retry_failed, comment=args.comment,
+                                on_result=_stream)
+    _stream(runner.run())
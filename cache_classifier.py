@@ -0,0 +1,141 @@
+"""
+Bulk cache type classifier for config_constants.CACHETAGS.
+
+The lighting fetch and the cache exports work out what a node caches as by testing every CACHETAGS tag against the
+node name, one node at a time. For shots with tens of thousands of tagged transforms that loop is most of the prep
+time. The classifier is compiled once from CACHETAGS into:
+    - a frozen exact lookup table for tag values eg animCHAR, staticBLD, shotCam
+    - a suffix automaton (a trie over the reversed tags) that finds the longest tag ending a name token in a single
+      backwards pass over the characters, eg charHero_animCHAR_hrc -> animCHAR
+
+A batch call only classifies each distinct leaf name once.
+
+Usage:
+    classifier = get_classifier()
+    for name, result in zip(names, classifier.classify(names)):
+        print(name, result.cache_type, result.suffix, result.adef, result.srfvar)
+    by_type = classifier.group_by_cache_type(names)
+"""
+from collections import namedtuple
+
+import config_constants as configCONST
+
+## cache_type:  the CACHETAGS value eg AnimationCaches, None when untagged
+## tag:         the matched tag eg animCHAR
+## suffix:      the asset suffix of the tag eg CHAR, SRFVar, shotCam for the camera
+## adef/srfvar: the name is part of an assembly definition / a surface variant
+CacheClass = namedtuple('CacheClass', 'cache_type tag suffix adef srfvar')
+
+_END = None
+
+
+def _leaf_name(name):
+    """
+    |grp|ns:charHero_animCHAR_hrc -> charHero_animCHAR_hrc
+    """
+    return name.rsplit('|', 1)[-1].rsplit(':', 1)[-1]
+
+
+class CacheTagClassifier(object):
+    def __init__(self, cache_tags=None, suffixes=None):
+        """
+        :param cache_tags: (dict) tag: cache type, defaults to configCONST.CACHETAGS
+        :param suffixes: (list) asset suffixes the tags were built from, defaults to configCONST.SUFFIXES
+        """
+        cache_tags = configCONST.CACHETAGS if cache_tags is None else cache_tags
+        suffixes = configCONST.SUFFIXES if suffixes is None else suffixes
+        self.adef_tag = configCONST.ASSEMBLYDEF_SUFFIX
+        self.srfvar_tag = configCONST.SURFVAR_PREFIX
+
+        ## longest first so CPROP wins over PROP
+        ordered_suffixes = sorted(suffixes, key=len, reverse=True)
+        self._table = {}
+        for tag, cache_type in cache_tags.items():
+            suffix = next((each for each in ordered_suffixes if tag.endswith(each)), tag)
+            self._table[tag] = (cache_type, tag, suffix)
+
+        self._automaton = {}
+        for tag in self._table:
+            state = self._automaton
+            for char in reversed(tag):
+                state = state.setdefault(char, {})
+            state[_END] = tag
+
+    def _match_suffix(self, token):
+        """
+        :return: (str) the longest tag the token ends with, or None
+        """
+        state = self._automaton
+        found = None
+        for index in range(len(token) - 1, -1, -1):
+            state = state.get(token[index])
+            if state is None:
+                break
+            if _END in state:
+                found = state[_END]
+        return found
+
+    def _classify_leaf(self, leaf):
+        adef = self.adef_tag in leaf
+        srfvar = self.srfvar_tag in leaf
+
+        entry = self._table.get(leaf)
+        if entry is None:
+            ## tags are usually one _ separated token of the name, the last tagged token wins
+            for token in reversed(leaf.split('_')):
+                tag = token if token in self._table else self._match_suffix(token)
+                if tag:
+                    entry = self._table[tag]
+                    break
+
+        if entry is None:
+            return CacheClass(None, None, None, adef, srfvar)
+        return CacheClass(entry[0], entry[1], entry[2], adef, srfvar)
+
+    def classify_one(self, name):
+        """
+        :param name: (str) a node name, dag path or tag value
+        :return: (CacheClass)
+        """
+        return self._classify_leaf(_leaf_name(name))
+
+    def classify(self, names):
+        """
+        :param names: (list) of node names, dag paths or tag values
+        :return: (list) of CacheClass in the same order as names
+        """
+        seen = {}
+        results = []
+        for name in names:
+            leaf = _leaf_name(name)
+            result = seen.get(leaf)
+            if result is None:
+                result = seen[leaf] = self._classify_leaf(leaf)
+            results.append(result)
+        return results
+
+    def group_by_cache_type(self, names):
+        """
+        :return: (dict) of cache type: [names], untagged names are left out
+        """
+        grouped = {}
+        for name, result in zip(names, self.classify(names)):
+            if result.cache_type:
+                grouped.setdefault(result.cache_type, []).append(name)
+        return grouped
+
+
+_CLASSIFIER = []
+
+
+def get_classifier():
+    """
+    :return: (CacheTagClassifier) compiled from CACHETAGS on first use
+    """
+    if not _CLASSIFIER:
+        _CLASSIFIER.append(CacheTagClassifier())
+    return _CLASSIFIER[0]
+
+
+def classify(names):
+    return get_classifier().classify(names)
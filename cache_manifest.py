@@ -0,0 +1,272 @@
+"""
+Per shot manifest of the latest published caches.
+
+Fetching the latest caches used to scan every publish/alembic_anim, alembic_static, gpu, cam and atom v### folder
+(the maya_shot_*_versionFolder templates) under a shot for the highest version of every group. Instead each shot
+keeps a small json index next to its step folders:
+    sequences/{Sequence}/{Shot}/.cache_manifest.json
+
+    {'caches': {step: {cache type: {group: {'version': 3, 'path': relative path, 'mtime': ...}}}}}
+
+Publishing a cache calls record_publish(path) to update the index for just that file, so fetching the latest caches
+is a single file read. The index can always be rebuilt from the publish folders with rebuild(), and is rebuilt
+automatically when it is missing.
+
+Usage:
+    cache_manifest.record_publish('/projects/x/sequences/sq010/sh010/Anm/publish/alembic_anim/v003/sh010_charHero_hrc.v003.abc')
+    for group, entry in cache_manifest.latest(shot_folder, step='Anm', cache_type=configCONST.ANIM_CACHE).items():
+        print(group, entry['version'], entry['path'])
+"""
+import errno
+import json
+import os
+import re
+import socket
+import threading
+import time
+import uuid
+
+import config_constants as configCONST
+
+MANIFEST_NAME = '.cache_manifest.json'
+## a lock whose owner hasn't touched it for this long is taken over
+LOCK_TIMEOUT = 30.0
+LOCK_HEARTBEAT = 5.0
+## publish folder: (cache type, file names are {name}_{grp_name} rather than just the group)
+CACHE_FOLDERS = {
+    'alembic_anim': (configCONST.ANIM_CACHE, True),
+    'alembic_static': (configCONST.STATIC_CACHE, True),
+    'gpu': (configCONST.GPU_CACHE, True),
+    'cam': (configCONST.CAMERA_CACHE, False),
+    'atom': (configCONST.ATOM_CACHE, False),
+}
+## PublishedFile types the publish hooks record here, anything else can't be a cache
+PUBLISH_TYPES = ('Alembic Cache',)
+VERSION_FOLDER = re.compile(r'^v(\d+)$')
+VERSIONED_FILE = re.compile(r'^(?P<stem>.+)\.v(?P<version>\d+)\.[^.]+$')
+
+
+def manifest_path(shot_folder):
+    return os.path.join(shot_folder, MANIFEST_NAME)
+
+
+def parse_cache_path(path):
+    """
+    Splits a published cache path into its manifest keys.
+    :param path: (str) eg .../{Shot}/{Step}/publish/alembic_anim/v003/{name}_{grp_name}.v003.abc
+    :return: (tuple) of (shot folder, step, cache type, group, version, path relative to the shot) or None if the
+             path isn't a cache publish
+    """
+    path = os.path.normpath(path)
+    parts = path.split(os.sep)
+    if len(parts) < 6 or parts[-4] != 'publish' or parts[-3] not in CACHE_FOLDERS:
+        return None
+    folder_version = VERSION_FOLDER.match(parts[-2])
+    file_match = VERSIONED_FILE.match(parts[-1])
+    if not folder_version or not file_match:
+        return None
+
+    cache_type, has_grp_name = CACHE_FOLDERS[parts[-3]]
+    group = file_match.group('stem')
+    if has_grp_name:
+        ## {name} is alphanumeric so the first _ splits it from the {grp_name}
+        group = group.split('_', 1)[-1]
+    shot_folder = os.sep.join(parts[:-5])
+    return (shot_folder, parts[-5], cache_type, group, int(file_match.group('version')),
+            '/'.join(parts[-5:]))
+
+
+def _empty_manifest():
+    return {'caches': {}, 'updated': time.time()}
+
+
+def _read(shot_folder):
+    try:
+        with open(manifest_path(shot_folder), 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return None
+
+
+def _write(shot_folder, manifest):
+    manifest['updated'] = time.time()
+    path = manifest_path(shot_folder)
+    tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    if os.path.isfile(path):
+        os.remove(path)
+    os.rename(tmp_path, path)
+
+
+class _ManifestLock(object):
+    """
+    Stops two publishes of the same shot writing the manifest at once.
+
+    The lock file holds its owner's host, pid and a token, and its mtime is touched every LOCK_HEARTBEAT seconds
+    while it is held. Only a lock whose heartbeat is older than the timeout, left behind by a publish that died, is
+    ever taken over, however long a live owner holds it.
+    """
+
+    def __init__(self, shot_folder, timeout=LOCK_TIMEOUT):
+        self.path = '{}.lock'.format(manifest_path(shot_folder))
+        self.timeout = timeout
+        self.owner = '{} {} {}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex)
+        self._stop = threading.Event()
+        self._heartbeat = None
+
+    def _is_stale(self):
+        try:
+            return time.time() - os.path.getmtime(self.path) > self.timeout
+        except OSError:
+            return False
+
+    def _beat(self):
+        while not self._stop.wait(LOCK_HEARTBEAT):
+            try:
+                os.utime(self.path, None)
+            except OSError:
+                return
+
+    def __enter__(self):
+        while True:
+            try:
+                handle = os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+                if self._is_stale():
+                    ## left behind by a crashed publish
+                    try:
+                        os.remove(self.path)
+                    except OSError:
+                        pass
+                    continue
+                time.sleep(0.1)
+                continue
+            os.write(handle, self.owner.encode('utf-8'))
+            os.close(handle)
+            self._heartbeat = threading.Thread(target=self._beat, name='ManifestLockHeartbeat')
+            self._heartbeat.daemon = True
+            self._heartbeat.start()
+            return self
+
+    def __exit__(self, *args):
+        self._stop.set()
+        self._heartbeat.join()
+        try:
+            with open(self.path, 'r') as f:
+                owner = f.read()
+        except (IOError, OSError):
+            return
+        ## taken over after our heartbeat stalled, it isn't ours to remove any more
+        if owner == self.owner:
+            os.remove(self.path)
+
+
+def _add(manifest, step, cache_type, group, version, relative_path, mtime=None):
+    """
+    :return: (bool) True if the entry is newer than what the manifest had
+    """
+    groups = manifest['caches'].setdefault(step, {}).setdefault(cache_type, {})
+    current = groups.get(group)
+    if current and current['version'] > version:
+        return False
+    groups[group] = {'version': version, 'path': relative_path, 'mtime': mtime or time.time()}
+    return True
+
+
+def rebuild(shot_folder, write=True):
+    """
+    Rebuilds a shots manifest by scanning its step publish folders.
+    :return: (dict) the manifest
+    """
+    manifest = _empty_manifest()
+    scan_start = time.time()
+    for step in sorted(os.listdir(shot_folder)):
+        publish_folder = os.path.join(shot_folder, step, 'publish')
+        if not os.path.isdir(publish_folder):
+            continue
+        for folder_name in CACHE_FOLDERS:
+            cache_folder = os.path.join(publish_folder, folder_name)
+            if not os.path.isdir(cache_folder):
+                continue
+            for version_folder in os.listdir(cache_folder):
+                if not VERSION_FOLDER.match(version_folder):
+                    continue
+                for file_name in os.listdir(os.path.join(cache_folder, version_folder)):
+                    path = os.path.join(cache_folder, version_folder, file_name)
+                    parsed = parse_cache_path(path)
+                    if parsed:
+                        _add(manifest, *parsed[1:], mtime=os.path.getmtime(path))
+
+    if write:
+        ## listed without the lock, anything recorded since the listing started is merged in rather than written over
+        with _ManifestLock(shot_folder):
+            current = _read(shot_folder)
+            for step, cache_types in (current or _empty_manifest())['caches'].items():
+                for cache_type, groups in cache_types.items():
+                    for group, entry in groups.items():
+                        if entry['mtime'] >= scan_start:
+                            _add(manifest, step, cache_type, group, entry['version'], entry['path'], entry['mtime'])
+            _write(shot_folder, manifest)
+    return manifest
+
+
+def record_publish(path):
+    """
+    Adds a newly published cache to its shots manifest, called by whatever publishes the cache.
+    :param path: (str) the published cache file
+    :return: (bool) True if the manifest was updated
+    """
+    parsed = parse_cache_path(path)
+    if not parsed:
+        return False
+    shot_folder = parsed[0]
+    rebuilt = None
+    try:
+        while True:
+            with _ManifestLock(shot_folder):
+                manifest = _read(shot_folder) or rebuilt
+                if manifest is not None:
+                    changed = _add(manifest, *parsed[1:])
+                    if changed or manifest is rebuilt:
+                        _write(shot_folder, manifest)
+                    return changed
+            ## don't start an empty index for a shot that already has publishes, the publish folders are listed
+            ## without holding the lock, whatever another publish writes meanwhile is used instead
+            rebuilt = rebuild(shot_folder, write=False)
+    except (IOError, OSError) as e:
+        print('Failed to update cache manifest for {}: {}'.format(path, e))
+        return False
+
+
+def latest(shot_folder, step=None, cache_type=None):
+    """
+    :param shot_folder: (str) the sequences/{Sequence}/{Shot} folder
+    :param step: (str) limit to one step eg Anm
+    :param cache_type: (str) limit to one cache type eg configCONST.ANIM_CACHE
+    :return: (dict) of step: cache type: group: entry with an absolute path, or just the inner dicts when step
+             and / or cache_type are given
+    """
+    manifest = _read(shot_folder)
+    if manifest is None:
+        manifest = rebuild(shot_folder)
+
+    caches = {}
+    for each_step, cache_types in manifest['caches'].items():
+        if step and each_step != step:
+            continue
+        for each_type, groups in cache_types.items():
+            if cache_type and each_type != cache_type:
+                continue
+            for group, entry in groups.items():
+                entry = dict(entry, path=os.path.join(shot_folder, *entry['path'].split('/')))
+                caches.setdefault(each_step, {}).setdefault(each_type, {})[group] = entry
+
+    if step:
+        caches = caches.get(step, {})
+        return caches.get(cache_type, {}) if cache_type else caches
+    if cache_type:
+        return dict((each_step, types.get(cache_type, {})) for each_step, types in caches.items())
+    return caches
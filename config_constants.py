@@ -120,7 +120,8 @@ smoothed or not. This attr will head all the way through to lighting, where we a
 it is VERY important to check in the MDL and RIG steps with the anticipated final smoothing | subdivision setups.
 """
 ## Import base python stuff
-import sys, getpass, os
+import sys, os, time
+_IMPORT_START = time.time()
 
 #############################################
 ## CONFIG CONSTANTS
@@ -129,17 +130,26 @@ import sys, getpass, os
 USE_BONUSTOOLS = False
 FORCE_USERSETUP_REINSTALL = True
 DEBUGGING = True
+## Mirror the SYS_PATHS onto local disk at launch, see startup_bundle.py. Zip packs the pure python ones for zipimport
+USE_STARTUP_BUNDLE = True
+STARTUP_BUNDLE_ZIP = False
+## Hand toolkit the pre-resolved env/.compiled environments, compiled at release by `python env_cache.py compile`
+USE_COMPILED_ENVIRONMENTS = True
+## Pull the project's shotgun entities from the shared sqlite mirror, see sg_mirror.py. Nothing reads the mirror yet,
+## leave this off until something does and the `python sg_mirror.py sync` job is scheduled
+USE_SG_MIRROR = False
 
 ## SETUP BASE CONSTANTS FOR THE CONFIG
-USER_NAME = getpass.getuser()
-try:
-    import maya.cmds as cmds
-    MAYA_VERSION = cmds.about(v=True)
-except:
-    MAYA_VERSION = '2020'
-print("MAYA_VERSION: %s" % MAYA_VERSION)
+## NOTE: USER_NAME, MAYA_VERSION and everything derived from them (CACHETAGS, the MAYA_CONFIG_* paths, SYS_PATHS etc)
+## are resolved lazily on first access on python 3.7+ only, see the LAZY CONSTANTS block at the bottom of this file.
+DEFAULT_MAYA_VERSION = '2020'
 
 LOGFILE_NAME = 'tankLog'
+## The tankLog rolls over at LOG_MAX_BYTES keeping LOG_BACKUP_COUNT old ones, the last LOG_RING_SIZE records are dumped
+## next to it when an error is logged, see async_log.py
+LOG_MAX_BYTES = 10 * 1024 * 1024
+LOG_BACKUP_COUNT = 5
+LOG_RING_SIZE = 500
 ## SHOT GUN BASE CONSTANTS
 SHOTGUN_CONFIG_NAME = 'baseConfig'
 #SHOTGUN_URL = [INSERT YOUR URL HERE eg https://mystudio.shotgunstudio.com AS A STRING]
@@ -223,13 +233,7 @@ GPU_CACHE = 'GpuCaches'
 FX_CACHE = 'FxCaches'
 SUFFIXES = (BUILDING_SUFFIX, ENVIRONMENT_SUFFIX, CHAR_SUFFIX, LND_SUFFIX, PROP_SUFFIX, CPROP_SUFFIX, LIB_SUFFIX,
      VEH_SUFFIX, SURFVAR_PREFIX, ASSEMBLYDEF_SUFFIX)
-CACHETAGS = {}
-for eachSuffix in SUFFIXES:
-    CACHETAGS['static{}'.format(eachSuffix)] = STATIC_CACHE
-    CACHETAGS['anim{}'.format(eachSuffix)] = ANIM_CACHE
-    CACHETAGS['fx{}'.format(eachSuffix)] = FX_CACHE
-    CACHETAGS['gpu{}'.format(eachSuffix)] = GPU_CACHE
-CACHETAGS[SHOTCAM_SUFFIX] = CAMERA_CACHE
+## CACHETAGS is built lazily from the SUFFIXES above, see the LAZY CONSTANTS block.
 
 ###################################################################################################################
 ## Set platform dependant config constants
@@ -246,10 +250,8 @@ if sys.platform == 'win32':
     MAYA_APP_DIR_ROOT = 'T:/'
 
     ## Animation publishing..
-    ALEMBIC_BATCH_NAME = '{}_animCacheExport.bat'.format(getpass.getuser()) ## TODO get a date time in here
-    FX_BATCH_NAME = '{}_FXCacheExport.bat'.format(getpass.getuser())   ## TODO get a date time in here
-    PATH_TO_ANIM_BAT = r'{}/{}'.format(TEMP_FOLDER, ALEMBIC_BATCH_NAME)
-    PATH_TO_FX_BAT = r'{}/{}'.format(TEMP_FOLDER, FX_BATCH_NAME)
+    ## ALEMBIC_BATCH_NAME, FX_BATCH_NAME, PATH_TO_ANIM_BAT and PATH_TO_FX_BAT are user specific so they are
+    ## resolved lazily, see the LAZY CONSTANTS block.
 
 ## OSX
 elif sys.platform == 'darwin':
@@ -280,66 +282,29 @@ else:
     ## Maya Specific
     MAYA_APP_DIR_ROOT = '/maya_appdir'
 
-SHOTGUN_CONFIG_PATH = os.path.join(SHOTGUN_SOFTWARE_ROOT, SHOTGUN_CONFIG_NAME)
-SHOTGUN_CONFIG_ROOT = os.path.join(SHOTGUN_SOFTWARE_ROOT, SHOTGUN_CONFIG_NAME, 'config')
-SHOTGUN_ICON_PATH = os.path.join(SHOTGUN_SOFTWARE_ROOT, SHOTGUN_CONFIG_NAME, *('config', 'icons'))
-TANKCORE_PYTHON_PATH = os.path.join(SHOTGUN_SOFTWARE_ROOT, *('studio', 'install', 'core', 'python'))
-SGTK_PYTHON_PATH = os.path.join(SHOTGUN_SOFTWARE_ROOT, 'python-api')
-SHOTGUN_LIBRARY_PATH = os.path.join(SHOTGUN_SOFTWARE_ROOT, 'defaultShotgunLibrary')
-SHOTGUN_DEVAPPS_PATH = os.path.join(SHOTGUN_CONFIG_PATH, *('install', 'apps'))
-MAYA_APP_DIR = os.path.join(MAYA_APP_DIR_ROOT, "{}_APPDIR".format(SHOTGUN_CONFIG_NAME))
-MAYA_USER_APP_DIR = os.path.join(MAYA_APP_DIR_ROOT, "{}_APPDIR".format(SHOTGUN_CONFIG_NAME), USER_NAME)
-MAYA_CONFIG_BASE = os.path.join(MAYA_USER_APP_DIR, MAYA_VERSION)
-MAYA_CONFIG_SCRIPT_PATH = os.path.join(MAYA_CONFIG_BASE, 'scripts')
-MAYA_CONFIG_PREFS_PATH = os.path.join(MAYA_CONFIG_BASE, 'prefs')
-MAYA_CONFIG_SHELVES_PATH = os.path.join(MAYA_CONFIG_BASE, *('prefs', 'shelves'))
-MAYA_DEFAULT_ENV = os.path.join(SHOTGUN_SOFTWARE_ROOT, SHOTGUN_CONFIG_NAME, 'mayaEnv', MAYA_VERSION)
-MAYA_DEFAULT_USERSETUPPY = os.path.join(MAYA_DEFAULT_ENV, 'userSetup.py')
-MAYA_PYTHON_LIB = os.path.join(SHOTGUN_SOFTWARE_ROOT, 'defaultMayaLibrary')
-MAYA_SCRIPT_PATHS = []
-
-#######################
-## BASE SYS PATHS CONSTANTS
-SYS_PATHS = [
-              os.path.join(MAYA_DEFAULT_ENV, 'site-packages'),
-              os.path.join(SHOTGUN_SOFTWARE_ROOT, 'defaultMayaLibrary'),
-              os.path.join(SHOTGUN_SOFTWARE_ROOT, 'defaultShotgunLibrary'),
-              os.path.join(SHOTGUN_SOFTWARE_ROOT, 'python-api'),
-              os.path.join(SHOTGUN_SOFTWARE_ROOT, 'MSide'),
-              os.path.join(SHOTGUN_SOFTWARE_ROOT, 'Nebula'),
-              os.path.join(SHOTGUN_SOFTWARE_ROOT, 'jbd_om2'),
-              SHOTGUN_LIBRARY_PATH,
-              TANKCORE_PYTHON_PATH,
-              SGTK_PYTHON_PATH,
-              MAYA_PYTHON_LIB,
-              SHOTGUN_CONFIG_ROOT,
-              ]
+## The shotgun roots above for every platform, not just this one. path_remap.py maps paths between them.
+## NOTE keep these in step with the platform blocks above!
+PLATFORM_ROOTS = {
+    'win': {
+        'SHOTGUN_SOFTWARE_ROOT': 'T:/software',
+        'SHOTGUN_PRIMARY_DRIVE': 'I:/',
+        'SHOTGUN_SECONDARY_DRIVE': 'K:/',
+    },
+    'osx': {
+        'SHOTGUN_SOFTWARE_ROOT': '/volumes/development/software',
+        'SHOTGUN_PRIMARY_DRIVE': '/volumes/projects',
+        'SHOTGUN_SECONDARY_DRIVE': '/volumes/renders',
+    },
+    'linux': {
+        'SHOTGUN_SOFTWARE_ROOT': '/development',
+        'SHOTGUN_PRIMARY_DRIVE': '/projects',
+        'SHOTGUN_SECONDARY_DRIVE': '/renders',
+    },
+}
 
-MAYA_XBM_PATHS = []
+## Where the scheduled sg_mirror.py sync job publishes the project mirrors for sessions to copy down
+SG_MIRROR_SHARED_FOLDER = os.path.join(SHOTGUN_PRIMARY_DRIVE, 'sgMirror')
 
-MAYA_PYTHON_PATHS = [os.path.join(SHOTGUN_SOFTWARE_ROOT, "jbd_om2", "OM2plugins")]
-
-MAYA_TEMPLATE_PATHS = ["{}/{}/{}/scripts/AETemplates".format(MAYA_APP_DIR, getpass.getuser(), MAYA_VERSION)]
-
-MAYA_PLUGIN_PATHS = [
-                     ("E:/3D_Development/cPlusPlus/_plugins/{}/x64/".format(MAYA_VERSION), "jd_mayaMathNodes.mll"),
-                     ("E:/3D_Development/cPlusPlus/_plugins/{}/x64/".format(MAYA_VERSION), "jd_hermite.mll"),
-                     ("E:/3D_Development/cPlusPlus/_plugins/{}/x64/".format(MAYA_VERSION), "jd_jaw.mll"),
-                     ("E:/3D_Development/cPlusPlus/_plugins/{}/x64/".format(MAYA_VERSION), "jd_eyelidNode.mll"),
-                     ("E:/3D_Development/cPlusPlus/_plugins/{}/x64/".format(MAYA_VERSION), "jd_pushTransform.mll"),
-                     ("E:/3D_Development/cPlusPlus/_plugins/{}/x64/".format(MAYA_VERSION), "jd_ziptransformarray.mll"),
-                     ("E:/3D_Development/cPlusPlus/_plugins/{}/x64/".format(MAYA_VERSION), "jd_bezier.mll"),
-                     ("E:/3D_Development/cPlusPlus/_plugins/{}/x64/".format(MAYA_VERSION), "brSmoothWeights.mll"),
-                     ("E:/3D_Development/cPlusPlus/_plugins/{}/x64/".format(MAYA_VERSION), "iDeform.mll"),
-                     ("E:/3D_Development/cPlusPlus/_plugins/{}/x64/".format(MAYA_VERSION), "rampWeights.mll"),
-                     ("E:/3D_Development/cPlusPlus/_plugins/{}/x64/".format(MAYA_VERSION), "weightDriver.mll"),
-                     ("E:/3D_Development/cPlusPlus/_plugins/{}/x64/".format(MAYA_VERSION), "TwistSpline.mll"),
-                     ("E:/3D_Development/cPlusPlus/_plugins/{}/x64/".format(MAYA_VERSION), "grimIK.mll"),
-                     ("E:/3D_Development/python/software/jbd_om2/maya_pythonPlugins", "resetSkinCluster.py"),
-                     ("E:/3D_Development/python/software/jbd_om2/maya_pythonPlugins", "skinTo.py"),
-                     ("E:/3D_Development/python/software/jbd_om2/maya_pythonPlugins", "saveSkinWeights.py"),
-                     ("E:/3D_Development/python/software/jbd_om2/maya_pythonPlugins", "loadSkinWeights.py")
-                     ]
 ################
 ## SANITY CHECKS
 SANITY = {
@@ -429,3 +394,343 @@ SANITY = {
     "lightingCleanup": True
     }
   }
+
+###################################################################################################################
+## LAZY CONSTANTS
+## On python 3.7+ (maya 2022 and later) everything below is resolved on first access (PEP 562 module __getattr__) and
+## then cached as a plain module attribute, so importing this module costs next to nothing and farm jobs that never
+## touch the maya paths never pay for them.
+## Python 2.7 and 3.6 have no module __getattr__, so there (maya 2020 and older) it is all resolved at import exactly
+## as before the lazy block and deferring buys nothing. What every version does get is MAYA_VERSION from
+## MAYA_LOCATION instead of a cmds.about call, and the snapshot below. benchImport() times it for an interpreter.
+## If a snapshot written by writeSnapshot() exists for this platform and maya version, and was written from this
+## exact config_constants.py (its sha1 is stored in the snapshot), the non user specific values are read from it
+## instead of being rebuilt. Editing this file makes the old snapshots stale until they are written again.
+## __all__ lists the lazy constants too so `from config_constants import *` still gets every one of them.
+SNAPSHOT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'snapshots')
+
+_LAZY = {}
+_SNAPSHOT = None
+_SNAPSHOT_SOURCE_KEY = '_SOURCE_SHA1'
+## These depend on who is running the session so they are never read from or written to a snapshot.
+_USER_SPECIFIC = ('USER_NAME', 'MAYA_VERSION', 'MAYA_USER_APP_DIR', 'MAYA_CONFIG_BASE', 'MAYA_CONFIG_SCRIPT_PATH',
+                  'MAYA_CONFIG_PREFS_PATH', 'MAYA_CONFIG_SHELVES_PATH', 'MAYA_TEMPLATE_PATHS', 'ALEMBIC_BATCH_NAME',
+                  'FX_BATCH_NAME', 'PATH_TO_ANIM_BAT', 'PATH_TO_FX_BAT')
+
+
+def _lazy(name):
+    """
+    Registers the decorated function as the resolver for the constant `name`
+    """
+    def _register(func):
+        _LAZY[name] = func
+        return func
+    return _register
+
+
+def _resolve(name):
+    """
+    Returns the value of the lazy constant `name`, resolving and caching it on the module the first time.
+    Resolvers must use this rather than the bare global name to reach other lazy constants.
+    """
+    moduleGlobals = globals()
+    if name in moduleGlobals:
+        return moduleGlobals[name]
+
+    snapshot = _snapshot() if name not in _USER_SPECIFIC else {}
+    if name in snapshot:
+        value = snapshot[name]
+    else:
+        value = _LAZY[name]()
+
+    moduleGlobals[name] = value
+    return value
+
+
+def __getattr__(name):
+    if name in _LAZY:
+        return _resolve(name)
+    raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY))
+
+
+def _detectMayaVersion():
+    """
+    Finds the maya version without a DCC call where it can.
+    MAYA_LOCATION is set by maya, mayapy and the launcher so it covers the interactive and batch cases, cmds.about
+    is only used if we are already inside a maya session that somehow has no MAYA_LOCATION.
+    """
+    import re
+    match = re.search(r'maya(\d{4})', os.environ.get('MAYA_LOCATION', ''), re.IGNORECASE)
+    if match:
+        return match.group(1)
+
+    if 'maya.cmds' in sys.modules:
+        try:
+            return sys.modules['maya.cmds'].about(v=True)
+        except Exception:
+            pass
+
+    return DEFAULT_MAYA_VERSION
+
+
+def snapshotPath(mayaVersion=None):
+    """
+    :param mayaVersion: (str) the maya version to get the snapshot for, defaults to the current MAYA_VERSION
+    :return: (str) the path of the snapshot file for this platform and maya version
+    """
+    mayaVersion = mayaVersion or _resolve('MAYA_VERSION')
+    return os.path.join(SNAPSHOT_ROOT, 'config_constants_{}_{}.json'.format(OSTYPE, mayaVersion))
+
+
+def _sourceDigest():
+    """
+    :return: (str) sha1 of this file's source, a snapshot is only used if it was written from the same source
+    """
+    import hashlib
+    with open(os.path.splitext(os.path.abspath(__file__))[0] + '.py', 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def _snapshot():
+    global _SNAPSHOT
+    if _SNAPSHOT is None:
+        _SNAPSHOT = {}
+        path = snapshotPath()
+        if os.path.isfile(path):
+            import json
+            try:
+                with open(path, 'r') as f:
+                    _SNAPSHOT = json.load(f)
+            except (IOError, OSError, ValueError):
+                _SNAPSHOT = {}
+
+            ## written from an older config_constants.py, its values may no longer be what the resolvers return
+            if _SNAPSHOT.pop(_SNAPSHOT_SOURCE_KEY, None) != _sourceDigest():
+                _SNAPSHOT = {}
+
+            ## json has no tuples
+            if 'MAYA_PLUGIN_PATHS' in _SNAPSHOT:
+                _SNAPSHOT['MAYA_PLUGIN_PATHS'] = [tuple(each) for each in _SNAPSHOT['MAYA_PLUGIN_PATHS']]
+
+    return _SNAPSHOT
+
+
+def resolveAll():
+    """
+    Forces every lazy constant to resolve. Used by tools that want to dump the full config eg tk-envReporter.
+    :return: (dict) of name: value for every lazy constant
+    """
+    return dict((name, _resolve(name)) for name in sorted(_LAZY))
+
+
+def writeSnapshot():
+    """
+    Writes the non user specific lazy constants for the current platform and maya version to disk.
+    Run this once per platform / maya version eg:
+        mayapy -c "import config_constants; config_constants.writeSnapshot()"
+    :return: (str) the path of the written snapshot
+    """
+    global _SNAPSHOT
+    moduleGlobals = globals()
+    ## Build from scratch, never from a previous snapshot
+    for name in _LAZY:
+        if name not in _USER_SPECIFIC:
+            moduleGlobals.pop(name, None)
+
+    _SNAPSHOT = {}
+    try:
+        data = dict((name, _resolve(name)) for name in sorted(_LAZY) if name not in _USER_SPECIFIC)
+    finally:
+        _SNAPSHOT = None
+
+    if not os.path.isdir(SNAPSHOT_ROOT):
+        os.makedirs(SNAPSHOT_ROOT)
+
+    import json
+    data[_SNAPSHOT_SOURCE_KEY] = _sourceDigest()
+    path = snapshotPath()
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=2, sort_keys=True)
+
+    return path
+
+
+@_lazy('USER_NAME')
+def _userName():
+    import getpass
+    return getpass.getuser()
+
+
+@_lazy('MAYA_VERSION')
+def _mayaVersion():
+    return _detectMayaVersion()
+
+
+@_lazy('CACHETAGS')
+def _cacheTags():
+    cacheTags = {}
+    for eachSuffix in SUFFIXES:
+        cacheTags['static{}'.format(eachSuffix)] = STATIC_CACHE
+        cacheTags['anim{}'.format(eachSuffix)] = ANIM_CACHE
+        cacheTags['fx{}'.format(eachSuffix)] = FX_CACHE
+        cacheTags['gpu{}'.format(eachSuffix)] = GPU_CACHE
+    cacheTags[SHOTCAM_SUFFIX] = CAMERA_CACHE
+    return cacheTags
+
+
+if sys.platform == 'win32':
+    @_lazy('ALEMBIC_BATCH_NAME')
+    def _alembicBatchName():
+        return '{}_animCacheExport.bat'.format(_resolve('USER_NAME')) ## TODO get a date time in here
+
+    @_lazy('FX_BATCH_NAME')
+    def _fxBatchName():
+        return '{}_FXCacheExport.bat'.format(_resolve('USER_NAME'))   ## TODO get a date time in here
+
+    @_lazy('PATH_TO_ANIM_BAT')
+    def _pathToAnimBat():
+        return r'{}/{}'.format(TEMP_FOLDER, _resolve('ALEMBIC_BATCH_NAME'))
+
+    @_lazy('PATH_TO_FX_BAT')
+    def _pathToFxBat():
+        return r'{}/{}'.format(TEMP_FOLDER, _resolve('FX_BATCH_NAME'))
+
+
+_LAZY.update({
+    'SHOTGUN_CONFIG_PATH': lambda: os.path.join(SHOTGUN_SOFTWARE_ROOT, SHOTGUN_CONFIG_NAME),
+    'SHOTGUN_CONFIG_ROOT': lambda: os.path.join(SHOTGUN_SOFTWARE_ROOT, SHOTGUN_CONFIG_NAME, 'config'),
+    'SHOTGUN_ICON_PATH': lambda: os.path.join(SHOTGUN_SOFTWARE_ROOT, SHOTGUN_CONFIG_NAME, *('config', 'icons')),
+    'TANKCORE_PYTHON_PATH': lambda: os.path.join(SHOTGUN_SOFTWARE_ROOT, *('studio', 'install', 'core', 'python')),
+    'SGTK_PYTHON_PATH': lambda: os.path.join(SHOTGUN_SOFTWARE_ROOT, 'python-api'),
+    'SHOTGUN_LIBRARY_PATH': lambda: os.path.join(SHOTGUN_SOFTWARE_ROOT, 'defaultShotgunLibrary'),
+    'SHOTGUN_DEVAPPS_PATH': lambda: os.path.join(_resolve('SHOTGUN_CONFIG_PATH'), *('install', 'apps')),
+    'MAYA_APP_DIR': lambda: os.path.join(MAYA_APP_DIR_ROOT, "{}_APPDIR".format(SHOTGUN_CONFIG_NAME)),
+    'MAYA_USER_APP_DIR': lambda: os.path.join(_resolve('MAYA_APP_DIR'), _resolve('USER_NAME')),
+    'MAYA_CONFIG_BASE': lambda: os.path.join(_resolve('MAYA_USER_APP_DIR'), _resolve('MAYA_VERSION')),
+    'MAYA_CONFIG_SCRIPT_PATH': lambda: os.path.join(_resolve('MAYA_CONFIG_BASE'), 'scripts'),
+    'MAYA_CONFIG_PREFS_PATH': lambda: os.path.join(_resolve('MAYA_CONFIG_BASE'), 'prefs'),
+    'MAYA_CONFIG_SHELVES_PATH': lambda: os.path.join(_resolve('MAYA_CONFIG_BASE'), *('prefs', 'shelves')),
+    'MAYA_DEFAULT_ENV': lambda: os.path.join(SHOTGUN_SOFTWARE_ROOT, SHOTGUN_CONFIG_NAME, 'mayaEnv', _resolve('MAYA_VERSION')),
+    'MAYA_DEFAULT_USERSETUPPY': lambda: os.path.join(_resolve('MAYA_DEFAULT_ENV'), 'userSetup.py'),
+    'MAYA_PYTHON_LIB': lambda: os.path.join(SHOTGUN_SOFTWARE_ROOT, 'defaultMayaLibrary'),
+    })
+
+MAYA_SCRIPT_PATHS = []
+MAYA_XBM_PATHS = []
+
+
+#######################
+## BASE SYS PATHS CONSTANTS
+def _uniquePaths(paths):
+    ## Several of the SYS_PATHS are the same folder under different names, eg SHOTGUN_LIBRARY_PATH and
+    ## defaultShotgunLibrary, only keep the first of each so imports don't stat the same share folder twice.
+    seen = set()
+    uniquePaths = []
+    for eachPath in paths:
+        key = os.path.normcase(os.path.normpath(eachPath))
+        if key not in seen:
+            seen.add(key)
+            uniquePaths.append(eachPath)
+    return uniquePaths
+
+
+@_lazy('SYS_PATHS')
+def _sysPaths():
+    return _uniquePaths([
+        os.path.join(_resolve('MAYA_DEFAULT_ENV'), 'site-packages'),
+        os.path.join(SHOTGUN_SOFTWARE_ROOT, 'defaultMayaLibrary'),
+        os.path.join(SHOTGUN_SOFTWARE_ROOT, 'defaultShotgunLibrary'),
+        os.path.join(SHOTGUN_SOFTWARE_ROOT, 'python-api'),
+        os.path.join(SHOTGUN_SOFTWARE_ROOT, 'MSide'),
+        os.path.join(SHOTGUN_SOFTWARE_ROOT, 'Nebula'),
+        os.path.join(SHOTGUN_SOFTWARE_ROOT, 'jbd_om2'),
+        _resolve('SHOTGUN_LIBRARY_PATH'),
+        _resolve('TANKCORE_PYTHON_PATH'),
+        _resolve('SGTK_PYTHON_PATH'),
+        _resolve('MAYA_PYTHON_LIB'),
+        _resolve('SHOTGUN_CONFIG_ROOT'),
+    ])
+
+
+@_lazy('MAYA_PYTHON_PATHS')
+def _mayaPythonPaths():
+    return [os.path.join(SHOTGUN_SOFTWARE_ROOT, "jbd_om2", "OM2plugins")]
+
+
+@_lazy('MAYA_TEMPLATE_PATHS')
+def _mayaTemplatePaths():
+    return ["{}/{}/{}/scripts/AETemplates".format(_resolve('MAYA_APP_DIR'), _resolve('USER_NAME'), _resolve('MAYA_VERSION'))]
+
+
+@_lazy('MAYA_PLUGIN_PATHS')
+def _mayaPluginPaths():
+    cppPluginPath = "E:/3D_Development/cPlusPlus/_plugins/{}/x64/".format(_resolve('MAYA_VERSION'))
+    pyPluginPath = "E:/3D_Development/python/software/jbd_om2/maya_pythonPlugins"
+    return [
+            (cppPluginPath, "jd_mayaMathNodes.mll"),
+            (cppPluginPath, "jd_hermite.mll"),
+            (cppPluginPath, "jd_jaw.mll"),
+            (cppPluginPath, "jd_eyelidNode.mll"),
+            (cppPluginPath, "jd_pushTransform.mll"),
+            (cppPluginPath, "jd_ziptransformarray.mll"),
+            (cppPluginPath, "jd_bezier.mll"),
+            (cppPluginPath, "brSmoothWeights.mll"),
+            (cppPluginPath, "iDeform.mll"),
+            (cppPluginPath, "rampWeights.mll"),
+            (cppPluginPath, "weightDriver.mll"),
+            (cppPluginPath, "TwistSpline.mll"),
+            (cppPluginPath, "grimIK.mll"),
+            (pyPluginPath, "resetSkinCluster.py"),
+            (pyPluginPath, "skinTo.py"),
+            (pyPluginPath, "saveSkinWeights.py"),
+            (pyPluginPath, "loadSkinWeights.py")
+            ]
+
+
+## Module level __getattr__ only exists from python 3.7 (maya 2022+), older interpreters get everything resolved
+## up front exactly like before, see the LAZY CONSTANTS notes.
+if sys.version_info < (3, 7):
+    resolveAll()
+
+## span_trace picks this up to record how long the import took when tracing is on, nothing is imported for it here
+_IMPORT_END = time.time()
+
+
+def benchImport(runs=20, pythonExe=None):
+    """
+    Times importing this module in fresh interpreters, then resolving every lazy constant. Run it with each maya's
+    mayapy, on python < 3.7 the resolving is part of the import.
+    :return: (dict) of 'import' / 'resolveAll': best seconds over the runs
+    """
+    import subprocess
+    script = ('import sys, time\n'
+              'sys.path.insert(0, sys.argv[1])\n'
+              'start = time.time()\n'
+              'import config_constants\n'
+              'imported = time.time()\n'
+              'config_constants.resolveAll()\n'
+              'print("{} {}".format(imported - start, time.time() - imported))\n')
+    best = {}
+    for _ in range(runs):
+        configRoot = os.path.dirname(os.path.abspath(__file__))
+        output = subprocess.check_output([pythonExe or sys.executable, '-c', script, configRoot])
+        importTime, resolveTime = [float(each) for each in output.decode('utf-8').strip().splitlines()[-1].split()]
+        best['import'] = min(best.get('import', importTime), importTime)
+        best['resolveAll'] = min(best.get('resolveAll', resolveTime), resolveTime)
+    return best
+
+
+## Without it a star import only sees what is already a module global, which on python 3.7+ leaves out every lazy
+## constant that hasn't been resolved yet.
+__all__ = sorted(set(name for name in globals() if not name.startswith('_')) | set(_LAZY))
+
+
+if __name__ == '__main__':
+    ## python config_constants.py [/path/to/mayapy]
+    benchResults = benchImport(pythonExe=sys.argv[1] if len(sys.argv) > 1 else None)
+    print('import {:.2f}ms, resolveAll after it {:.2f}ms'.format(benchResults['import'] * 1000,
+                                                                  benchResults['resolveAll'] * 1000))
@@ -0,0 +1,43 @@
+# Copyright (c) 2015 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+"""
+Hook that gets executed every time an engine has been fully initialized.
+
+"""
+
+import os
+import sys
+
+from tank import Hook
+
+CONFIG_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if CONFIG_ROOT not in sys.path:
+    sys.path.append(CONFIG_ROOT)
+
+
+class EngineInit(Hook):
+
+    def execute(self, engine, **kwargs):
+        """
+        Executed when a Toolkit engine has been fully initialized.
+
+        Sets up the MAYA_PLUGIN_PATHS plugins when tk-maya starts, loading only
+        the ones that can't wait for their first use, see plugin_manifest.py.
+        Later engine restarts in the same session leave them alone.
+
+        :param engine: Engine that has been initialized.
+        :type engine: :class:`~sgtk.platform.Engine`
+        """
+        if engine.name != "tk-maya":
+            return
+
+        import plugin_manifest
+        plugin_manifest.startup()
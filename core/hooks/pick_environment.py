@@ -13,43 +13,49 @@ Hook which chooses an environment file to use based on the current context.
 
 """
 
+import os
+import sys
+
 from tank import Hook
+from tank import TankError
+
+CONFIG_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if CONFIG_ROOT not in sys.path:
+    sys.path.append(CONFIG_ROOT)
+
+import config_constants as configCONST
+import env_cache
+import environment_rules
+import span_trace
+
+# the decision table is loaded once per session
+_DECISION_TABLE = {}
+
 
 class PickEnvironment(Hook):
 
+    @span_trace.traced("PickEnvironment.execute", category="core")
     def execute(self, context, **kwargs):
         """
         The default implementation assumes there are three environments, called shot, asset
         and project, and switches to these based on entity type.
+
+        The actual rules live in pick_environment.yml next to this hook, see
+        environment_rules.py, which env_cache.py checks on every compile. When
+        USE_COMPILED_ENVIRONMENTS is on the picked environment is swapped for
+        its pre-resolved copy in env/.compiled when the release compiled one
+        that is still current, see env_cache.py.
         """
-        if context.source_entity:
-            if context.source_entity["type"] == "Version":
-                return "version"
-            elif context.source_entity["type"] == "PublishedFile":
-                return "publishedfile"
-
-        if context.project is None:
-            # Our context is completely empty. We're going into the site context.
-            return "site"
-
-        if context.entity is None:
-            # We have a project but not an entity.
-            return "project"
-
-        if context.entity and context.step is None:
-            # we have an entity but no step!
-            if context.entity["type"] == "Shot":
-                return "shot"
-            if context.entity["type"] == "Asset":
-                return "asset"
-            if context.entity["type"] == "Sequence":
-                return "sequence"
-
-        if context.entity and context.step:
-            # we have a step and an entity
-            if context.entity["type"] == "Shot":
-                return "shot_step"
-            if context.entity["type"] == "Asset":
-                return "asset_step"
-
-        return None
+        table_path = os.path.join(self.disk_location, environment_rules.DECISION_TABLE_NAME)
+        table = _DECISION_TABLE.get(table_path)
+        if table is None:
+            try:
+                table = environment_rules.DecisionTable.from_file(table_path)
+            except environment_rules.EnvironmentRulesError as e:
+                raise TankError(str(e))
+            _DECISION_TABLE[table_path] = table
+
+        environment = table.lookup(environment_rules.DecisionTable.context_key(context))
+        if environment and configCONST.USE_COMPILED_ENVIRONMENTS:
+            environment = env_cache.compiled_environment(environment)
+        return environment
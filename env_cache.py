@@ -0,0 +1,340 @@
+"""
+Compiled environment cache for env/*.yml.
+
+Each environment pulls in frameworks.yml, app_locations.yml and a pile of includes/settings/*.yml files, and all of
+them are parsed and their @references resolved again on every engine start and context switch. This flattens an
+environment and everything it includes into one pre-resolved file:
+    env/.compiled/{environment}.yml
+
+The compiled file has no includes and no @references left. It is keyed by a sha1 of every yml file that contributed
+to it, and a manifest keeps their sizes and mtimes, by path relative to env/ so every platform can check the same
+manifest.
+
+Environments are compiled when the config is released, never by a session: run `python env_cache.py compile` after
+'tank updates' or any edit to env/. Compiling takes a lock file in env/.compiled so two releases can't interleave
+their writes. Before compiling anything it runs environment_rules.check() and refuses to go on if the
+pick_environment decision table no longer matches the old if / else chain or picks an environment with no
+env/{environment}.yml.
+
+The pick_environment core hook asks compiled_environment() for the name to hand toolkit. That checks the manifest
+against the sources once per environment per session and returns '.compiled/{environment}' if it still matches, or
+the source name if the environment hasn't been compiled since the sources changed. 'tank updates' and the other tank
+commands only look at the env/*.yml files themselves, so they keep editing the sources.
+
+Usage:
+    name = compiled_environment('shot_step')
+    python env_cache.py compile [environment ...]    compiles for a release, every environment by default
+    python env_cache.py bench [switches]             engine start and context switch timings, sources vs compiled
+"""
+import errno
+import hashlib
+import json
+import os
+import time
+
+import environment_rules
+
+try:
+    from tank_vendor import yaml
+except ImportError:
+    import yaml
+
+CONFIG_ROOT = os.path.dirname(os.path.abspath(__file__))
+ENV_ROOT = os.path.join(CONFIG_ROOT, 'env')
+COMPILED_FOLDER_NAME = '.compiled'
+MANIFEST_NAME = 'manifest.json'
+LOCK_NAME = '.lock'
+## seconds to wait on another compile, and the age a lock is treated as left behind by a crash
+LOCK_TIMEOUT = 60
+INCLUDES_KEY = 'includes'
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+
+class EnvCacheError(Exception):
+    pass
+
+
+def _load(path):
+    with open(path, 'r') as f:
+        return yaml.safe_load(f) or {}
+
+
+def _include_paths(path, data):
+    paths = []
+    for include in data.get(INCLUDES_KEY) or []:
+        include = os.path.expandvars(include)
+        if not os.path.isabs(include):
+            include = os.path.join(os.path.dirname(path), include)
+        paths.append(os.path.normpath(include))
+    return paths
+
+
+def _resolve_refs(value, lookup, stack=()):
+    """
+    Replaces every "@key" string with the value of key, recursively.
+    :param stack: (tuple) of the keys being resolved, to catch circular references
+    """
+    if isinstance(value, dict):
+        return dict((key, _resolve_refs(each, lookup, stack)) for key, each in value.items())
+    if isinstance(value, list):
+        return [_resolve_refs(each, lookup, stack) for each in value]
+    if isinstance(value, string_types) and value.startswith('@'):
+        key = value[1:]
+        if key not in lookup:
+            raise EnvCacheError('Unresolved reference {}'.format(value))
+        if key in stack:
+            raise EnvCacheError('Circular reference {}'.format(value))
+        return _resolve_refs(lookup[key], lookup, stack + (key,))
+    return value
+
+
+def _gather(path, files, loaded, lookups):
+    """
+    Builds the resolved lookup of everything path includes, includes later in the list winning over earlier ones.
+    Like toolkit, each included file's references resolve against its own includes.
+    :param files: (list) collects every file that contributes
+    :param loaded: (dict) path: data so a file included twice is only parsed once
+    :param lookups: (dict) path: lookup so an include graph shared by several files is only walked once
+    :return: (dict) of key: resolved value
+    """
+    if path in lookups:
+        return lookups[path]
+    if path not in loaded:
+        if not os.path.isfile(path):
+            raise EnvCacheError('Include file {} not found'.format(path))
+        loaded[path] = _load(path)
+        files.append(path)
+
+    lookup = {}
+    for include in _include_paths(path, loaded[path]):
+        include_lookup = _gather(include, files, loaded, lookups)
+        lookup.update(include_lookup)
+        lookup.update((key, _resolve_refs(value, include_lookup)) for key, value in loaded[include].items()
+                      if key != INCLUDES_KEY)
+    lookups[path] = lookup
+    return lookup
+
+
+def compile_environment(env_path):
+    """
+    :param env_path: (str) path to an env/*.yml file
+    :return: (tuple) of (flattened environment data, list of contributing files)
+    """
+    files = []
+    loaded = {}
+    lookup = _gather(env_path, files, loaded, {})
+    data = dict((key, value) for key, value in loaded[env_path].items() if key != INCLUDES_KEY)
+    return _resolve_refs(data, lookup), files
+
+
+def _relative(path, env_root):
+    try:
+        return os.path.relpath(path, env_root).replace(os.sep, '/')
+    except ValueError:
+        ## another drive on windows
+        return path
+
+
+def _stamps(files, env_root):
+    """
+    :return: (dict) of path relative to env_root: [size, mtime]
+    """
+    stamps = {}
+    for path in files:
+        stat = os.stat(path)
+        stamps[_relative(path, env_root)] = [stat.st_size, stat.st_mtime]
+    return stamps
+
+
+def _content_hash(files):
+    digest = hashlib.sha1()
+    for path in sorted(files):
+        digest.update(path.encode('utf-8'))
+        with open(path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+class EnvironmentCache(object):
+    def __init__(self, env_root=ENV_ROOT):
+        self.env_root = env_root
+        self.folder = os.path.join(env_root, COMPILED_FOLDER_NAME)
+        self.manifest_path = os.path.join(self.folder, MANIFEST_NAME)
+        self.manifest = self._read_manifest()
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, 'r') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _write(self, path, write):
+        tmp_path = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmp_path, 'w') as f:
+            write(f)
+        if os.path.isfile(path):
+            os.remove(path)
+        os.rename(tmp_path, path)
+
+    def compiled_path(self, name):
+        return os.path.join(self.folder, '{}.yml'.format(name))
+
+    def is_current(self, name):
+        entry = self.manifest.get(name)
+        if not entry or not os.path.isfile(self.compiled_path(name)):
+            return False
+        files = [os.path.join(self.env_root, *path.split('/')) for path in entry['files']]
+        try:
+            return _stamps(files, self.env_root) == entry['files']
+        except OSError:
+            return False
+
+    def _lock(self):
+        """
+        :return: (str) the lock file, remove it once done
+        """
+        lock_path = os.path.join(self.folder, LOCK_NAME)
+        start = time.time()
+        while True:
+            try:
+                os.close(os.open(lock_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return lock_path
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            try:
+                if time.time() - os.path.getmtime(lock_path) > LOCK_TIMEOUT:
+                    os.remove(lock_path)
+                    continue
+            except OSError:
+                continue
+            if time.time() - start > LOCK_TIMEOUT:
+                raise EnvCacheError('{} is locked by another compile'.format(self.folder))
+            time.sleep(0.5)
+
+    def compile_all(self, names):
+        """
+        Checks the pick_environment decision table, then compiles the environments under the lock, what a release
+        runs.
+        :return: (dict) of name: compiled file
+        """
+        problems = environment_rules.check(env_root=self.env_root)
+        if problems:
+            raise EnvCacheError('The pick_environment decision table needs fixing first:\n    {}'.format(
+                '\n    '.join(problems)))
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder)
+        lock_path = self._lock()
+        try:
+            ## another release may have compiled while this one waited
+            self.manifest = self._read_manifest()
+            return dict((name, self.compile(name)) for name in names)
+        finally:
+            os.remove(lock_path)
+
+    def compile(self, name):
+        """
+        Compiles the environment if any file it is made from has changed. Use compile_all() to hold the lock.
+        :return: (str) the compiled file
+        """
+        if self.is_current(name):
+            return self.compiled_path(name)
+
+        env_path = os.path.join(self.env_root, '{}.yml'.format(name))
+        data, files = compile_environment(env_path)
+        content_hash = _content_hash(files)
+        entry = self.manifest.get(name) or {}
+        compiled_path = self.compiled_path(name)
+
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder)
+        if entry.get('hash') != content_hash or not os.path.isfile(compiled_path):
+            header = '# compiled from {} by env_cache.py, sha1 {}\n'.format(os.path.basename(env_path), content_hash)
+            self._write(compiled_path, lambda f: (f.write(header),
+                                                  yaml.safe_dump(data, f, default_flow_style=False)))
+
+        ## only the mtimes changed (a checkout, a touch) when the hash still matches
+        self.manifest[name] = {'hash': content_hash, 'files': _stamps(files, self.env_root)}
+        self._write(self.manifest_path, lambda f: json.dump(self.manifest, f, indent=2, sort_keys=True))
+        return compiled_path
+
+
+_CACHES = {}
+## (env root, name): the environment name to hand toolkit, checked once per session
+_PICKED = {}
+
+
+def compiled_environment(name, env_root=ENV_ROOT):
+    """
+    :param name: (str) environment name as picked by pick_environment eg shot_step
+    :return: (str) the environment name to hand toolkit, the source name if the compiled one is missing or stale
+    """
+    picked = _PICKED.get((env_root, name))
+    if picked is not None:
+        return picked
+
+    cache = _CACHES.get(env_root)
+    if cache is None:
+        cache = _CACHES[env_root] = EnvironmentCache(env_root)
+    if cache.is_current(name):
+        picked = '{}/{}'.format(COMPILED_FOLDER_NAME, name)
+    else:
+        print('Using the uncompiled {} environment, run env_cache.py compile to update it'.format(name))
+        picked = name
+    _PICKED[(env_root, name)] = picked
+    return picked
+
+
+def all_environments(env_root=ENV_ROOT):
+    return sorted(os.path.splitext(each)[0] for each in os.listdir(env_root) if each.endswith('.yml'))
+
+
+def bench(names=None, switches=1000, env_root=ENV_ROOT):
+    """
+    Engine start: the first pick of an environment in a session and loading it, from the sources vs compiled.
+    Context switch: picking an environment that has already been picked, the checked name is memoised.
+    :return: (dict) of name: {'start_sources', 'start_compiled', 'switch'} seconds, switch is per pick
+    """
+    cache = EnvironmentCache(env_root)
+    names = names or all_environments(env_root)
+    cache.compile_all(names)
+    results = {}
+    for name in names:
+        start = time.time()
+        compile_environment(os.path.join(env_root, '{}.yml'.format(name)))
+        start_sources = time.time() - start
+
+        _CACHES.pop(env_root, None)
+        _PICKED.pop((env_root, name), None)
+        start = time.time()
+        picked = compiled_environment(name, env_root)
+        _load(os.path.join(env_root, '{}.yml'.format(picked)))
+        start_compiled = time.time() - start
+
+        start = time.time()
+        for _ in range(switches):
+            compiled_environment(name, env_root)
+        results[name] = {'start_sources': start_sources, 'start_compiled': start_compiled,
+                         'switch': (time.time() - start) / switches}
+    return results
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) > 1 and sys.argv[1] == 'compile':
+        for compiled_name, compiled in sorted(EnvironmentCache().compile_all(sys.argv[2:] or all_environments()).items()):
+            print('{}: {}'.format(compiled_name, compiled))
+    elif len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        bench_results = bench(switches=int(sys.argv[2]) if len(sys.argv) > 2 else 1000)
+        for bench_name, timings in sorted(bench_results.items()):
+            print('{}: engine start sources {:.3f}s compiled {:.3f}s, context switch {:.1f}us'.format(
+                bench_name, timings['start_sources'], timings['start_compiled'], timings['switch'] * 1000000))
+    else:
+        print('usage: python env_cache.py compile [environment ...] | bench [switches]')
+        sys.exit(1)
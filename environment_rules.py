@@ -0,0 +1,205 @@
+"""
+The pick_environment decision table, and the release check for it.
+
+core/hooks/pick_environment.yml holds the ordered rules the pick_environment core hook picks an environment with,
+see the notes at the top of that file. DecisionTable resolves every distinct (source type, has project, entity type,
+has step) key against the rules once and then serves it from a dict.
+
+check() is run by env_cache.py compile_all(), so every release checks that:
+    - the table picks the same environment as the if / else chain it replaced for every key
+    - every environment it can pick has its env/{environment}.yml
+and refuses to compile if it doesn't.
+
+Usage:
+    table = DecisionTable.from_file(DECISION_TABLE_PATH)
+    environment = table.lookup(DecisionTable.context_key(context))
+
+    problems = check()
+    python environment_rules.py [calls]    runs check() then times picks through the table vs the old chain
+"""
+import itertools
+import os
+import time
+
+try:
+    from tank_vendor import yaml
+except ImportError:
+    import yaml
+
+CONFIG_ROOT = os.path.dirname(os.path.abspath(__file__))
+DECISION_TABLE_NAME = 'pick_environment.yml'
+DECISION_TABLE_PATH = os.path.join(CONFIG_ROOT, 'core', 'hooks', DECISION_TABLE_NAME)
+ENV_ROOT = os.path.join(CONFIG_ROOT, 'env')
+## the context values a rule can match on
+RULE_KEYS = ('source_type', 'has_project', 'entity_type', 'has_step')
+## every value check() tries for each rule key, an entity type no rule names stands in for the rest
+CHECK_VALUES = (
+    (None, 'Version', 'PublishedFile', 'Shot'),
+    (True, False),
+    (None, 'Shot', 'Asset', 'Sequence', 'CustomEntity01'),
+    (True, False),
+)
+
+
+class EnvironmentRulesError(Exception):
+    pass
+
+
+class DecisionTable(object):
+    """
+    Ordered environment rules loaded from yaml.
+    """
+
+    def __init__(self, rules):
+        """
+        :param rules: (list) of rule dicts, see pick_environment.yml
+        """
+        self._rules = []
+        for index, rule in enumerate(rules):
+            unknown = set(rule) - set(RULE_KEYS) - set(['environment'])
+            if unknown or 'environment' not in rule:
+                raise EnvironmentRulesError('Invalid pick environment rule {}: {}'.format(index, rule))
+            conditions = tuple((RULE_KEYS.index(key), rule[key]) for key in RULE_KEYS if key in rule)
+            self._rules.append((conditions, rule['environment']))
+        self._lookup = {}
+
+    @classmethod
+    def from_file(cls, path=DECISION_TABLE_PATH):
+        with open(path, 'r') as f:
+            data = yaml.safe_load(f) or {}
+        return cls(data.get('rules') or [])
+
+    @staticmethod
+    def context_key(context):
+        """
+        :return: (tuple) of (source type, has project, entity type, has step)
+        """
+        source_type = context.source_entity['type'] if context.source_entity else None
+        entity_type = context.entity['type'] if context.entity else None
+        return source_type, context.project is not None, entity_type, context.step is not None
+
+    @property
+    def environments(self):
+        """
+        The set of environment names the rules can return
+        """
+        return set(environment for (_, environment) in self._rules)
+
+    def lookup(self, key):
+        """
+        :param key: (tuple) as returned by context_key
+        :return: (str) the environment name or None if no rule matches
+        """
+        try:
+            return self._lookup[key]
+        except KeyError:
+            pass
+
+        environment = None
+        for conditions, rule_environment in self._rules:
+            if all(key[index] == value for (index, value) in conditions):
+                environment = rule_environment
+                break
+
+        self._lookup[key] = environment
+        return environment
+
+
+def legacy_environment(context):
+    """
+    The if / else chain pick_environment.yml replaced, kept to check the table against.
+    """
+    if context.source_entity:
+        if context.source_entity['type'] == 'Version':
+            return 'version'
+        elif context.source_entity['type'] == 'PublishedFile':
+            return 'publishedfile'
+
+    if context.project is None:
+        return 'site'
+
+    if context.entity is None:
+        return 'project'
+
+    if context.entity and context.step is None:
+        if context.entity['type'] == 'Shot':
+            return 'shot'
+        if context.entity['type'] == 'Asset':
+            return 'asset'
+        if context.entity['type'] == 'Sequence':
+            return 'sequence'
+
+    if context.entity and context.step:
+        if context.entity['type'] == 'Shot':
+            return 'shot_step'
+        if context.entity['type'] == 'Asset':
+            return 'asset_step'
+
+    return None
+
+
+class KeyContext(object):
+    """
+    Just the context attributes the hook reads, made from a context key.
+    """
+
+    def __init__(self, source_type, has_project, entity_type, has_step):
+        self.source_entity = {'type': source_type, 'id': 1} if source_type else None
+        self.project = {'type': 'Project', 'id': 1} if has_project else None
+        self.entity = {'type': entity_type, 'id': 1} if entity_type else None
+        self.step = {'type': 'Step', 'id': 1} if has_step else None
+
+
+def check(table_path=DECISION_TABLE_PATH, env_root=ENV_ROOT):
+    """
+    :return: (list) of problems with the table, empty if it matches the old chain for every key and every
+             environment it picks is in env_root
+    """
+    try:
+        table = DecisionTable.from_file(table_path)
+    except (IOError, OSError, EnvironmentRulesError) as e:
+        return ['Failed to load {}: {}'.format(table_path, e)]
+
+    problems = []
+    for key in itertools.product(*CHECK_VALUES):
+        context = KeyContext(*key)
+        environment = table.lookup(DecisionTable.context_key(context))
+        legacy = legacy_environment(context)
+        if environment != legacy:
+            problems.append('{}: the table picks {}, the old chain {}'.format(key, environment, legacy))
+    for environment in sorted(table.environments):
+        if not os.path.isfile(os.path.join(env_root, '{}.yml'.format(environment))):
+            problems.append('{} is picked by {} but there is no {}.yml in {}'.format(
+                environment, os.path.basename(table_path), environment, env_root))
+    return problems
+
+
+def bench(calls=100000, table_path=DECISION_TABLE_PATH):
+    """
+    :return: (dict) of 'table' / 'legacy': seconds per pick over calls picks cycling through a few typical contexts
+    """
+    table = DecisionTable.from_file(table_path)
+    contexts = [KeyContext(*key) for key in ((None, True, 'Shot', True), (None, True, 'Asset', True),
+                                            (None, True, 'Shot', False), (None, True, None, False),
+                                            ('PublishedFile', True, 'Asset', True))]
+    results = {}
+    for mode, pick in (('table', lambda context: table.lookup(DecisionTable.context_key(context))),
+                       ('legacy', legacy_environment)):
+        start = time.time()
+        for index in range(calls):
+            pick(contexts[index % len(contexts)])
+        results[mode] = (time.time() - start) / calls
+    return results
+
+
+if __name__ == '__main__':
+    import sys
+
+    check_problems = check()
+    for problem in check_problems:
+        print(problem)
+    if check_problems:
+        sys.exit(1)
+    print('{} matches the old if / else chain and every environment it picks exists'.format(DECISION_TABLE_NAME))
+    for bench_mode, seconds in sorted(bench(int(sys.argv[1]) if len(sys.argv) > 1 else 100000).items()):
+        print('{:<6} {:.2f}us per pick'.format(bench_mode, seconds * 1000000))
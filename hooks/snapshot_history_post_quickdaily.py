@@ -17,7 +17,8 @@ class SnapshotHistoryPostQuickdaily(Hook):
         app = self.parent
         # get app
         snapshot_app = app.engine.apps["tk-multi-snapshot"]
-        # try to snapshot the file and add a comment
+        # try to snapshot the file and add a comment. the maya snapshot settings
+        # use the config copy_file hook which deduplicates the snapshot in the background
         try:
             comment = "Automatically snapshotted after Quickdaily. "
             comment += "User Comments: %s " % comments
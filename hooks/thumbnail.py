@@ -9,6 +9,7 @@
 # not expressly granted therein are reserved by Shotgun Software Inc.
 
 import os
+import sys
 import tempfile
 import uuid
 
@@ -16,6 +17,12 @@ import tank
 from tank import Hook
 from tank.platform.qt import QtCore, QtGui
 
+CONFIG_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if CONFIG_ROOT not in sys.path:
+    sys.path.append(CONFIG_ROOT)
+
+import thumbnail_cache
+
 
 class ThumbnailHook(Hook):
     """
@@ -35,6 +42,54 @@ class ThumbnailHook(Hook):
         engine = self.parent.engine
         engine_name = engine.name
 
-        # default implementation does nothing
-        return None
+        if engine_name != "tk-maya":
+            return None
+
+        # use the newest playblast for the context, the review folder the
+        # playblast templates point at is the only folder listed. This runs
+        # on the UI thread so nothing waits for the thumbnail, a playblast
+        # that isn't cached yet gets the screenshot this time and the cached
+        # thumbnail from the next call
+        source = thumbnail_cache.newest_file(self._get_playblast_paths())
+        if source:
+            return thumbnail_cache.get_cache().request(source)
+
+        # no playblast, the maya project folders are walked in the background
+        # for renders and the newest source the last walk found is used
+        return thumbnail_cache.get_cache().request_newest(self._get_maya_source_folders())
+
+    def _get_playblast_paths(self):
+        """
+        :returns: The playblasts on disk for the current context from the
+            playblast templates
+        """
+        tk = self.parent.sgtk
+        context = self.parent.context
+        if context.entity is None:
+            return []
+
+        prefix = "maya_shot" if context.entity["type"] == "Shot" else "maya_asset"
+        paths = []
+        for template_name in ("%swork_playblast" % prefix, "%s_playblast" % prefix):
+            template = tk.templates.get(template_name)
+            if template is None:
+                continue
+            try:
+                fields = context.as_template_fields(template)
+            except tank.TankError:
+                continue
+            paths.extend(tk.paths_from_template(template, fields, skip_keys=["name", "version"]))
+        return paths
+
+    def _get_maya_source_folders(self):
+        """
+        :returns: The maya project movies and images folders
+        """
+        import maya.cmds as cmds
 
+        project_root = cmds.workspace(q=True, rootDirectory=True)
+        folders = []
+        for rule, default in (("movie", "movies"), ("images", "images")):
+            folder = cmds.workspace(fileRuleEntry=rule) or default
+            folders.append(os.path.join(project_root, folder))
+        return folders
@@ -8,7 +8,7 @@
 # agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
 # not expressly granted therein are reserved by Shotgun Software Inc.
 
-import os, sys, shutil, tank
+import os, sys, shutil, json, hashlib, tank
 ##################################################################
 ## EDIT BELOW TO MATCH YOUR SHOTGUN VOLUME SETUP
 ##################################################################
@@ -33,13 +33,135 @@ if CONFIG_ROOT not in sys.path:
 
 ## Now import the base configs configCONST file
 import config_constants as configCONST
+import async_log
+import span_trace
 sys.path.append(configCONST.TANKCORE_PYTHON_PATH)
 print("configCONST LOADED!")
 
 
+## Name of the manifest written into each users MAYA_USER_APP_DIR recording what the launcher already set up.
+WORKSPACE_MANIFEST_NAME = '.workspace_manifest.json'
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def _readManifest(path):
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (IOError, OSError, ValueError):
+        return {}
+
+
+def _writeManifest(path, manifest):
+    tmpPath = '{}.tmp'.format(path)
+    try:
+        with open(tmpPath, 'w') as f:
+            json.dump(manifest, f, indent=2, sort_keys=True)
+        if os.path.isfile(path):
+            os.remove(path)
+        os.rename(tmpPath, path)
+    except (IOError, OSError) as e:
+        ## Not fatal, we'll just do the full check again next launch
+        print("Failed to write workspace manifest {}: {}".format(path, e))
+
+
+def _fileHash(path):
+    md5 = hashlib.md5()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            md5.update(chunk)
+    return md5.hexdigest()
+
+
+def _installedStamp(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return [stat.st_size, stat.st_mtime]
+
+
+def setupUserAppDir():
+    """
+    Makes sure the users MAYA_APP_DIR folders exist and their userSetup.py is current.
+
+    The state of the last setup is kept in a manifest inside MAYA_USER_APP_DIR so a normal launch costs one manifest
+    read, a stat of the source userSetup.py on the share and a few local stats instead of a makedirs per folder and a
+    copy every launch. The manifest is only trusted as far as the local disk agrees with it: a listed folder that has
+    gone is made again, and the installed userSetup.py is copied again if it is missing or its size / mtime aren't the
+    ones recorded when it was copied, eg someone edited or deleted it. Otherwise it is only copied when the source's
+    size / mtime changed and the content hash differs from what was installed.
+    :return: (dict) the manifest as written
+    """
+    manifestPath = os.path.join(configCONST.MAYA_USER_APP_DIR, WORKSPACE_MANIFEST_NAME)
+    manifest = _readManifest(manifestPath)
+    dirty = False
+
+    ## The deepest folders are enough, makedirs builds MAYA_APP_DIR, MAYA_USER_APP_DIR and MAYA_CONFIG_BASE on the way
+    leafPaths = [configCONST.MAYA_CONFIG_SCRIPT_PATH,
+                 configCONST.MAYA_CONFIG_SHELVES_PATH]
+    knownFolders = set(manifest.get('folders', []))
+    missing = [eachPath for eachPath in leafPaths if eachPath not in knownFolders or not os.path.isdir(eachPath)]
+    for eachPath in missing:
+        if not os.path.isdir(eachPath):
+            os.makedirs(eachPath)
+    if missing:
+        manifest['folders'] = sorted(knownFolders.union(leafPaths))
+        dirty = True
+
+    ## Copy userSetup.py on first install, or if the force reinstall is true in the base configCONST file when the
+    ## source has changed since we last copied it.
+    ## Keyed on the destination so switching between maya versions doesn't trigger a copy every launch.
+    source = configCONST.MAYA_DEFAULT_USERSETUPPY
+    destination = os.path.join(configCONST.MAYA_CONFIG_SCRIPT_PATH, os.path.basename(source))
+    userSetups = manifest.setdefault('userSetup', {})
+    installed = userSetups.get(configCONST.MAYA_CONFIG_SCRIPT_PATH)
+    if installed is not None and _installedStamp(destination) != installed.get('installed'):
+        print("Installed userSetup.py changed on disk: {}".format(destination))
+        installed = None
+    if installed is None or configCONST.FORCE_USERSETUP_REINSTALL:
+        sourceStat = os.stat(source)
+        stamp = {'source': source, 'size': sourceStat.st_size, 'mtime': sourceStat.st_mtime}
+        if installed is None or any(installed.get(key) != value for key, value in stamp.items()):
+            stamp['md5'] = _fileHash(source)
+            if installed is None or installed.get('md5') != stamp['md5']:
+                print("Copying userSetup.py from: {}".format(source))
+                shutil.copy(source, configCONST.MAYA_CONFIG_SCRIPT_PATH)
+            stamp['installed'] = _installedStamp(destination)
+            userSetups[configCONST.MAYA_CONFIG_SCRIPT_PATH] = stamp
+            dirty = True
+
+    if dirty:
+        _writeManifest(manifestPath, manifest)
+
+    return manifest
+
+
+def setupStartupBundle(appPath):
+    """
+    Brings the local startup bundle up to date and puts it at the front of the PYTHONPATH maya starts with.
+    The bytecode is compiled with the mayapy next to the maya being launched.
+    :param appPath: (str) path to the maya executable
+    """
+    import startup_bundle
+    mayapy = os.path.join(os.path.dirname(appPath), 'mayapy.exe' if sys.platform == 'win32' else 'mayapy')
+    if not os.path.isfile(mayapy):
+        print('No mayapy found next to {}, skipping the startup bundle'.format(appPath))
+        return
+
+    bundle = startup_bundle.StartupBundle(python_exe=mayapy, use_zip=configCONST.STARTUP_BUNDLE_ZIP)
+    for source, result in bundle.build().items():
+        if configCONST.DEBUGGING:
+            print('Startup bundle {}: {}'.format(source, result))
+
+    pythonPaths = bundle.paths() + [each for each in os.environ.get('PYTHONPATH', '').split(os.pathsep) if each]
+    os.environ['PYTHONPATH'] = os.pathsep.join(startup_bundle.unique_paths(pythonPaths))
+
+
 class BeforeAppLaunch(tank.Hook):
     """Hook to set up the system prior to app launch."""
 
+    @span_trace.traced('BeforeAppLaunch.execute', category='launch', flush_after=True)
     def execute(self, app_path, app_args, version, engine_name, software_entity=None, **kwargs):
         """
         The execute function of the hook will be called prior to starting the required application
@@ -53,40 +175,22 @@ class BeforeAppLaunch(tank.Hook):
         :param software_entity: (dict) If set, this is the Software entity that is
             associated with this launch command.
         """
-        ## Remove the log for the debug module if it exists.
-        pathToLog = os.path.join(configCONST.TEMP_FOLDER, configCONST.LOGFILE_NAME)
-        if os.path.isfile(pathToLog):
-            os.remove(pathToLog)
-
-        ## Setup the MAYA_APP_DIR folder if it isn't there.
-        if not os.path.isdir(configCONST.MAYA_APP_DIR):
-            os.mkdir(configCONST.MAYA_APP_DIR)
-
-        ## Make the user config maya folders if they don't exist in the config based maya directories
-        basepaths = [configCONST.MAYA_CONFIG_SCRIPT_PATH,
-                     configCONST.MAYA_CONFIG_PREFS_PATH,
-                     configCONST.MAYA_CONFIG_SHELVES_PATH,
-                     configCONST.MAYA_CONFIG_BASE]
-
-        if not os.path.isdir(configCONST.MAYA_USER_APP_DIR):
-            os.makedirs(configCONST.MAYA_USER_APP_DIR)
-            ## Hard making some of the maya folders so we can set the userSetup.py pre load
-            for eachPath in basepaths:
-                if not os.path.isdir(eachPath):
-                    os.makedirs(eachPath)
-
-            ## Copy userSetup.py
-            print("Copying userSetup.py from: {}".format(configCONST.MAYA_DEFAULT_USERSETUPPY))
-            shutil.copy(configCONST.MAYA_DEFAULT_USERSETUPPY, configCONST.MAYA_CONFIG_SCRIPT_PATH)
-        else:
-            ## Check the sub dirs if they exist or not
-            for eachPath in basepaths:
-                if not os.path.isdir(eachPath):
-                    os.makedirs(eachPath)
-
-            ## Copy userSetup.py and bulldog shelf if the force reinstall is true in the base configCONST file
-            if configCONST.FORCE_USERSETUP_REINSTALL:
-                shutil.copy(configCONST.MAYA_DEFAULT_USERSETUPPY, configCONST.MAYA_CONFIG_SCRIPT_PATH)
+        ## Roll the log for the debug module over once it gets too big instead of deleting it, so the last session's
+        ## crash context is still there. With DEBUGGING the launch itself is logged to it through the background writer.
+        async_log.rotate_log()
+        if configCONST.DEBUGGING:
+            async_log.install()
+
+        ## Make the user config maya folders and install the userSetup.py, only touching the network share for
+        ## what has actually changed since the last launch.
+        with span_trace.span('setupUserAppDir', category='launch'):
+            setupUserAppDir()
+
+        ## Mirror the SYS_PATHS onto local disk so maya doesn't import from the share.
+        if configCONST.USE_STARTUP_BUNDLE and engine_name == 'tk-maya':
+            with span_trace.span('setupStartupBundle', category='launch'):
+                setupStartupBundle(app_path)
+
         ##############################################################################
         ## MAYA APP DIR
         ##############################################################################
@@ -99,3 +203,77 @@ class BeforeAppLaunch(tank.Hook):
         for eachSysPath in sys_paths:
             if eachSysPath not in sys.path:
                 sys.path.append(eachSysPath)
+
+
+def _setupUserAppDirUncached():
+    ## What every launch did before the manifest, kept for benchUserAppDir to compare against
+    if not os.path.isdir(configCONST.MAYA_APP_DIR):
+        os.mkdir(configCONST.MAYA_APP_DIR)
+    for eachPath in [configCONST.MAYA_USER_APP_DIR, configCONST.MAYA_CONFIG_SCRIPT_PATH,
+                     configCONST.MAYA_CONFIG_PREFS_PATH, configCONST.MAYA_CONFIG_SHELVES_PATH,
+                     configCONST.MAYA_CONFIG_BASE]:
+        if not os.path.isdir(eachPath):
+            os.makedirs(eachPath)
+    if configCONST.FORCE_USERSETUP_REINSTALL:
+        shutil.copy(configCONST.MAYA_DEFAULT_USERSETUPPY, configCONST.MAYA_CONFIG_SCRIPT_PATH)
+
+
+def benchUserAppDir(launches=20, latency=0.005):
+    """
+    Times warm launches of setupUserAppDir against the old isdir / makedirs and copy every launch, with a fake
+    MAYA_APP_DIR and userSetup.py where every stat and copy takes latency seconds like they do on the share.
+    :return: (dict) of 'uncached' / 'manifest': seconds per launch
+    """
+    import tempfile
+    import time
+
+    root = tempfile.mkdtemp(prefix='userAppDirBench_')
+    overrides = {
+        'MAYA_APP_DIR': os.path.join(root, 'appdir'),
+        'MAYA_USER_APP_DIR': os.path.join(root, 'appdir', 'user'),
+        'MAYA_CONFIG_BASE': os.path.join(root, 'appdir', 'user', '2020'),
+        'MAYA_CONFIG_SCRIPT_PATH': os.path.join(root, 'appdir', 'user', '2020', 'scripts'),
+        'MAYA_CONFIG_PREFS_PATH': os.path.join(root, 'appdir', 'user', '2020', 'prefs'),
+        'MAYA_CONFIG_SHELVES_PATH': os.path.join(root, 'appdir', 'user', '2020', 'prefs', 'shelves'),
+        'MAYA_DEFAULT_USERSETUPPY': os.path.join(root, 'mayaEnv', 'userSetup.py'),
+    }
+    previous = dict((name, getattr(configCONST, name)) for name in overrides)
+    os.makedirs(os.path.dirname(overrides['MAYA_DEFAULT_USERSETUPPY']))
+    with open(overrides['MAYA_DEFAULT_USERSETUPPY'], 'w') as f:
+        f.write('import maya.cmds as cmds\n' * 200)
+
+    realStat, realCopy = os.stat, shutil.copy
+
+    def _slowStat(path, *args, **kwargs):
+        if str(path).startswith(root):
+            time.sleep(latency)
+        return realStat(path, *args, **kwargs)
+
+    def _slowCopy(source, destination):
+        time.sleep(latency * 2)
+        return realCopy(source, destination)
+
+    results = {}
+    try:
+        for name, value in overrides.items():
+            setattr(configCONST, name, value)
+        os.stat, shutil.copy = _slowStat, _slowCopy
+        for mode, setup in (('uncached', _setupUserAppDirUncached), ('manifest', setupUserAppDir)):
+            setup()
+            start = time.time()
+            for _ in range(launches):
+                setup()
+            results[mode] = (time.time() - start) / launches
+    finally:
+        os.stat, shutil.copy = realStat, realCopy
+        for name, value in previous.items():
+            setattr(configCONST, name, value)
+        shutil.rmtree(root)
+    return results
+
+
+if __name__ == '__main__':
+    ## Needs tk-core importable, eg PYTHONPATH=<TANKCORE_PYTHON_PATH> python before_app_launch.py [latency]
+    benchLatency = float(sys.argv[1]) if len(sys.argv) > 1 else 0.005
+    for benchMode, seconds in sorted(benchUserAppDir(latency=benchLatency).items()):
+        print('{:<9} {:.1f}ms per launch'.format(benchMode, seconds * 1000))
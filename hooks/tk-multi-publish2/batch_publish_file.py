@@ -0,0 +1,203 @@
+# Copyright (c) 2017 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import sys
+import sgtk
+
+CONFIG_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if CONFIG_ROOT not in sys.path:
+    sys.path.append(CONFIG_ROOT)
+
+import cache_manifest
+import publish_batch
+import version_allocator
+
+HookBaseClass = sgtk.get_hook_baseclass()
+
+
+class BatchPublishFilePlugin(HookBaseClass):
+    """
+    Layered on the app's publish_file.py, queues each item's PublishedFile with
+    the publish run's PublishBatch instead of registering it on its own. The
+    app's publish() runs as it is, only its sgtk.util.register_publish call is
+    swapped for queueing. Everything queued is registered in chunked batch
+    calls when the first item finalizes, or earlier if something needs a
+    publish's id before then eg a child item linking to its parent.
+
+    Until then the item's sg_publish_data is a publish_batch.PendingPublish.
+    Another plugin on the same item, eg Upload for review, reads it during
+    the publish phase and hands it straight to Shotgun, so an item with one
+    is registered right away instead, and finalize swaps the pending publish
+    for the created PublishedFile dict.
+
+    With Allocate Version on, the publish version comes from
+    version_allocator.py instead of being taken as the work file's version
+    regardless of what's already published: the work file's version is used
+    while it's free, otherwise the next free one is reserved.
+    """
+
+    @property
+    def settings(self):
+        """
+        Dictionary defining the settings that this plugin expects to receive
+        through the settings parameter in the accept, validate, publish and
+        finalize methods.
+        """
+
+        base_settings = super(BatchPublishFilePlugin, self).settings or {}
+        base_settings["Allocate Version"] = {
+            "type": "bool",
+            "default": False,
+            "description": "Reserve the publish version with the config's "
+                           "version allocator so concurrent or earlier "
+                           "publishes to the Publish Template are never "
+                           "overwritten.",
+        }
+        return base_settings
+
+    def validate(self, settings, item):
+        """
+        Reserves the publish version before the usual validation, the plugin
+        layered on top has already worked out the publish path by now.
+
+        :param settings: Dictionary of Settings. The keys are strings, matching
+            the keys returned in the settings property. The values are `Setting`
+            instances.
+        :param item: Item to process
+        :returns: True if item is valid, False otherwise.
+        """
+
+        if settings["Allocate Version"].value:
+            self._allocate_version(settings, item)
+        return super(BatchPublishFilePlugin, self).validate(settings, item)
+
+    def publish(self, settings, item):
+        """
+        Executes the publish logic for the given item and settings, queueing
+        the registration.
+
+        :param settings: Dictionary of Settings. The keys are strings, matching
+            the keys returned in the settings property. The values are `Setting`
+            instances.
+        :param item: Item to process
+        """
+
+        # publishing the item again, eg after a failed run, replaces what it
+        # queued last time
+        reservation = item.get_property("version_reservation")
+        try:
+            with publish_batch.queued_registration(publish_batch.get_batch(), item_key=id(item)):
+                super(BatchPublishFilePlugin, self).publish(settings, item)
+        except Exception:
+            if reservation:
+                reservation.release()
+            raise
+        if reservation:
+            reservation.commit()
+
+        if self._read_during_publish(item):
+            self._resolve_publish_data(item)
+
+    def finalize(self, settings, item):
+        """
+        Registers everything still queued before the usual finalize, then
+        adds cache publishes to their shot's cache manifest.
+
+        :param settings: Dictionary of Settings. The keys are strings, matching
+            the keys returned in the settings property. The values are `Setting`
+            instances.
+        :param item: Item to process
+        """
+
+        batch = publish_batch.get_batch()
+        if len(batch):
+            self.logger.info("Registering %s queued publishes..." % len(batch))
+        publish_batch.reset_batch()
+        for entity_id, thumbnail_path, error in batch.thumbnail_failures:
+            self.logger.warning(
+                "Failed to upload thumbnail %s for PublishedFile %s: %s" % (thumbnail_path, entity_id, error))
+        del batch.thumbnail_failures[:]
+        self._resolve_publish_data(item)
+
+        super(BatchPublishFilePlugin, self).finalize(settings, item)
+
+        if item.get_property("sg_publish_data") and \
+                self.get_publish_type(settings, item) in cache_manifest.PUBLISH_TYPES:
+            # a no-op for anything outside the shot publish/{cache type} folders
+            cache_manifest.record_publish(self.get_publish_path(settings, item))
+
+    def _read_during_publish(self, item):
+        """
+        True if a plugin that doesn't queue with the batch will publish this
+        item too, it may read the publish data before finalize.
+        """
+
+        tasks = getattr(item, "tasks", None)
+        if tasks is None:
+            # no way to tell, don't hand anyone a queued publish
+            return True
+        for task in tasks:
+            if task.active and "batch_publish_file" not in (getattr(task.plugin, "path", None) or ""):
+                return True
+        return False
+
+    def _resolve_publish_data(self, item):
+        """
+        Swaps the item's PendingPublish for the PublishedFile it created,
+        submitting the batch first if it hasn't been.
+        """
+
+        publish_data = item.properties.get("sg_publish_data")
+        if isinstance(publish_data, publish_batch.PendingPublish):
+            item.properties["sg_publish_data"] = publish_data.data
+
+    def _allocate_version(self, settings, item):
+        """
+        Swaps the publish path and version set on the item for a reserved
+        version of the Publish Template, keeping the one reserved by an
+        earlier validation of the same publish while it still fits.
+        """
+
+        if "Publish Template" not in settings:
+            return
+        publish_path = item.get_property("publish_path")
+        template = self.parent.engine.get_template_by_name(
+            settings["Publish Template"].value)
+        if not publish_path or not template or "version" not in template.keys:
+            return
+        fields = template.get_fields(publish_path)
+        minimum = fields.get("version") or 1
+
+        # the plugins layered on top set the path on the local properties
+        # where publish2 has them, the reservation goes with it
+        properties = item.properties
+        if hasattr(item, "local_properties") and item.local_properties.get("publish_path"):
+            properties = item.local_properties
+
+        reservation = properties.get("version_reservation")
+        folder, pattern = version_allocator.split_template_path(template, fields)
+        if reservation and (reservation.allocator.folder, reservation.allocator.pattern) == (folder, pattern) \
+                and reservation.version >= minimum and os.path.exists(reservation.marker):
+            version = reservation.version
+        else:
+            if reservation:
+                reservation.release()
+            reservation = version_allocator.allocate_for_template(template, fields, minimum)
+            version = reservation.version
+            if version != minimum:
+                self.logger.info(
+                    "Version %s is already published, publishing as version %s." % (minimum, version))
+
+        fields["version"] = version
+        properties["version_reservation"] = reservation
+        properties["path"] = template.apply_fields(fields)
+        properties["publish_path"] = properties["path"]
+        properties["publish_version"] = version
@@ -8,14 +8,336 @@
 # agreement to the Shotgun Pipeline Toolkit Source Code License. All rights 
 # not expressly granted therein are reserved by Shotgun Software Inc.
 
+import fnmatch
 import glob
 import os
+import stat
+import sys
+import threading
+from multiprocessing.pool import ThreadPool
+import maya.api.OpenMaya as om2
 import maya.cmds as cmds
 import maya.mel as mel
 import sgtk
 
+CONFIG_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))))
+if CONFIG_ROOT not in sys.path:
+    sys.path.append(CONFIG_ROOT)
+
+import publish_batch
+import scene_watch
+import span_trace
+
 HookBaseClass = sgtk.get_hook_baseclass()
 
+# os.scandir on python 3, the scandir backport if it's installed on python 2
+try:
+    from os import scandir as _scandir
+except ImportError:
+    try:
+        from scandir import scandir as _scandir
+    except ImportError:
+        _scandir = None
+
+# max number of render layer folders scanned at once
+RENDER_SCAN_WORKERS = 8
+
+# frame glob -> (directory mtime, first matching path or None). lives for the
+# whole session so reopening the publisher only costs a stat per layer
+_FIRST_FRAME_CACHE = {}
+_FIRST_FRAME_CACHE_LOCK = threading.Lock()
+
+
+def _iter_dir_names(dir_path):
+    """
+    Yields the entry names of a directory, streaming them where the platform
+    allows it so a scan can stop early.
+    """
+    if _scandir is not None:
+        iterator = _scandir(dir_path)
+        try:
+            for entry in iterator:
+                yield entry.name
+        finally:
+            # only python 3.6+ iterators can be closed early
+            if hasattr(iterator, "close"):
+                iterator.close()
+    else:
+        for name in os.listdir(dir_path):
+            yield name
+
+
+def find_first_frame(frame_glob):
+    """
+    Returns the first file on disk matching the frame glob, or None.
+
+    Unlike glob.glob this stops at the first hit instead of expanding the whole
+    frame range, and the result is cached against the mtime of the folder so
+    unchanged render folders are never listed twice.
+
+    :param str frame_glob: Path with the frame number replaced by a '*'
+    :returns: The first matching path or None
+    """
+    dir_path, pattern = os.path.split(frame_glob)
+
+    # wildcards in the folder part, nothing clever to do here
+    if glob.has_magic(dir_path):
+        return next(glob.iglob(frame_glob), None)
+
+    try:
+        dir_mtime = os.stat(dir_path).st_mtime
+    except OSError:
+        # nothing rendered yet
+        return None
+
+    with _FIRST_FRAME_CACHE_LOCK:
+        cached = _FIRST_FRAME_CACHE.get(frame_glob)
+    if cached and cached[0] == dir_mtime:
+        return cached[1]
+
+    first_path = None
+    try:
+        for name in _iter_dir_names(dir_path):
+            # match glob and skip hidden files unless explicitly asked for
+            if name.startswith(".") and not pattern.startswith("."):
+                continue
+            if fnmatch.fnmatch(name, pattern):
+                first_path = os.path.join(dir_path, name)
+                break
+    except OSError:
+        return None
+
+    with _FIRST_FRAME_CACHE_LOCK:
+        _FIRST_FRAME_CACHE[frame_glob] = (dir_mtime, first_path)
+
+    return first_path
+
+
+# scene_has_geometry's answer as (scene_watch change count, answer)
+_SCENE_STATE = {
+    "has_geometry": None,
+}
+
+
+def _iter_geometry_paths():
+    """
+    Yields the dag paths of all non intermediate geometry shapes, the same
+    shapes cmds.ls(geometry=True, noIntermediate=True) returns, one at a time.
+    """
+    dag_it = om2.MItDag(om2.MItDag.kDepthFirst, om2.MFn.kGeometric)
+    while not dag_it.isDone():
+        dag_path = dag_it.getPath()
+        if not om2.MFnDagNode(dag_path).isIntermediateObject:
+            yield dag_path
+        dag_it.next()
+
+
+def scene_has_geometry():
+    """
+    Returns True if the scene has any non intermediate geometry.
+
+    Stops at the first shape found instead of listing every shape in the scene
+    and the answer is memoised until dag nodes are added or removed, or the
+    intermediateObject flag of a shape the answer depends on is toggled.
+    """
+    scene_watch.install()
+
+    change_count = scene_watch.change_count()
+    cached = _SCENE_STATE["has_geometry"]
+    if cached is not None and cached[0] == change_count:
+        return cached[1]
+
+    first_path = next(_iter_geometry_paths(), None)
+    if first_path is not None:
+        # only that shape turning intermediate can make the answer False
+        watched = [first_path.node()]
+    else:
+        # every shape left is intermediate, any of them can make it True
+        watched = []
+        dag_it = om2.MItDag(om2.MItDag.kDepthFirst, om2.MFn.kGeometric)
+        while not dag_it.isDone():
+            watched.append(dag_it.currentItem())
+            dag_it.next()
+    scene_watch.watch_nodes(watched, ["intermediateObject"])
+
+    has_geometry = first_path is not None
+    _SCENE_STATE["has_geometry"] = (change_count, has_geometry)
+
+    return has_geometry
+
+
+class SessionGeometryStats(object):
+    """
+    Stats about the session geometry, only computed the first time one of
+    them is asked for so validators can share them instead of each querying
+    the scene again. Instanced shapes are counted once per instance.
+    """
+
+    def __init__(self):
+        self._stats = None
+
+    def refresh(self):
+        """
+        Drops the computed stats so they get recomputed on next access.
+        """
+        self._stats = None
+
+    def _get(self, name):
+        if self._stats is None:
+            shape_count = 0
+            poly_count = 0
+            bbox = om2.MBoundingBox()
+            for dag_path in _iter_geometry_paths():
+                shape_count += 1
+                if dag_path.hasFn(om2.MFn.kMesh):
+                    poly_count += om2.MFnMesh(dag_path).numPolygons
+
+                shape_bbox = om2.MFnDagNode(dag_path).boundingBox
+                shape_bbox.transformUsing(dag_path.inclusiveMatrix())
+                bbox.expand(shape_bbox)
+
+            world_bbox = None
+            if shape_count:
+                world_bbox = (
+                    bbox.min.x, bbox.min.y, bbox.min.z,
+                    bbox.max.x, bbox.max.y, bbox.max.z
+                )
+
+            self._stats = {
+                "shape_count": shape_count,
+                "poly_count": poly_count,
+                "bbox": world_bbox,
+            }
+
+        return self._stats[name]
+
+    @property
+    def shape_count(self):
+        """
+        Number of non intermediate geometry shapes
+        """
+        return self._get("shape_count")
+
+    @property
+    def poly_count(self):
+        """
+        Total number of mesh faces
+        """
+        return self._get("poly_count")
+
+    @property
+    def bbox(self):
+        """
+        World space bounding box of all the geometry as
+        (xmin, ymin, zmin, xmax, ymax, zmax), or None if there is none
+        """
+        return self._get("bbox")
+
+
+def _iter_dir_files(dir_path, wanted=None):
+    """
+    Yields (name, path, mtime) for the files in a directory using a single
+    listing. Only the names wanted passes are stat'd. scandir hands back the
+    stat for free on windows, without it each wanted name costs one stat.
+
+    :param wanted: Callable taking a file name, None for every file
+    """
+    if _scandir is not None:
+        for entry in _scandir(dir_path):
+            if (wanted is None or wanted(entry.name)) and entry.is_file():
+                yield entry.name, entry.path, entry.stat().st_mtime
+    else:
+        for name in os.listdir(dir_path):
+            if wanted is not None and not wanted(name):
+                continue
+            path = os.path.join(dir_path, name)
+            try:
+                file_stat = os.stat(path)
+            except OSError:
+                continue
+            if stat.S_ISREG(file_stat.st_mode):
+                yield name, path, file_stat.st_mtime
+
+
+class ProjectRootScanner(object):
+    """
+    Lists the publishable folders of a maya project root in one pass.
+
+    Each folder is listed once and every file is classified by its extension
+    through a lookup table, so the collect_* methods only get handed the files
+    they care about. The scan can run in a background thread while the rest
+    of the session is being collected.
+    """
+
+    def __init__(self, folders, extension_table, get_item_type, file_limit=0):
+        """
+        :param dict folders: Folder path -> item type wanted from that folder
+        :param dict extension_table: Lower case extension -> item type
+        :param get_item_type: Callable taking a file name and returning its
+            item type, used for extensions missing from the table
+        :param int file_limit: Max files kept per folder, 0 for no limit
+        """
+        self._folders = folders
+        self._extension_table = dict(extension_table)
+        self._get_item_type = get_item_type
+        self._file_limit = file_limit
+        self._results = None
+        self._error = None
+        self._thread = None
+
+    def start(self):
+        """
+        Starts scanning in a background thread.
+        """
+        self._thread = threading.Thread(target=self._scan)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def files(self, folder):
+        """
+        Returns the paths of the wanted files in the folder, newest first.
+        Waits for the background scan if one is running.
+
+        :param str folder: One of the folders given to the scanner
+        :returns: list of file paths
+        """
+        if self._thread is not None:
+            self._thread.join()
+        elif self._results is None:
+            self._scan()
+
+        if self._error is not None:
+            raise self._error
+
+        return self._results.get(folder, [])
+
+    def _item_type(self, filename):
+        extension = os.path.splitext(filename)[1].lstrip(".").lower()
+        if extension not in self._extension_table:
+            self._extension_table[extension] = self._get_item_type(filename)
+        return self._extension_table[extension]
+
+    def _scan(self):
+        results = {}
+        try:
+            for folder, item_type in self._folders.items():
+                if not os.path.isdir(folder):
+                    continue
+
+                found = [
+                    (mtime, path)
+                    for (name, path, mtime) in _iter_dir_files(
+                        folder, lambda name: self._item_type(name) == item_type)
+                ]
+                found.sort(reverse=True)
+                if self._file_limit:
+                    found = found[:self._file_limit]
+                results[folder] = [path for (_, path) in found]
+        except Exception as e:
+            self._error = e
+        self._results = results
+
 
 class MayaSessionCollector(HookBaseClass):
     """
@@ -57,6 +379,13 @@ class MayaSessionCollector(HookBaseClass):
                                "to publish plugins via the collected item's "
                                "properties. ",
             },
+            "Project Scan File Limit": {
+                "type": "int",
+                "default": 0,
+                "description": "Max number of playblasts and alembic caches "
+                               "collected from each Maya project folder, "
+                               "newest first. 0 collects everything.",
+            },
         }
 
         # update the base settings with these settings
@@ -64,6 +393,7 @@ class MayaSessionCollector(HookBaseClass):
 
         return collector_settings
 
+    @span_trace.traced("MayaSessionCollector.process_current_session", category="publish", flush_after=True)
     def process_current_session(self, settings, parent_item):
         """
         Analyzes the current session open in Maya and parents a subtree of
@@ -74,9 +404,22 @@ class MayaSessionCollector(HookBaseClass):
 
         """
 
+        # a new publish run, drop anything an earlier run left queued when one
+        # of its tasks failed before finalize
+        dropped = publish_batch.discard_batch()
+        if dropped:
+            self.logger.debug("Dropped %s publishes queued by the last run." % dropped)
+
+        # start listing the project folders in the background while the rest
+        # of the session is collected
+        project_scan = None
+        project_root = cmds.workspace(q=True, rootDirectory=True)
+        if project_root:
+            project_scan = self._get_project_scanner(
+                settings, project_root).start()
+
         # create an item representing the current maya session
         item = self.collect_current_maya_session(settings, parent_item)
-        project_root = item.properties["project_root"]
 
         # look at the render layers to find rendered images on disk
         self.collect_rendered_images(item)
@@ -95,8 +438,8 @@ class MayaSessionCollector(HookBaseClass):
                 }
             )
 
-            self.collect_playblasts(item, project_root)
-            self.collect_alembic_caches(item, project_root)
+            self.collect_playblasts(item, project_root, project_scan)
+            self.collect_alembic_caches(item, project_root, project_scan)
         else:
 
             self.logger.info(
@@ -110,9 +453,10 @@ class MayaSessionCollector(HookBaseClass):
                 }
             )
 
-        if cmds.ls(geometry=True, noIntermediate=True):
+        if scene_has_geometry():
             self._collect_session_geometry(item)
 
+    @span_trace.traced("MayaSessionCollector.collect_current_maya_session", category="publish")
     def collect_current_maya_session(self, settings, parent_item):
         """
         Creates an item that represents the current maya session.
@@ -175,7 +519,76 @@ class MayaSessionCollector(HookBaseClass):
 
         return session_item
 
-    def collect_alembic_caches(self, parent_item, project_root):
+    def _get_project_scanner(self, settings, project_root):
+        """
+        Builds a scanner for the project folders the collect_* methods use.
+
+        :param dict settings: Configured settings for this collector
+        :param str project_root: The maya project root
+        :returns: ProjectRootScanner instance, not started
+        """
+        file_limit = 0
+        file_limit_setting = settings.get("Project Scan File Limit")
+        if file_limit_setting and file_limit_setting.value:
+            file_limit = file_limit_setting.value
+
+        folders = {
+            self._get_movies_dir(project_root): "file.video",
+            self._get_alembic_cache_dir(project_root): "file.alembic",
+        }
+
+        return ProjectRootScanner(
+            folders,
+            self._get_extension_table(),
+            lambda filename: self._get_item_info(filename)["item_type"],
+            file_limit=file_limit
+        )
+
+    def _get_extension_table(self):
+        """
+        Lookup of lower case file extension to item type, built from the base
+        class' common file info. Extensions not listed fall back to the base
+        class item info method.
+        """
+        extension_table = {}
+        common_file_info = getattr(self, "common_file_info", None) or {}
+        for file_info in common_file_info.values():
+            for extension in file_info.get("extensions", []):
+                extension_table.setdefault(
+                    extension.lower(), file_info["item_type"])
+        return extension_table
+
+    def _get_alembic_cache_dir(self, project_root):
+        """
+        :param str project_root: The maya project root
+        :returns: The folder alembic caches are written to
+        """
+        return os.path.join(project_root, "cache", "alembic")
+
+    def _get_movies_dir(self, project_root):
+        """
+        :param str project_root: The maya project root
+        :returns: The folder playblasts are written to
+        """
+
+        movie_dir_name = None
+
+        # try to query the file rule folder name for movies. This will give
+        # us the directory name set for the project where movies will be
+        # written
+        if "movie" in cmds.workspace(fileRuleList=True):
+            # this could return an empty string
+            movie_dir_name = cmds.workspace(fileRuleEntry='movie')
+
+        if not movie_dir_name:
+            # fall back to the default
+            movie_dir_name = "movies"
+
+        return os.path.join(project_root, movie_dir_name)
+
+    @span_trace.traced("MayaSessionCollector.collect_alembic_caches", category="publish")
+    def collect_alembic_caches(self, parent_item, project_root,
+                               project_scan=None):
         """
         Creates items for alembic caches
 
@@ -184,10 +597,12 @@ class MayaSessionCollector(HookBaseClass):
 
         :param parent_item: Parent Item instance
         :param str project_root: The maya project root to search for alembics
+        :param project_scan: Optional ProjectRootScanner already listing the
+            project folders
         """
 
         # ensure the alembic cache dir exists
-        cache_dir = os.path.join(project_root, "cache", "alembic")
+        cache_dir = self._get_alembic_cache_dir(project_root)
         if not os.path.exists(cache_dir):
             return
 
@@ -200,16 +615,16 @@ class MayaSessionCollector(HookBaseClass):
             }
         )
 
-        # look for alembic files in the cache folder
-        for filename in os.listdir(cache_dir):
-            cache_path = os.path.join(cache_dir, filename)
+        # look for alembic files in the cache folder. the scanner has already
+        # filtered them by item type
+        if project_scan is None:
+            project_scan = ProjectRootScanner(
+                {cache_dir: "file.alembic"},
+                self._get_extension_table(),
+                lambda filename: self._get_item_info(filename)["item_type"]
+            )
 
-            # do some early pre-processing to ensure the file is of the right
-            # type. use the base class item info method to see what the item
-            # type would be.
-            item_info = self._get_item_info(filename)
-            if item_info["item_type"] != "file.alembic":
-                continue
+        for cache_path in project_scan.files(cache_dir):
 
             # allow the base class to collect and create the item. it knows how
             # to handle alembic files
@@ -241,7 +656,12 @@ class MayaSessionCollector(HookBaseClass):
 
         geo_item.set_icon_from_path(icon_path)
 
-    def collect_playblasts(self, parent_item, project_root):
+        # shape count, poly count and bbox, computed the first time a plugin
+        # asks for them
+        geo_item.properties["geometry_stats"] = SessionGeometryStats()
+
+    @span_trace.traced("MayaSessionCollector.collect_playblasts", category="publish")
+    def collect_playblasts(self, parent_item, project_root, project_scan=None):
         """
         Creates items for quicktime playblasts.
 
@@ -250,23 +670,12 @@ class MayaSessionCollector(HookBaseClass):
 
         :param parent_item: Parent Item instance
         :param str project_root: The maya project root to search for playblasts
+        :param project_scan: Optional ProjectRootScanner already listing the
+            project folders
         """
 
-        movie_dir_name = None
-
-        # try to query the file rule folder name for movies. This will give
-        # us the directory name set for the project where movies will be
-        # written
-        if "movie" in cmds.workspace(fileRuleList=True):
-            # this could return an empty string
-            movie_dir_name = cmds.workspace(fileRuleEntry='movie')
-
-        if not movie_dir_name:
-            # fall back to the default
-            movie_dir_name = "movies"
-
         # ensure the movies dir exists
-        movies_dir = os.path.join(project_root, movie_dir_name)
+        movies_dir = self._get_movies_dir(project_root)
         if not os.path.exists(movies_dir):
             return
 
@@ -279,17 +688,16 @@ class MayaSessionCollector(HookBaseClass):
             }
         )
 
-        # look for movie files in the movies folder
-        for filename in os.listdir(movies_dir):
-
-            # do some early pre-processing to ensure the file is of the right
-            # type. use the base class item info method to see what the item
-            # type would be.
-            item_info = self._get_item_info(filename)
-            if item_info["item_type"] != "file.video":
-                continue
+        # look for movie files in the movies folder. the scanner has already
+        # filtered them by item type
+        if project_scan is None:
+            project_scan = ProjectRootScanner(
+                {movies_dir: "file.video"},
+                self._get_extension_table(),
+                lambda filename: self._get_item_info(filename)["item_type"]
+            )
 
-            movie_path = os.path.join(movies_dir, filename)
+        for movie_path in project_scan.files(movies_dir):
 
             # allow the base class to collect and create the item. it knows how
             # to handle movie files
@@ -302,6 +710,7 @@ class MayaSessionCollector(HookBaseClass):
             # the an indication of what it is and why it was collected
             item.name = "%s (%s)" % (item.name, "playblast")
 
+    @span_trace.traced("MayaSessionCollector.collect_rendered_images", category="publish")
     def collect_rendered_images(self, parent_item):
         """
         Creates items for any rendered images that can be identified by
@@ -312,7 +721,9 @@ class MayaSessionCollector(HookBaseClass):
         """
 
         # iterate over defined render layers and query the render settings for
-        # information about a potential render
+        # information about a potential render. maya commands have to stay on
+        # the main thread so gather all of the globs up front.
+        layer_globs = []
         for layer in cmds.ls(type="renderLayer"):
 
             self.logger.info("Processing render layer: %s" % (layer,))
@@ -324,16 +735,31 @@ class MayaSessionCollector(HookBaseClass):
                 fullPath=True,
                 layer=layer
             )
+            layer_globs.append((layer, frame_glob))
+
+        if not layer_globs:
+            return
+
+        # see if there are any files on disk that match these patterns. the
+        # folders usually live on the render volume so scan them in parallel
+        pool = ThreadPool(min(RENDER_SCAN_WORKERS, len(layer_globs)))
+        try:
+            first_paths = pool.map(
+                find_first_frame,
+                [frame_glob for (_, frame_glob) in layer_globs]
+            )
+        finally:
+            pool.close()
+            pool.join()
 
-            # see if there are any files on disk that match this pattern
-            rendered_paths = glob.glob(frame_glob)
+        for (layer, _), rendered_path in zip(layer_globs, first_paths):
 
-            if rendered_paths:
+            if rendered_path:
                 # we only need one path to publish, so take the first one and
                 # let the base class collector handle it
                 item = super(MayaSessionCollector, self)._collect_file(
                     parent_item,
-                    rendered_paths[0],
+                    rendered_path,
                     frame_sequence=True
                 )
 
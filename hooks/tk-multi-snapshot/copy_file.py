@@ -0,0 +1,57 @@
+# Copyright (c) 2013 Shotgun Software Inc.
+#
+# CONFIDENTIAL AND PROPRIETARY
+#
+# This work is provided "AS IS" and subject to the Shotgun Pipeline Toolkit
+# Source Code License included in this distribution package. See LICENSE.
+# By accessing, using, copying or modifying this work you indicate your
+# agreement to the Shotgun Pipeline Toolkit Source Code License. All rights
+# not expressly granted therein are reserved by Shotgun Software Inc.
+
+import os
+import shutil
+import sys
+
+from tank import Hook
+
+CONFIG_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+if CONFIG_ROOT not in sys.path:
+    sys.path.append(CONFIG_ROOT)
+
+import snapshot_store
+
+
+class CopyFile(Hook):
+    """
+    Takes snapshots through the background, deduplicating snapshot store,
+    see snapshot_store for the details. Restoring a snapshot waits for it to
+    be written if it's still queued, then is a plain copy.
+    """
+
+    def execute(self, source_path, target_path, **kwargs):
+        """
+        Main hook entry point
+
+        :param source_path: String
+                            Source file path to copy
+
+        :param target_path: String
+                            Target file path to copy to
+        """
+        # make sure the target folder exists
+        target_folder = os.path.dirname(target_path)
+        if not os.path.exists(target_folder):
+            old_umask = os.umask(0)
+            try:
+                os.makedirs(target_folder, 0o777)
+            finally:
+                os.umask(old_umask)
+
+        # restoring a snapshot over the work file, the app reopens it as soon
+        # as this returns so it has to be a plain copy that's already there
+        if snapshot_store.is_snapshot_path(source_path) or not snapshot_store.is_snapshot_path(target_path):
+            snapshot_store.get_queue().wait_for(source_path)
+            shutil.copy(source_path, target_path)
+            return
+
+        snapshot_store.get_queue().submit(source_path, target_path)
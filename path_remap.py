@@ -0,0 +1,236 @@
+"""
+Cross platform path remapping for the mixed windows / linux farm.
+
+The same storage is mounted at a different root on every platform, core/roots.yml has the toolkit storage roots and
+config_constants.PLATFORM_ROOTS the shotgun drives and software root. PathRemapper builds a trie of every one of those
+roots for every platform once, keyed by path segment, and remaps a path by walking its segments to the longest root
+that matches and swapping that root for the same root on the target platform. Paths that aren't under a known root
+are left alone.
+
+Matching ignores case and treats \\ and / the same, remapped paths are written with / which maya takes everywhere.
+Directories are remapped once per batch, a scene's thousands of texture and cache paths share a handful of them.
+
+rewrite_ma() streams an ascii .ma a line at a time remapping every quoted path in it, so a scene of any size never
+has to be held in memory.
+
+Usage:
+    remapper = get_remapper()
+    remapper.remap('I:/myProject/sequences/SEQ/SHOT/tex.exr', 'linux')    # /projects/myProject/...
+    remapper.remap_many(paths, 'linux')
+    rewrite_ma('/projects/shot.ma', '/projects/shot_linux.ma', 'linux')
+
+    python path_remap.py linux source.ma [dest.ma]    rewrites the scene, in place without a dest
+    python path_remap.py linux < paths.txt            remaps one path per line
+"""
+import io
+import os
+import re
+
+try:
+    from tank_vendor import yaml
+except ImportError:
+    import yaml
+
+import config_constants as configCONST
+
+CONFIG_ROOT = os.path.dirname(os.path.abspath(__file__))
+ROOTS_PATH = os.path.join(CONFIG_ROOT, 'core', 'roots.yml')
+PLATFORMS = ('win', 'osx', 'linux')
+## roots.yml key for each OSTYPE
+ROOTS_KEYS = {'win': 'windows_path', 'osx': 'mac_path', 'linux': 'linux_path'}
+## a double quoted .ma string, escapes and all
+MA_STRING = re.compile(r'"((?:[^"\\]|\\.)*)"')
+## remapped directories kept per target before the memo is cleared
+MEMO_SIZE = 10000
+_END = None
+
+
+class PathRemapError(Exception):
+    pass
+
+
+def _segments(path):
+    return path.replace('\\', '/').rstrip('/').split('/')
+
+
+def load_roots(roots_path=ROOTS_PATH, platform_roots=None):
+    """
+    :return: (dict) of root name: {OSTYPE: path}, the roots.yml storages then the config_constants roots
+    """
+    roots = {}
+    if os.path.isfile(roots_path):
+        with open(roots_path, 'r') as f:
+            data = yaml.safe_load(f) or {}
+        for name, root in data.items():
+            paths = dict((platform, root.get(key)) for platform, key in ROOTS_KEYS.items() if root.get(key))
+            if paths:
+                roots[name] = paths
+
+    platform_roots = configCONST.PLATFORM_ROOTS if platform_roots is None else platform_roots
+    for platform, constants in platform_roots.items():
+        for name, path in constants.items():
+            roots.setdefault(name, {})[platform] = path
+    return roots
+
+
+class PathRemapper(object):
+    def __init__(self, roots=None):
+        """
+        :param roots: (dict) of root name: {OSTYPE: path}, defaults to load_roots()
+        """
+        self.roots = load_roots() if roots is None else roots
+        self._trie = {}
+        self._memo = dict((platform, {}) for platform in PLATFORMS)
+        for name in self.roots:
+            for path in self.roots[name].values():
+                self._insert(path, name)
+
+    def _insert(self, path, name):
+        node = self._trie
+        for segment in _segments(path):
+            node = node.setdefault(segment.lower(), {})
+        if _END in node and node[_END] != name:
+            ## the same folder is two roots eg primary and SHOTGUN_PRIMARY_DRIVE, the first one in wins
+            return
+        node[_END] = name
+
+    def match(self, path):
+        """
+        :return: (tuple) of (root name, number of segments it covers) for the longest root path is under, or
+                 (None, 0)
+        """
+        node = self._trie
+        found = (None, 0)
+        for depth, segment in enumerate(_segments(path)):
+            node = node.get(segment.lower())
+            if node is None:
+                break
+            if _END in node:
+                found = (node[_END], depth + 1)
+        return found
+
+    def _target_root(self, name, target):
+        root = self.roots[name].get(target)
+        if root is None:
+            raise PathRemapError('Root {} has no {} path'.format(name, target))
+        return root.replace('\\', '/').rstrip('/')
+
+    def remap(self, path, target=None):
+        """
+        :param target: (str) OSTYPE to remap to, win osx or linux, defaults to this one
+        :return: (str) path under the target's root, or path as it was if it isn't under a known root
+        """
+        target = target or configCONST.OSTYPE
+        name, depth = self.match(path)
+        if name is None:
+            return path
+        rest = _segments(path)[depth:]
+        root = self._target_root(name, target)
+        if not rest:
+            ## a bare drive needs its slash, I: on its own is the current folder on that drive
+            return '{}/'.format(root) if root.endswith(':') or not root else root
+        return '/'.join([root] + rest)
+
+    def remap_many(self, paths, target=None):
+        """
+        Remaps a batch, each directory is only matched against the roots once.
+        :return: (list) of remapped paths in the same order
+        """
+        target = target or configCONST.OSTYPE
+        if target not in self._memo:
+            raise PathRemapError('Unknown platform {}, expected one of {}'.format(target, PLATFORMS))
+        memo = self._memo[target]
+        remapped = []
+        for path in paths:
+            head, tail = os.path.split(path.replace('\\', '/'))
+            if not head or not tail:
+                remapped.append(self.remap(path, target))
+                continue
+            new_head = memo.get(head)
+            if new_head is None:
+                if len(memo) >= MEMO_SIZE:
+                    memo.clear()
+                new_head = memo[head] = self.remap(head, target)
+            remapped.append('{}/{}'.format(new_head.rstrip('/'), tail) if new_head != head else path)
+        return remapped
+
+    def remap_line(self, line, target=None):
+        """
+        Remaps every double quoted path in a line of a .ma.
+        :return: (tuple) of (the line, number of paths remapped)
+        """
+        if '"' not in line:
+            return line, 0
+        target = target or configCONST.OSTYPE
+        count = [0]
+
+        def _replace(match):
+            value = match.group(1)
+            ## .ma strings escape their backslashes
+            path = value.replace('\\\\', '/')
+            if self.match(path)[0] is None:
+                return match.group(0)
+            new_path = self.remap(path, target)
+            if new_path == path:
+                return match.group(0)
+            count[0] += 1
+            return '"{}"'.format(new_path)
+
+        return MA_STRING.sub(_replace, line), count[0]
+
+
+def rewrite_ma(source, dest=None, target=None, remapper=None):
+    """
+    Streams an ascii maya scene remapping every quoted path, into a tmp file renamed over dest when it's done.
+    :param dest: (str) file to write, defaults to rewriting source in place
+    :return: (int) number of paths remapped
+    """
+    dest = dest or source
+    remapper = remapper or get_remapper()
+    tmp_path = '{}.{}.tmp'.format(dest, os.getpid())
+    total = 0
+    try:
+        ## latin-1 maps every byte to a character and back, whatever the scene's encoding
+        with io.open(source, 'r', encoding='latin-1', newline='') as reader:
+            with io.open(tmp_path, 'w', encoding='latin-1', newline='') as writer:
+                for line in reader:
+                    line, count = remapper.remap_line(line, target)
+                    total += count
+                    writer.write(line)
+        if os.path.isfile(dest):
+            os.remove(dest)
+        os.rename(tmp_path, dest)
+    finally:
+        if os.path.isfile(tmp_path):
+            os.remove(tmp_path)
+    return total
+
+
+_REMAPPER = []
+
+
+def get_remapper():
+    """
+    :return: (PathRemapper) built from roots.yml and config_constants once per session
+    """
+    if not _REMAPPER:
+        _REMAPPER.append(PathRemapper())
+    return _REMAPPER[0]
+
+
+if __name__ == '__main__':
+    import sys
+    import time
+
+    if len(sys.argv) < 2 or sys.argv[1] not in PLATFORMS:
+        print('usage: python path_remap.py {} [source.ma [dest.ma]]'.format('|'.join(PLATFORMS)))
+        sys.exit(1)
+    target_os = sys.argv[1]
+    if len(sys.argv) > 2:
+        start = time.time()
+        remapped_count = rewrite_ma(sys.argv[2], sys.argv[3] if len(sys.argv) > 3 else None, target_os)
+        print('Remapped {} paths in {:.2f}s'.format(remapped_count, time.time() - start))
+    else:
+        input_paths = [line.rstrip('\r\n') for line in sys.stdin if line.strip()]
+        for remapped_path in get_remapper().remap_many(input_paths, target_os):
+            print(remapped_path)
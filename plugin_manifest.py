@@ -0,0 +1,295 @@
+"""
+Plugin manifest for config_constants.MAYA_PLUGIN_PATHS.
+
+userSetup used to load every plugin in MAYA_PLUGIN_PATHS one after another at startup. Most sessions only need a few
+of them, so each plugin now carries a little metadata (PLUGIN_METADATA):
+    lazy:         don't load at startup, load on first use instead (default True)
+    dependencies: plugins that have to be loaded first
+    node_types:   node types the plugin registers, seeds the node type index
+
+A lazy plugin can only be loaded on first use once the node type index knows a node type it registers, anything else
+(a new plugin, or one like brSmoothWeights that only registers commands) is loaded at startup. The index is built from
+cmds.pluginInfo(dependNode=True) whenever a plugin loads:
+    - the shared index next to this file is written by a profiling load of every plugin, run it per maya version
+      after adding a plugin: mayapy plugin_manifest.py index
+    - a user index in the users maya prefs picks up whatever their sessions load, so a plugin missing from the
+      shared index is only eager until it has been loaded once
+
+At startup the plugin folders are checked concurrently, their folders are put on MAYA_PLUG_IN_PATH so maya can
+auto-load anything a scene `requires`, and only the eager plugins are loaded. Tools that create plugin nodes call
+ensure_node_type() which loads the owning plugin on first use.
+
+The per plugin load times are written as json next to the tankLog in TEMP_FOLDER.
+
+startup() is run by the engine_init core hook when tk-maya starts, or from userSetup.py:
+    import plugin_manifest
+    plugin_manifest.startup()
+"""
+import json
+import os
+import time
+from multiprocessing.pool import ThreadPool
+
+import config_constants as configCONST
+
+## Plugins that aren't listed here are lazy with no dependencies.
+## The python plugins register commands not nodes, so they can't be auto-loaded from a node type and stay eager.
+PLUGIN_METADATA = {
+    'resetSkinCluster.py': {'lazy': False},
+    'skinTo.py': {'lazy': False},
+    'saveSkinWeights.py': {'lazy': False},
+    'loadSkinWeights.py': {'lazy': False},
+}
+NODE_TYPE_INDEX_NAME = 'pluginNodeTypes.json'
+SHARED_INDEX_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), NODE_TYPE_INDEX_NAME)
+PROFILE_NAME = '{}_pluginLoad.json'
+CHECK_WORKERS = 8
+
+
+class PluginEntry(object):
+    def __init__(self, folder, file_name, metadata=None):
+        metadata = metadata or {}
+        self.folder = folder
+        self.file_name = file_name
+        self.path = os.path.join(folder, file_name)
+        self.name = os.path.splitext(file_name)[0]
+        self.lazy = metadata.get('lazy', True)
+        self.dependencies = list(metadata.get('dependencies', []))
+        self.node_types = list(metadata.get('node_types', []))
+        self.exists = None
+
+
+def _check_exists(entry):
+    entry.exists = os.path.isfile(entry.path)
+    return entry
+
+
+class PluginManifest(object):
+    def __init__(self, plugin_paths=None, metadata=None, index_path=None, shared_index_path=SHARED_INDEX_PATH):
+        """
+        :param plugin_paths: (list) of (folder, file_name) tuples, defaults to configCONST.MAYA_PLUGIN_PATHS
+        :param metadata: (dict) of file_name: metadata, defaults to PLUGIN_METADATA
+        :param index_path: (str) path of the node type index json written to, defaults to the users maya prefs folder
+        :param shared_index_path: (str) path of the node type index from the profiling load, read only
+        """
+        plugin_paths = configCONST.MAYA_PLUGIN_PATHS if plugin_paths is None else plugin_paths
+        metadata = PLUGIN_METADATA if metadata is None else metadata
+        self.plugins = [PluginEntry(folder, file_name, metadata.get(file_name)) for folder, file_name in plugin_paths]
+        self._by_name = dict((entry.name, entry) for entry in self.plugins)
+        self._by_name.update((entry.file_name, entry) for entry in self.plugins)
+        self.index_path = index_path or os.path.join(configCONST.MAYA_CONFIG_PREFS_PATH, NODE_TYPE_INDEX_NAME)
+        self.shared_index_path = shared_index_path
+        self.node_type_index = self._read_index()
+        self.load_times = {}
+
+    def _read_index(self):
+        index = {}
+        for entry in self.plugins:
+            for node_type in entry.node_types:
+                index[node_type] = entry.file_name
+        for path in (self.shared_index_path, self.index_path):
+            if not path:
+                continue
+            try:
+                with open(path, 'r') as f:
+                    index.update(json.load(f))
+            except (IOError, OSError, ValueError):
+                pass
+        return index
+
+    def is_lazy(self, entry):
+        """
+        :return: (bool) True if the plugin can wait for its first use, it's lazy and a node type it registers is known
+        """
+        return entry.lazy and entry.file_name in set(self.node_type_index.values())
+
+    def _write_index(self):
+        try:
+            folder = os.path.dirname(self.index_path)
+            if not os.path.isdir(folder):
+                os.makedirs(folder)
+            with open(self.index_path, 'w') as f:
+                json.dump(self.node_type_index, f, indent=2, sort_keys=True)
+        except (IOError, OSError) as e:
+            print('Failed to write plugin node type index {}: {}'.format(self.index_path, e))
+
+    def check_plugins(self, workers=CHECK_WORKERS):
+        """
+        Checks all the plugin files exist at once instead of one network stat after another.
+        :return: (list) of the PluginEntry that are missing on disk
+        """
+        unchecked = [entry for entry in self.plugins if entry.exists is None]
+        if unchecked:
+            pool = ThreadPool(min(workers, len(unchecked)))
+            try:
+                pool.map(_check_exists, unchecked)
+            finally:
+                pool.close()
+                pool.join()
+        return [entry for entry in self.plugins if not entry.exists]
+
+    def register_plugin_paths(self):
+        """
+        Puts the plugin folders on MAYA_PLUG_IN_PATH so maya can auto-load the plugins a scene requires by name.
+        """
+        current = [each for each in os.environ.get('MAYA_PLUG_IN_PATH', '').split(os.pathsep) if each]
+        for entry in self.plugins:
+            if entry.exists and entry.folder not in current:
+                current.append(entry.folder)
+        os.environ['MAYA_PLUG_IN_PATH'] = os.pathsep.join(current)
+
+    def _load_order(self, entry, seen=None):
+        seen = seen if seen is not None else []
+        if entry in seen:
+            return seen
+        for dependency in entry.dependencies:
+            if dependency in self._by_name:
+                self._load_order(self._by_name[dependency], seen)
+        seen.append(entry)
+        return seen
+
+    def load(self, plugin_name):
+        """
+        Loads a plugin and its dependencies if they aren't loaded already, timing each one.
+        :param plugin_name: (str) plugin file name or name without the extension
+        :return: (bool) True if the plugin is loaded
+        """
+        import maya.cmds as cmds
+
+        entry = self._by_name.get(plugin_name)
+        if entry is None:
+            return False
+
+        index_changed = False
+        for each in self._load_order(entry):
+            if cmds.pluginInfo(each.file_name, q=True, loaded=True):
+                continue
+            if each.exists is None:
+                _check_exists(each)
+            if not each.exists:
+                print('Plugin {} not found'.format(each.path))
+                return False
+
+            start = time.time()
+            try:
+                cmds.loadPlugin(each.path, quiet=True)
+            except RuntimeError as e:
+                print('Failed to load plugin {}: {}'.format(each.path, e))
+                return False
+            self.load_times[each.file_name] = time.time() - start
+
+            for node_type in cmds.pluginInfo(each.file_name, q=True, dependNode=True) or []:
+                if self.node_type_index.get(node_type) != each.file_name:
+                    self.node_type_index[node_type] = each.file_name
+                    index_changed = True
+
+        if index_changed:
+            self._write_index()
+        return True
+
+    def ensure_node_type(self, node_type):
+        """
+        Loads the plugin that provides node_type if the index knows about it.
+        :return: (bool) True if the node type is available
+        """
+        import maya.cmds as cmds
+
+        if node_type in (cmds.allNodeTypes() or []):
+            return True
+        plugin_name = self.node_type_index.get(node_type)
+        if not plugin_name:
+            return False
+        return self.load(plugin_name)
+
+    def load_startup_plugins(self):
+        """
+        Loads the eager plugins, lazy ones are left for maya's requires or ensure_node_type.
+        """
+        for entry in self.plugins:
+            if entry.exists and not self.is_lazy(entry):
+                self.load(entry.file_name)
+
+    def write_profile(self, path=None, extra=None):
+        """
+        Writes the plugin load report as json.
+        :return: (str) the path written
+        """
+        path = path or os.path.join(configCONST.TEMP_FOLDER, PROFILE_NAME.format(configCONST.USER_NAME))
+        report = {
+            'maya_version': configCONST.MAYA_VERSION,
+            'load_times': self.load_times,
+            'total_load_time': sum(self.load_times.values()),
+            'lazy': sorted(entry.file_name for entry in self.plugins if self.is_lazy(entry) and
+                           entry.file_name not in self.load_times),
+            'missing': sorted(entry.path for entry in self.plugins if entry.exists is False),
+        }
+        report.update(extra or {})
+        try:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+        except (IOError, OSError) as e:
+            print('Failed to write plugin load report {}: {}'.format(path, e))
+        return path
+
+
+_MANIFEST = []
+_STARTED = []
+
+
+def get_manifest():
+    """
+    :return: (PluginManifest) the sessions manifest
+    """
+    if not _MANIFEST:
+        _MANIFEST.append(PluginManifest())
+    return _MANIFEST[0]
+
+
+def ensure_node_type(node_type):
+    return get_manifest().ensure_node_type(node_type)
+
+
+def startup():
+    """
+    Replaces loading every plugin in MAYA_PLUGIN_PATHS, only does anything the first time it's called in a session.
+    """
+    if _STARTED:
+        return get_manifest()
+    _STARTED.append(True)
+    start = time.time()
+    manifest = get_manifest()
+    manifest.check_plugins()
+    check_time = time.time() - start
+    manifest.register_plugin_paths()
+    manifest.load_startup_plugins()
+    if configCONST.DEBUGGING:
+        manifest.write_profile(extra={'check_time': check_time, 'startup_time': time.time() - start})
+    return manifest
+
+
+def build_index(path=SHARED_INDEX_PATH):
+    """
+    The profiling load, loads every plugin in a maya standalone and writes the node types each one registers to the
+    shared index.
+    :return: (dict) of node type: plugin file name
+    """
+    import maya.standalone
+    maya.standalone.initialize(name='python')
+    manifest = PluginManifest(index_path=path, shared_index_path=None)
+    manifest.node_type_index = {}
+    manifest.check_plugins()
+    for entry in manifest.plugins:
+        if entry.exists:
+            manifest.load(entry.file_name)
+    manifest._write_index()
+    print(json.dumps(manifest.load_times, indent=2, sort_keys=True))
+    return manifest.node_type_index
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) < 2 or sys.argv[1] != 'index':
+        print('usage: mayapy plugin_manifest.py index')
+        sys.exit(1)
+    build_index()
@@ -0,0 +1,500 @@
+"""
+Batched PublishedFile registration for multi item publishes.
+
+A maya publish regularly has 30-200 items (render layers, alembic caches, playblasts, geometry) and
+sgtk.util.register_publish costs each one its own create, a dependency lookup, dependency creates and a thumbnail
+upload. The batch_publish_file publish2 hook queues each item's publish with a PublishBatch instead and the whole
+lot goes to the server together:
+    - the published file types, local storages and dependency paths for every item are looked up once
+    - the PublishedFiles are created in sg.batch() calls of BATCH_SIZE, items that depend on another item of the
+      same publish (eg the session geometry on the session) go in a later batch than it so its id is known
+    - the PublishedFileDependency links for every item are created in batches after that
+    - the thumbnails are uploaded by a pool of THUMBNAIL_WORKERS threads, each with its own connection, a failed
+      upload is kept in thumbnail_failures for the hook to warn about rather than failing the publish
+
+add() hands back a PendingPublish standing in for the created entity. It isn't a dict, anything that reads it (an
+item, get(), in, len(), a truth test) submits everything queued so far first and reads the created PublishedFile, eg
+a child item's publish needing its parent's id, and anything that can't go through it (json, a Shotgun call) fails
+rather than seeing an empty publish. Pass pending.data where a real dict is needed. dependency_paths pointing at
+another publish queued in the same batch are linked to it like depends_on, only paths outside the batch are looked
+up on the server. Entries only leave the queue once they have been created, so a submit that fails part way leaves
+the rest queued.
+
+The batch belongs to one publish run, the collector drops whatever an earlier run left queued with discard_batch().
+
+Usage:
+    batch = get_batch()
+    item.properties.sg_publish_data = batch.add(tk=tk, context=context, path=path, name=name, version_number=3,
+                                                published_file_type='Alembic Cache', depends_on=[parent_pending])
+    ...
+    batch.submit()
+
+    with queued_registration(get_batch(), item_key=id(item)):
+        ## sgtk.util.register_publish queues with the batch in here
+
+    python publish_batch.py [items ...]    checks the pending publishes and dependency links against a fake server,
+                                           then counts the round trips for each item count
+"""
+import contextlib
+import os
+import threading
+from multiprocessing.pool import ThreadPool
+
+BATCH_SIZE = 50
+THUMBNAIL_WORKERS = 4
+
+
+class PublishBatchError(Exception):
+    pass
+
+
+class PendingPublish(object):
+    """
+    The sg_publish_data of a queued publish. Reading it before the batch is submitted submits it.
+    """
+    def __init__(self, batch, key):
+        self.batch = batch
+        self.key = key
+        self.batch_entry = None
+        self._data = None
+
+    @property
+    def submitted(self):
+        return self._data is not None
+
+    @property
+    def data(self):
+        """
+        :return: (dict) the created PublishedFile, submitting the batch first if it hasn't been
+        """
+        if self._data is None:
+            self.batch.submit()
+            if self._data is None:
+                raise PublishBatchError('Publish {} failed to register'.format(self.key))
+        return self._data
+
+    def __getitem__(self, key):
+        return self.data[key]
+
+    def get(self, key, default=None):
+        return self.data.get(key, default)
+
+    def __contains__(self, key):
+        return key in self.data
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __bool__(self):
+        return bool(self.data)
+
+    __nonzero__ = __bool__
+
+    def keys(self):
+        return self.data.keys()
+
+    def items(self):
+        return self.data.items()
+
+    def __repr__(self):
+        ## the publish hooks log this straight after queueing, it mustn't submit
+        if self._data is None:
+            return '<PendingPublish {} queued>'.format(self.key)
+        return repr(self._data)
+
+
+class _Entry(object):
+    def __init__(self, pending, kwargs, depends_on, item_key=None):
+        self.pending = pending
+        self.kwargs = kwargs
+        self.depends_on = depends_on
+        self.item_key = item_key
+
+
+def _chunks(items, size):
+    for index in range(0, len(items), size):
+        yield items[index:index + size]
+
+
+def _levels(entries):
+    """
+    Orders entries so each one comes after the queued publishes it depends on.
+    :return: (list) of lists of entries, every entry in a level only depends on earlier levels
+    """
+    depth = {}
+
+    def _depth(entry, stack=()):
+        if entry.pending.key in depth:
+            return depth[entry.pending.key]
+        if entry.pending.key in stack:
+            raise PublishBatchError('Circular dependency on publish {}'.format(entry.pending.key))
+        parents = [each.batch_entry for each in entry.depends_on if not each.submitted]
+        level = max([_depth(parent, stack + (entry.pending.key,)) + 1 for parent in parents] or [0])
+        depth[entry.pending.key] = level
+        return level
+
+    levels = []
+    for entry in entries:
+        level = _depth(entry)
+        while len(levels) <= level:
+            levels.append([])
+        levels[level].append(entry)
+    return levels
+
+
+def _path_cache(tk, path):
+    """
+    :return: (tuple) of (storage root name, path relative to the storage) like toolkit stores for a publish, or
+             (None, None) if the path isn't in the project
+    """
+    norm_path = os.path.normcase(os.path.normpath(path))
+    for root_name, root_path in tk.roots.items():
+        norm_root = os.path.normcase(os.path.normpath(root_path))
+        if norm_path == norm_root or norm_path.startswith(norm_root + os.sep):
+            relative = os.path.normpath(path)[len(os.path.normpath(root_path)):].replace('\\', '/').strip('/')
+            disk_name = tk.pipeline_configuration.get_project_disk_name()
+            return root_name, '/'.join(each for each in (disk_name, relative) if each)
+    return None, None
+
+
+class PublishBatch(object):
+    def __init__(self, sg=None, sg_factory=None, batch_size=BATCH_SIZE, thumbnail_workers=THUMBNAIL_WORKERS):
+        """
+        :param sg: (Shotgun) connection, defaults to the tk connection of the first publish added
+        :param sg_factory: (callable) returning a connection for each thumbnail thread, defaults to toolkit's per
+                           thread get_sg_connection
+        """
+        self.sg = sg
+        self.sg_factory = sg_factory
+        self.batch_size = batch_size
+        self.thumbnail_workers = thumbnail_workers
+        self.round_trips = 0
+        ## (PublishedFile id, thumbnail path, error) for each upload that failed
+        self.thumbnail_failures = []
+        self._entries = []
+        self._count = 0
+        self._lock = threading.RLock()
+
+    def add(self, depends_on=None, item_key=None, **kwargs):
+        """
+        Queues a publish.
+        :param depends_on: (list) of PendingPublish from this batch the publish depends on
+        :param item_key: publishing the same item_key again replaces its queued publish, eg a publish run again
+                         after one of its tasks failed
+        :param kwargs: the sgtk.util.register_publish arguments, tk context path name version_number comment
+                       created_by thumbnail_path published_file_type dependency_paths dependency_ids sg_fields
+        :return: (PendingPublish) filled in with the created PublishedFile on submit()
+        """
+        with self._lock:
+            if self.sg is None and kwargs.get('tk') is not None:
+                self.sg = kwargs['tk'].shotgun
+            if item_key is not None:
+                self._entries = [each for each in self._entries if each.item_key != item_key]
+            self._count += 1
+            pending = PendingPublish(self, self._count)
+            entry = _Entry(pending, kwargs, list(depends_on or []), item_key)
+            pending.batch_entry = entry
+            self._entries.append(entry)
+            return pending
+
+    def discard(self):
+        """
+        Drops everything queued without registering it.
+        :return: (int) number of publishes dropped
+        """
+        with self._lock:
+            dropped = len(self._entries)
+            self._entries = []
+            return dropped
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _call(self, method, *args, **kwargs):
+        self.round_trips += 1
+        return getattr(self.sg, method)(*args, **kwargs)
+
+    def _publish_types(self, entries):
+        codes = sorted(set(entry.kwargs['published_file_type'] for entry in entries
+                           if entry.kwargs.get('published_file_type')))
+        if not codes:
+            return {}
+        types = dict((each['code'], each) for each in self._call(
+            'find', 'PublishedFileType', [['code', 'in', codes]], ['code']))
+        missing = [code for code in codes if code not in types]
+        if missing:
+            created = self._call('batch', [{'request_type': 'create', 'entity_type': 'PublishedFileType',
+                                            'data': {'code': code}} for code in missing])
+            types.update((each['code'], each) for each in created)
+        return dict((code, {'type': 'PublishedFileType', 'id': each['id']}) for code, each in types.items())
+
+    def _storages(self, entries):
+        names = set()
+        for entry in entries:
+            if entry.kwargs.get('tk') is not None:
+                names.add(_path_cache(entry.kwargs['tk'], entry.kwargs['path'])[0])
+        names.discard(None)
+        if not names:
+            return {}
+        return dict((each['code'], {'type': 'LocalStorage', 'id': each['id']}) for each in self._call(
+            'find', 'LocalStorage', [['code', 'in', sorted(names)]], ['code']))
+
+    def _link_queued_paths(self, entries):
+        """
+        Turns dependency_paths pointing at another queued publish into depends_on, those can't be looked up on the
+        server before they are created.
+        :return: (dict) of entry key: the dependency_paths left to look up
+        """
+        queued = dict((os.path.normcase(os.path.normpath(entry.kwargs['path'])), entry) for entry in self._entries)
+        outside = {}
+        for entry in entries:
+            outside[entry.pending.key] = []
+            for path in entry.kwargs.get('dependency_paths') or []:
+                parent = queued.get(os.path.normcase(os.path.normpath(path)))
+                if parent is None:
+                    outside[entry.pending.key].append(path)
+                elif parent is not entry and parent.pending not in entry.depends_on:
+                    entry.depends_on.append(parent.pending)
+        return outside
+
+    def _dependency_paths(self, entries, outside):
+        """
+        :param outside: (dict) from _link_queued_paths
+        :return: (dict) of dependency path: publish id, for every item's dependency_paths outside the batch in one
+                 lookup
+        """
+        paths = set()
+        tk = None
+        for entry in entries:
+            paths.update(outside[entry.pending.key])
+            tk = tk or entry.kwargs.get('tk')
+        if not paths or tk is None:
+            return {}
+        import sgtk
+        self.round_trips += 1
+        found = sgtk.util.find_publish(tk, sorted(paths))
+        return dict((path, each['id']) for path, each in found.items())
+
+    def _data(self, entry, publish_types, storages):
+        kwargs = entry.kwargs
+        context = kwargs['context']
+        path = kwargs['path']
+        data = {
+            'project': context.project,
+            'entity': context.entity,
+            'task': context.task,
+            'code': os.path.basename(path),
+            'name': kwargs['name'],
+            'description': kwargs.get('comment') or '',
+            'version_number': kwargs.get('version_number'),
+            'path': {'local_path': path},
+            'created_by': kwargs.get('created_by') or context.user,
+        }
+        if kwargs.get('published_file_type'):
+            data['published_file_type'] = publish_types[kwargs['published_file_type']]
+        if kwargs.get('tk') is not None:
+            storage_name, path_cache = _path_cache(kwargs['tk'], path)
+            if path_cache:
+                data['path_cache'] = path_cache
+                data['path_cache_storage'] = storages.get(storage_name)
+        data.update(kwargs.get('sg_fields') or {})
+        return dict((key, value) for key, value in data.items() if value is not None)
+
+    def _upload_thumbnail(self, args):
+        entity_id, thumbnail_path = args
+        try:
+            sg = (self.sg_factory or _thread_connection)()
+            sg.upload_thumbnail('PublishedFile', entity_id, thumbnail_path)
+        except Exception as e:
+            ## the publish is registered, a missing thumbnail isn't worth failing it for
+            return entity_id, thumbnail_path, str(e)
+
+    def submit(self):
+        """
+        Registers everything queued so far.
+        :return: (list) of the created PublishedFile dicts
+        """
+        with self._lock:
+            entries = list(self._entries)
+            if not entries:
+                return []
+            publish_types = self._publish_types(entries)
+            storages = self._storages(entries)
+            outside = self._link_queued_paths(entries)
+            dependency_ids = self._dependency_paths(entries, outside)
+
+            created = []
+            for level in _levels(entries):
+                for chunk in _chunks(level, self.batch_size):
+                    requests = [{'request_type': 'create', 'entity_type': 'PublishedFile',
+                                 'data': self._data(entry, publish_types, storages)} for entry in chunk]
+                    for entry, result in zip(chunk, self._call('batch', requests)):
+                        entry.pending._data = result
+                        created.append(result)
+                    self._entries = [each for each in self._entries if not each.pending.submitted]
+
+            links = []
+            for entry in entries:
+                upstream = set(entry.kwargs.get('dependency_ids') or [])
+                upstream.update(dependency_ids[path] for path in outside[entry.pending.key]
+                                if path in dependency_ids)
+                upstream.update(parent.data['id'] for parent in entry.depends_on)
+                for upstream_id in sorted(upstream):
+                    links.append({'request_type': 'create', 'entity_type': 'PublishedFileDependency',
+                                  'data': {'published_file': {'type': 'PublishedFile',
+                                                              'id': entry.pending.data['id']},
+                                           'dependent_published_file': {'type': 'PublishedFile',
+                                                                        'id': upstream_id}}})
+            for chunk in _chunks(links, self.batch_size):
+                self._call('batch', chunk)
+
+            thumbnails = [(entry.pending.data['id'], entry.kwargs['thumbnail_path']) for entry in entries
+                          if entry.kwargs.get('thumbnail_path')]
+            if thumbnails:
+                self.round_trips += len(thumbnails)
+                pool = ThreadPool(min(self.thumbnail_workers, len(thumbnails)))
+                try:
+                    self.thumbnail_failures.extend(each for each in pool.map(self._upload_thumbnail, thumbnails)
+                                                   if each)
+                finally:
+                    pool.close()
+                    pool.join()
+            return created
+
+
+def _thread_connection():
+    from tank.util.shotgun import get_sg_connection
+    return get_sg_connection()
+
+
+_BATCH = []
+
+
+def get_batch():
+    """
+    :return: (PublishBatch) for the publish being run, a new one once the last was submitted
+    """
+    if not _BATCH:
+        _BATCH.append(PublishBatch())
+    return _BATCH[0]
+
+
+def reset_batch():
+    """
+    Submits anything left and starts a new batch for the next publish.
+    :return: (list) of what was still to be created
+    """
+    if not _BATCH:
+        return []
+    created = _BATCH[0].submit()
+    _BATCH.pop()
+    return created
+
+
+def discard_batch():
+    """
+    Drops the last run's batch unregistered, eg one left behind when a publish task raised and finalize never ran.
+    :return: (int) number of publishes dropped
+    """
+    if not _BATCH:
+        return 0
+    return _BATCH.pop().discard()
+
+
+@contextlib.contextmanager
+def queued_registration(batch, item_key=None):
+    """
+    Swaps sgtk.util.register_publish for queueing with batch, so a publish plugin's own publish() can run unchanged.
+    """
+    import sgtk
+    register_publish = sgtk.util.register_publish
+
+    def _queue(tk, context, path, name, version_number, **kwargs):
+        return batch.add(item_key=item_key, tk=tk, context=context, path=path, name=name,
+                         version_number=version_number, **kwargs)
+
+    sgtk.util.register_publish = _queue
+    try:
+        yield batch
+    finally:
+        sgtk.util.register_publish = register_publish
+
+
+if __name__ == '__main__':
+    import json
+    import sys
+
+    class FakeContext(object):
+        project = {'type': 'Project', 'id': 1}
+        entity = {'type': 'Shot', 'id': 2}
+        task = {'type': 'Task', 'id': 3}
+        user = {'type': 'HumanUser', 'id': 4}
+
+    class CountingShotgun(object):
+        """
+        Records round trips instead of talking to a server.
+        """
+        def __init__(self):
+            self.calls = 0
+            self.created = []
+            self._ids = 0
+            self._lock = threading.Lock()
+
+        def _create(self, entity_type, data):
+            self._ids += 1
+            self.created.append(dict(data, type=entity_type, id=self._ids))
+            return self.created[-1]
+
+        def find(self, entity_type, filters, fields=None):
+            self.calls += 1
+            return []
+
+        def create(self, entity_type, data):
+            self.calls += 1
+            return self._create(entity_type, data)
+
+        def batch(self, requests):
+            self.calls += 1
+            return [self._create(each['entity_type'], each['data']) for each in requests]
+
+        def upload_thumbnail(self, entity_type, entity_id, path):
+            with self._lock:
+                self.calls += 1
+
+    ## an alembic depending on the scene published in the same run by path, read before and after submitting
+    fake = CountingShotgun()
+    fake_batch = PublishBatch(sg=fake, sg_factory=lambda: fake)
+    scene = fake_batch.add(context=FakeContext(), path='/projects/x/scene.v001.ma', name='scene.ma', version_number=1,
+                           published_file_type='Maya Scene')
+    cache = fake_batch.add(context=FakeContext(), path='/projects/x/cache.abc', name='cache.abc', version_number=1,
+                           published_file_type='Alembic Cache', dependency_paths=['/projects/x/./scene.v001.ma'])
+    assert repr(scene) == '<PendingPublish 1 queued>' and fake.calls == 0, 'repr submitted the batch'
+    try:
+        json.dumps(scene)
+        raise AssertionError('a queued publish serialised')
+    except TypeError:
+        pass
+    assert cache.get('id') and scene and not len(fake_batch), 'reading the publish didn\'t submit it'
+    links = [each for each in fake.created if each['type'] == 'PublishedFileDependency']
+    assert [(each['published_file']['id'], each['dependent_published_file']['id']) for each in links] == \
+        [(cache['id'], scene['id'])], 'the dependency on the queued scene was dropped: {}'.format(links)
+    print('pending publishes and queued dependency paths ok')
+
+    for item_count in [int(each) for each in sys.argv[1:]] or [30, 100, 200]:
+        ## register_publish: a type lookup, a create and a thumbnail upload for each item and a dependency create for
+        ## each item depending on the session
+        per_item = 1 + item_count * 2 + (item_count - 1)
+        fake = CountingShotgun()
+        fake_batch = PublishBatch(sg=fake, sg_factory=lambda: fake)
+        session = fake_batch.add(context=FakeContext(), path='/projects/x/scene.v001.ma', name='scene.ma',
+                                 version_number=1, published_file_type='Maya Scene', thumbnail_path='thumb.jpg')
+        for index in range(item_count - 1):
+            fake_batch.add(depends_on=[session], context=FakeContext(), path='/projects/x/cache{}.abc'.format(index),
+                           name='cache{}.abc'.format(index), version_number=1, published_file_type='Alembic Cache',
+                           thumbnail_path='thumb.jpg')
+        fake_batch.submit()
+        print('{} items: {} round trips one by one, {} batched ({} of them parallel thumbnail uploads)'.format(
+            item_count, per_item, fake.calls, item_count))
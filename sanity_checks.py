@@ -0,0 +1,275 @@
+"""
+Single traversal sanity check engine for the config_constants.SANITY profiles.
+
+Each SANITY profile (MDL_GENERIC, MDL_LND, RIG_GENERIC, SHD_GENERIC...) turns a set of checks on or off. Instead of
+every check walking the scene on its own, a profile is compiled into a plan that knows which node data the enabled
+checks need. The plan walks the DAG once, collects just that data into flat per node type buffers and then runs each
+check as a predicate over the buffers. Each check is timed so slow ones show up in the report.
+
+Usage:
+    plan = compile_plan('MDL_GENERIC')
+    report = plan.run()
+    for name, result in report['checks'].items():
+        print(name, result['failed'], result['time'])
+
+The checks only report, fixing things up (deleteIntermediate, removeNS etc) is still done by the publish tools
+using the failed node lists.
+"""
+import time
+from array import array
+from itertools import compress
+
+import config_constants as configCONST
+
+MESH_RENDER_FLAGS = ('castsShadows', 'receiveShadows', 'primaryVisibility', 'visibleInReflections',
+                     'visibleInRefractions')
+
+## check name: (buffer fields it needs, predicate taking the buffers and returning failed node names)
+CHECKS = {}
+## field name: (buffer it lives in, array typecode or None for a plain list)
+FIELDS = {
+    'xform_name': ('transforms', None),
+    'xform_identity': ('transforms', 'b'),
+    'xform_pivot_zero': ('transforms', 'b'),
+    'xform_shape_count': ('transforms', 'i'),
+    'xform_shape_named': ('transforms', 'b'),
+    'mesh_name': ('meshes', None),
+    'mesh_intermediate': ('meshes', 'b'),
+    'mesh_history': ('meshes', 'b'),
+    'mesh_instanced': ('meshes', 'b'),
+    'mesh_tweaks': ('meshes', 'b'),
+    'mesh_render_flags': ('meshes', 'b'),
+    'mesh_opposite': ('meshes', 'b'),
+    'mesh_shaded': ('meshes', 'b'),
+    'mesh_smooth_preview': ('meshes', 'b'),
+    'mesh_smooth_level': ('meshes', 'i'),
+    'mesh_smooth_tagged': ('meshes', 'b'),
+    'dag_name': ('dag', None),
+}
+SMOOTH_PREVIEW_LEVEL = 3
+SMOOTHED_ATTR = 'smoothed'
+
+
+def _check(name, *fields):
+    def _register(func):
+        CHECKS[name] = (fields, func)
+        return func
+    return _register
+
+
+def _not(flags):
+    return array('b', [not each for each in flags])
+
+
+def _real_meshes(b):
+    return _not(b['mesh_intermediate'])
+
+
+def _and(*flag_arrays):
+    return array('b', [all(each) for each in zip(*flag_arrays)])
+
+
+@_check('checkShapes', 'xform_name', 'xform_shape_count', 'xform_shape_named')
+def _check_shapes(b):
+    ## more than one real shape under a transform, or a single shape not named <transform>Shape
+    bad = array('b', [count > 1 or (count == 1 and not named)
+                      for count, named in zip(b['xform_shape_count'], b['xform_shape_named'])])
+    return list(compress(b['xform_name'], bad))
+
+
+@_check('history', 'mesh_name', 'mesh_intermediate', 'mesh_history')
+def _check_history(b):
+    return list(compress(b['mesh_name'], _and(_real_meshes(b), b['mesh_history'])))
+
+
+@_check('pivots', 'xform_name', 'xform_pivot_zero')
+def _check_pivots(b):
+    return list(compress(b['xform_name'], _not(b['xform_pivot_zero'])))
+
+
+@_check('freezeXFRM', 'xform_name', 'xform_identity', 'xform_shape_count')
+def _check_freeze(b):
+    ## only transforms holding geometry, groups are allowed to move
+    has_shapes = array('b', [count > 0 for count in b['xform_shape_count']])
+    return list(compress(b['xform_name'], _and(has_shapes, _not(b['xform_identity']))))
+
+
+@_check('smoothLvl', 'mesh_name', 'mesh_intermediate', 'mesh_smooth_preview', 'mesh_smooth_level')
+def _check_smooth_level(b):
+    ## smooth previewed meshes have to be set to the level lighting expects
+    wrong_level = array('b', [level != SMOOTH_PREVIEW_LEVEL for level in b['mesh_smooth_level']])
+    return list(compress(b['mesh_name'], _and(_real_meshes(b), b['mesh_smooth_preview'], wrong_level)))
+
+
+@_check('tagSmoothed', 'mesh_name', 'mesh_intermediate', 'mesh_smooth_preview', 'mesh_smooth_tagged')
+def _check_tag_smoothed(b):
+    return list(compress(b['mesh_name'], _and(_real_meshes(b), b['mesh_smooth_preview'],
+                                              _not(b['mesh_smooth_tagged']))))
+
+
+@_check('checkVerts', 'mesh_name', 'mesh_intermediate', 'mesh_tweaks')
+def _check_verts(b):
+    return list(compress(b['mesh_name'], _and(_real_meshes(b), b['mesh_tweaks'])))
+
+
+@_check('renderflags', 'mesh_name', 'mesh_intermediate', 'mesh_render_flags')
+def _check_render_flags(b):
+    return list(compress(b['mesh_name'], _and(_real_meshes(b), _not(b['mesh_render_flags']))))
+
+
+@_check('deleteIntermediate', 'mesh_name', 'mesh_intermediate')
+def _check_intermediate(b):
+    return list(compress(b['mesh_name'], b['mesh_intermediate']))
+
+
+@_check('turnOffOpposite', 'mesh_name', 'mesh_intermediate', 'mesh_opposite')
+def _check_opposite(b):
+    return list(compress(b['mesh_name'], _and(_real_meshes(b), b['mesh_opposite'])))
+
+
+@_check('instanceCheck', 'mesh_name', 'mesh_instanced')
+def _check_instances(b):
+    return list(compress(b['mesh_name'], b['mesh_instanced']))
+
+
+@_check('shaders', 'mesh_name', 'mesh_intermediate', 'mesh_shaded')
+def _check_shaders(b):
+    return list(compress(b['mesh_name'], _and(_real_meshes(b), _not(b['mesh_shaded']))))
+
+
+@_check('removeNS', 'dag_name')
+def _check_namespaces(b):
+    return [name for name in b['dag_name'] if ':' in name]
+
+
+@_check('lightingCleanup', 'xform_name')
+def _check_lighting_cleanup(b):
+    cleanup = set(each for each in configCONST.LIGHTINGCLEANUP if each)
+    return [name for name in b['xform_name'] if name.split('|')[-1] in cleanup]
+
+
+def _gather_buffers(fields):
+    """
+    Walks the DAG once and collects the requested fields.
+    :param fields: (set) of FIELDS names
+    :return: (dict) field name: array / list
+    """
+    import maya.api.OpenMaya as om2
+
+    buffers = {}
+    for field in fields:
+        typecode = FIELDS[field][1]
+        buffers[field] = array(typecode) if typecode else []
+
+    wanted = set(FIELDS[field][0] for field in fields)
+    want = fields.__contains__
+    identity = om2.MMatrix()
+    origin = om2.MPoint()
+
+    dag_it = om2.MItDag(om2.MItDag.kDepthFirst, om2.MFn.kInvalid)
+    while not dag_it.isDone():
+        dag_path = dag_it.getPath()
+        api_type = dag_path.apiType()
+
+        if 'dag' in wanted:
+            buffers['dag_name'].append(dag_path.partialPathName())
+
+        if 'transforms' in wanted and api_type == om2.MFn.kTransform:
+            fn_xform = om2.MFnTransform(dag_path)
+            if want('xform_name'):
+                buffers['xform_name'].append(dag_path.fullPathName())
+            if want('xform_identity'):
+                buffers['xform_identity'].append(fn_xform.transformationMatrix().isEquivalent(identity))
+            if want('xform_pivot_zero'):
+                buffers['xform_pivot_zero'].append(
+                    fn_xform.rotatePivot(om2.MSpace.kObject).isEquivalent(origin) and
+                    fn_xform.scalePivot(om2.MSpace.kObject).isEquivalent(origin))
+            if want('xform_shape_count') or want('xform_shape_named'):
+                shapes = []
+                for index in range(dag_path.childCount()):
+                    child = dag_path.child(index)
+                    if child.hasFn(om2.MFn.kShape) and not om2.MFnDagNode(child).isIntermediateObject:
+                        shapes.append(om2.MFnDagNode(child).name())
+                if want('xform_shape_count'):
+                    buffers['xform_shape_count'].append(len(shapes))
+                if want('xform_shape_named'):
+                    buffers['xform_shape_named'].append(
+                        len(shapes) == 1 and shapes[0] == '{}Shape'.format(fn_xform.name()))
+
+        elif 'meshes' in wanted and api_type == om2.MFn.kMesh:
+            fn_node = om2.MFnDagNode(dag_path)
+            plug = fn_node.findPlug
+            if want('mesh_name'):
+                buffers['mesh_name'].append(dag_path.fullPathName())
+            if want('mesh_intermediate'):
+                buffers['mesh_intermediate'].append(fn_node.isIntermediateObject)
+            if want('mesh_history'):
+                buffers['mesh_history'].append(plug('inMesh', False).isDestination)
+            if want('mesh_instanced'):
+                buffers['mesh_instanced'].append(dag_path.isInstanced())
+            if want('mesh_tweaks'):
+                buffers['mesh_tweaks'].append(plug('pnts', False).numElements() > 0)
+            if want('mesh_render_flags'):
+                buffers['mesh_render_flags'].append(all(plug(each, False).asBool() for each in MESH_RENDER_FLAGS))
+            if want('mesh_opposite'):
+                buffers['mesh_opposite'].append(plug('opposite', False).asBool())
+            if want('mesh_shaded'):
+                buffers['mesh_shaded'].append(plug('instObjGroups', False).elementByLogicalIndex(0).isSource)
+            if want('mesh_smooth_preview'):
+                buffers['mesh_smooth_preview'].append(plug('displaySmoothMesh', False).asInt() != 0)
+            if want('mesh_smooth_level'):
+                buffers['mesh_smooth_level'].append(plug('smoothLevel', False).asInt())
+            if want('mesh_smooth_tagged'):
+                buffers['mesh_smooth_tagged'].append(fn_node.hasAttribute(SMOOTHED_ATTR))
+
+        dag_it.next()
+
+    return buffers
+
+
+class SanityPlan(object):
+    """
+    The enabled checks of a profile and the scene data they need.
+    """
+
+    def __init__(self, checks):
+        """
+        :param checks: (list) of check names, see CHECKS
+        """
+        self.checks = [name for name in checks if name in CHECKS]
+        ## enabled in the profile but nothing to scan for eg coreArchives
+        self.unsupported = [name for name in checks if name not in CHECKS]
+        self.fields = set()
+        for name in self.checks:
+            self.fields.update(CHECKS[name][0])
+
+    def run(self, buffers=None):
+        """
+        :param buffers: (dict) pre-gathered buffers, by default the scene is walked
+        :return: (dict) report with the walk time and per check failed nodes and time
+        """
+        start = time.time()
+        if buffers is None:
+            buffers = _gather_buffers(self.fields) if self.fields else {}
+        report = {
+            'walk_time': time.time() - start,
+            'checks': {},
+            'unsupported': list(self.unsupported),
+        }
+
+        for name in self.checks:
+            check_start = time.time()
+            failed = CHECKS[name][1](buffers)
+            report['checks'][name] = {'failed': failed, 'time': time.time() - check_start}
+
+        report['total_time'] = time.time() - start
+        return report
+
+
+def compile_plan(profile):
+    """
+    :param profile: (str) a config_constants.SANITY profile name eg MDL_GENERIC, or a dict of check: enabled
+    :return: (SanityPlan)
+    """
+    settings = configCONST.SANITY[profile] if not isinstance(profile, dict) else profile
+    return SanityPlan(sorted(name for name, enabled in settings.items() if enabled))
@@ -0,0 +1,89 @@
+"""
+Scene change counter for memoising maya scene queries.
+
+Maya callbacks bump a counter whenever dag nodes are added or removed or a scene is opened or made new, so a query
+can be cached against change_count() and only run again once the scene has changed. watch_nodes() counts attribute
+changes on a few nodes as well, eg the intermediateObject toggle on the shape a cached answer came from, which no
+scene wide message covers.
+
+The callbacks live here rather than in the publish2 hooks because toolkit loads its hooks again every time its hook
+cache is cleared (an engine restart, a context switch), and callbacks registered by a hook module would be left behind
+by each load. This module is imported once per session, and install(force=True) / watch_nodes() remove the callbacks
+they registered before adding new ones.
+
+Usage:
+    scene_watch.install()
+    if cached[0] != scene_watch.change_count():
+        ...
+    scene_watch.watch_nodes([shape_mobject], ['intermediateObject'])
+"""
+import maya.api.OpenMaya as om2
+
+_STATE = {
+    'change_count': 0,
+    'callback_ids': [],
+    'node_callback_ids': [],
+}
+
+
+def _on_scene_changed(*args):
+    _STATE['change_count'] += 1
+
+
+def _remove(key):
+    for callback_id in _STATE[key]:
+        try:
+            om2.MMessage.removeCallback(callback_id)
+        except RuntimeError:
+            ## its node was deleted and maya dropped it already
+            pass
+    _STATE[key] = []
+
+
+def change_count():
+    """
+    :return: (int) bumped every time the scene changes
+    """
+    return _STATE['change_count']
+
+
+def install(force=False):
+    """
+    Installs the scene callbacks if they aren't installed already.
+    :param force: (bool) remove and install them again
+    """
+    if _STATE['callback_ids'] and not force:
+        return
+    _remove('callback_ids')
+    callback_ids = [
+        om2.MDGMessage.addNodeAddedCallback(_on_scene_changed, 'dagNode'),
+        om2.MDGMessage.addNodeRemovedCallback(_on_scene_changed, 'dagNode'),
+    ]
+    for message in (om2.MSceneMessage.kAfterOpen, om2.MSceneMessage.kAfterNew):
+        callback_ids.append(om2.MSceneMessage.addCallback(message, _on_scene_changed))
+    _STATE['callback_ids'] = callback_ids
+
+
+def uninstall():
+    """
+    Removes every callback installed here.
+    """
+    _remove('callback_ids')
+    _remove('node_callback_ids')
+
+
+def watch_nodes(nodes, attributes):
+    """
+    Counts setting any of attributes on any of nodes as a scene change, until the next call replaces the nodes.
+    :param nodes: (list) of MObject
+    :param attributes: (list) of long attribute names
+    """
+    _remove('node_callback_ids')
+    attributes = set(attributes)
+
+    def _on_attribute_changed(message, plug, other_plug, client_data):
+        if message & om2.MNodeMessage.kAttributeSet and plug.partialName(useLongNames=True) in attributes:
+            _on_scene_changed()
+
+    _STATE['node_callback_ids'] = [om2.MNodeMessage.addAttributeChangedCallback(node, _on_attribute_changed)
+                                   for node in nodes]
@@ -0,0 +1,284 @@
+"""
+Bulk folder creation for the core/schema tree.
+
+Toolkit creates folders one entity at a time, walking the schema and issuing a mkdir per node per entity. For a new
+project with hundreds of assets this is thousands of round trips to the file server. This module compiles the schema
+once, expands it in memory for a whole batch of entities, removes the duplicate paths and then creates the folders
+a depth level at a time on a pool of worker threads, so every mkdir only ever happens once and siblings are made in
+parallel.
+
+Entities are plain dicts, eg:
+    {'type': 'Asset', 'code': 'bob', 'sg_asset_type': 'Character', 'steps': ['Model', 'Rig']}
+    {'type': 'Shot', 'code': 'sh010', 'sg_sequence': 'sq010', 'steps': ['Anm', 'Light']}
+    {'type': 'Sequence', 'code': 'sq010'}
+
+Usage:
+    schema = compile_schema()
+    manifest = create_folders(schema, '/projects/myProject', entities, dry_run=True)
+    write_manifest(manifest, '/tmp/myProject_folders.json')
+"""
+import errno
+import json
+import os
+import shutil
+import time
+from multiprocessing.pool import ThreadPool
+
+try:
+    from tank_vendor import yaml
+except ImportError:
+    import yaml
+
+CONFIG_ROOT = os.path.dirname(os.path.abspath(__file__))
+SCHEMA_ROOT = os.path.join(CONFIG_ROOT, 'core', 'schema')
+DEFAULT_WORKERS = 16
+
+
+class SchemaNode(object):
+    """
+    One folder of the schema, with the config from its sibling yml.
+    """
+
+    def __init__(self, name, config=None):
+        self.name = name
+        self.config = config or {'type': 'static'}
+        self.children = []
+        self.files = []
+
+    @property
+    def type(self):
+        return self.config.get('type', 'static')
+
+    def deferred_for(self, engine):
+        """
+        :param engine: (str) the engine folders are being created for, None for no engine
+        :return: (bool) True if this folder should not be made for that engine
+        """
+        defer = self.config.get('defer_creation')
+        if not defer:
+            return False
+        if not isinstance(defer, (list, tuple)):
+            defer = [defer]
+        return engine not in defer
+
+
+def _read_ignore_files(schema_root):
+    path = os.path.join(schema_root, 'ignore_files')
+    ignored = set()
+    if os.path.isfile(path):
+        with open(path, 'r') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#'):
+                    ignored.add(line)
+    return ignored
+
+
+def compile_schema(schema_root=SCHEMA_ROOT):
+    """
+    Reads the schema tree once.
+    :param schema_root: (str) the core/schema folder
+    :return: (SchemaNode) the project node
+    """
+    ignored = _read_ignore_files(schema_root)
+
+    def load(dir_path, name):
+        config = None
+        yml_path = '{}.yml'.format(dir_path)
+        if os.path.isfile(yml_path):
+            with open(yml_path, 'r') as f:
+                config = yaml.safe_load(f)
+        node = SchemaNode(name, config)
+
+        for entry in sorted(os.listdir(dir_path)):
+            entry_path = os.path.join(dir_path, entry)
+            if os.path.isdir(entry_path):
+                node.children.append(load(entry_path, entry))
+            elif entry in ignored or entry.endswith('.yml'):
+                ## placeholders and the folder configs, toolkit never copies yml files either
+                continue
+            else:
+                node.files.append(entry_path)
+        return node
+
+    return load(os.path.join(schema_root, 'project'), 'project')
+
+
+def _entity_name(value):
+    """
+    Link fields come back from shotgun as dicts, allow both.
+    """
+    if isinstance(value, dict):
+        return value.get('code') or value.get('name')
+    return value
+
+
+def _filter_matches(entity, filters, bound):
+    for each in filters or []:
+        values = each.get('values') or []
+        if each.get('relation') != 'is' or not values:
+            continue
+        wanted = values[0]
+        if isinstance(wanted, str) and wanted.startswith('$'):
+            variable = wanted[1:]
+            ## everything in a batch belongs to the project being built
+            if variable == 'project':
+                continue
+            if variable not in bound:
+                continue
+            wanted = bound[variable]
+        if _entity_name(entity.get(each['path'])) != wanted:
+            return False
+    return True
+
+
+def _expand_values(node, entities, bound, list_values):
+    """
+    :return: (list) of (folder name, bound variables for the children) for a dynamic node
+    """
+    config = node.config
+    if node.type == 'shotgun_list_field':
+        field = config['field_name']
+        values = set(_entity_name(each.get(field)) for each in entities
+                     if each.get('type') == config['entity_type'] and each.get(field))
+        if not config.get('skip_unused', False):
+            values.update(list_values.get((config['entity_type'], field), []))
+        return [(value, dict(bound, **{node.name: value})) for value in sorted(values)]
+
+    if node.type == 'shotgun_entity':
+        name_field = config.get('name', 'code')
+        found = []
+        for each in entities:
+            if each.get('type') != config['entity_type']:
+                continue
+            if not _filter_matches(each, config.get('filters'), bound):
+                continue
+            value = _entity_name(each.get(name_field))
+            found.append((value, dict(bound, **{node.name: value, '_entity': each})))
+        return sorted(found, key=lambda item: item[0])
+
+    if node.type == 'shotgun_step':
+        entity = bound.get('_entity') or {}
+        return [(step, dict(bound, **{node.name: step})) for step in sorted(set(entity.get('steps') or []))]
+
+    raise ValueError('Unsupported schema folder type {!r} for {}'.format(node.type, node.name))
+
+
+def expand_schema(schema, project_path, entities, engine=None, include_deferred=False, list_values=None):
+    """
+    Expands the schema for a batch of entities entirely in memory.
+    :param schema: (SchemaNode) as returned by compile_schema
+    :param project_path: (str) the project folder on disk
+    :param entities: (list) of entity dicts, see the module docs
+    :param engine: (str) engine to make deferred folders for eg tk-maya
+    :param include_deferred: (bool) make every deferred folder regardless of engine
+    :param list_values: (dict) of (entity type, field): [values] for list fields that should create unused values
+    :return: (tuple) of (sorted unique folder paths, list of (source file, destination folder))
+    """
+    list_values = list_values or {}
+    folders = set([project_path])
+    files = []
+
+    def walk(node, path, bound):
+        for each_file in node.files:
+            files.append((each_file, path))
+
+        for child in node.children:
+            if not include_deferred and child.deferred_for(engine):
+                continue
+
+            if child.type == 'static':
+                expansions = [(child.name, bound)]
+            else:
+                expansions = _expand_values(child, entities, bound, list_values)
+
+            for folder_name, child_bound in expansions:
+                if not folder_name:
+                    continue
+                child_path = os.path.join(path, folder_name)
+                folders.add(child_path)
+                walk(child, child_path, child_bound)
+
+    walk(schema, project_path, {})
+    ## the same file can only land in a folder once
+    files = sorted(set(files))
+    return sorted(folders), files
+
+
+def _mkdir(path):
+    try:
+        os.mkdir(path)
+        return path, True
+    except OSError as e:
+        if e.errno == errno.EEXIST:
+            return path, False
+        raise
+
+
+def _copy_file(job):
+    source, folder = job
+    destination = os.path.join(folder, os.path.basename(source))
+    if os.path.exists(destination):
+        return destination, False
+    shutil.copy(source, destination)
+    return destination, True
+
+
+def create_folders(schema, project_path, entities, engine=None, include_deferred=False, list_values=None,
+                   dry_run=False, workers=DEFAULT_WORKERS):
+    """
+    Expands the schema for the entities and creates everything that is missing.
+
+    Folders are made shallowest first, one depth level at a time, so each level only needs a single mkdir per
+    folder and every folder in a level can be made in parallel.
+    :param dry_run: (bool) work out what would be made without touching the disk
+    :param workers: (int) size of the worker pool
+    :return: (dict) manifest of the work done
+    """
+    start = time.time()
+    folders, files = expand_schema(schema, project_path, entities, engine=engine,
+                                   include_deferred=include_deferred, list_values=list_values)
+    manifest = {
+        'project_path': project_path,
+        'entity_count': len(entities),
+        'dry_run': dry_run,
+        'folders': folders,
+        'files': [os.path.join(folder, os.path.basename(source)) for source, folder in files],
+        'created_folders': [],
+        'created_files': [],
+    }
+
+    if not dry_run:
+        by_depth = {}
+        for path in folders:
+            by_depth.setdefault(path.rstrip(os.sep).count(os.sep), []).append(path)
+
+        ## the project folder parents are not part of the schema
+        parent = os.path.dirname(project_path.rstrip(os.sep))
+        if parent and not os.path.isdir(parent):
+            os.makedirs(parent)
+
+        pool = ThreadPool(workers)
+        try:
+            for depth in sorted(by_depth):
+                for path, created in pool.map(_mkdir, by_depth[depth]):
+                    if created:
+                        manifest['created_folders'].append(path)
+            for path, created in pool.map(_copy_file, files):
+                if created:
+                    manifest['created_files'].append(path)
+        finally:
+            pool.close()
+            pool.join()
+
+    manifest['elapsed'] = time.time() - start
+    return manifest
+
+
+def write_manifest(manifest, path):
+    """
+    Writes a manifest returned by create_folders to disk as json.
+    """
+    with open(path, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    return path
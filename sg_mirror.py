@@ -0,0 +1,612 @@
+"""
+Local SQLite mirror of the shotgun entities the loader, shotgun panel and breakdown ask for.
+
+Every session used to pull the full Asset / Shot / Task / PublishedFile trees for the project from the server. The
+mirror keeps them per project in TEMP_FOLDER/sgMirror/{project id}.sqlite and brings them up to date by asking only
+for what changed since the last sync:
+    - each entity type is synced by updated_at, with a little overlap so rows saved in the same second aren't missed
+    - deletions don't bump updated_at, so every RECONCILE_INTERVAL the ids alone are fetched and anything the server
+      no longer has is dropped
+    - a sync within SYNC_INTERVAL of the last one is skipped, however many tools ask for one
+
+The mirror is synced from one place, not from every session: a single scheduled job (cron / task scheduler on a
+pipeline box, every few minutes) runs `python sg_mirror.py sync <project id>`, which syncs its own local copy and
+publishes it to configCONST.SG_MIRROR_SHARED_FOLDER. Sessions only ever copy that file down, get_mirror() does it the
+first time a project's mirror is asked for and refresh() does it again when the shared copy has moved on. Nothing
+in a session talks to the server for the mirror.
+
+hierarchy() builds the loader2 trees eg [sg_asset_type, code] and publishes() / latest_publish() answer the publish
+queries, straight from local disk. find() takes the usual shotgun filters for the simple operators and raises
+SgMirrorError for anything it can't answer so the caller can go to the server instead.
+
+Datetimes come back as iso strings, everything else as shotgun returns it.
+
+FakeShotgun answers find() from a list of records, it stands in for the server in the check and the bench.
+
+Usage:
+    mirror = get_mirror(context.project['id'])
+    tree = mirror.hierarchy('Asset', ['sg_asset_type', 'code'])
+    publishes = mirror.publishes(context.entity, [['sg_status_list', 'is_not', None]])
+
+    python sg_mirror.py sync project_id [project_id ...]    the scheduled job, syncs and publishes the mirrors
+    python sg_mirror.py check                                syncs a FakeShotgun and checks the deltas and queries
+    python sg_mirror.py bench [assets]                       syncs a fake project and times the queries
+"""
+import calendar
+import datetime
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import time
+
+import config_constants as configCONST
+
+MIRROR_FOLDER_NAME = 'sgMirror'
+## entity type: the fields mirrored for it
+MIRROR_ENTITIES = {
+    'Sequence': ['code', 'project', 'sg_status_list', 'description', 'image'],
+    'Asset': ['code', 'project', 'sg_asset_type', 'sg_status_list', 'description', 'image'],
+    'Shot': ['code', 'project', 'sg_sequence', 'sg_status_list', 'description', 'image',
+             'sg_cut_in', 'sg_cut_out'],
+    'Task': ['content', 'project', 'entity', 'step', 'task_assignees', 'sg_status_list', 'due_date'],
+    'PublishedFile': ['code', 'name', 'project', 'entity', 'task', 'version_number', 'published_file_type', 'path',
+                      'sg_status_list', 'description', 'created_at', 'created_by', 'image', 'version'],
+}
+## seconds between syncs, tools opening within this share the last one
+SYNC_INTERVAL = 60
+## seconds of overlap on the updated_at filter
+SYNC_OVERLAP = 5
+## seconds between fetching every id to drop the deleted entities
+RECONCILE_INTERVAL = 60 * 60
+SQLITE_TIMEOUT = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entities (
+    type TEXT NOT NULL,
+    id INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    entity_type TEXT,
+    entity_id INTEGER,
+    data TEXT NOT NULL,
+    PRIMARY KEY (type, id)
+);
+CREATE INDEX IF NOT EXISTS entities_entity ON entities (type, entity_type, entity_id);
+CREATE TABLE IF NOT EXISTS sync_state (
+    type TEXT PRIMARY KEY,
+    updated_at REAL,
+    synced REAL,
+    reconciled REAL
+);
+"""
+
+try:
+    string_types = basestring
+except NameError:
+    string_types = str
+
+
+class SgMirrorError(Exception):
+    pass
+
+
+def _epoch(value):
+    """
+    :param value: (datetime) aware as shotgun_api3 returns them, or naive local time
+    """
+    if value.tzinfo is None:
+        return time.mktime(value.timetuple()) + value.microsecond / 1000000.0
+    return calendar.timegm(value.utctimetuple()) + value.microsecond / 1000000.0
+
+
+def _json_default(value):
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        return value.isoformat()
+    raise TypeError('{!r} is not json serializable'.format(value))
+
+
+def _link_key(value):
+    if isinstance(value, dict) and 'id' in value:
+        return (value.get('type'), value['id'])
+    return value
+
+
+def _label(value):
+    if isinstance(value, dict):
+        return value.get('name') or value.get('code') or str(value.get('id'))
+    return value
+
+
+def _compare(value, operator, expected):
+    if operator in ('is', 'is_not'):
+        if isinstance(value, list):
+            ## multi entity fields eg task_assignees, 'is' means contains
+            found = _link_key(expected) in [_link_key(each) for each in value]
+        else:
+            found = _link_key(value) == _link_key(expected)
+        return found if operator == 'is' else not found
+    if operator in ('in', 'not_in'):
+        keys = [_link_key(each) for each in expected]
+        values = value if isinstance(value, list) else [value]
+        found = any(_link_key(each) in keys for each in values)
+        return found if operator == 'in' else not found
+    if operator == 'contains':
+        return value is not None and expected.lower() in value.lower()
+    if operator in ('greater_than', 'less_than'):
+        if value is None:
+            return False
+        return value > expected if operator == 'greater_than' else value < expected
+    raise SgMirrorError('Operator {} is not supported by the mirror'.format(operator))
+
+
+def matches(record, filters):
+    """
+    :param filters: (list) of [field, operator, value] all of which must match, dotted fields aren't supported
+    :return: (bool)
+    """
+    for each in filters or []:
+        if not isinstance(each, (list, tuple)) or len(each) != 3 or '.' in each[0]:
+            raise SgMirrorError('Filter {} is not supported by the mirror'.format(each))
+        if each[0] not in record and each[0] not in ('id', 'type'):
+            raise SgMirrorError('Field {} is not mirrored'.format(each[0]))
+        if not _compare(record.get(each[0]), each[1], each[2]):
+            return False
+    return True
+
+
+def resolve_filters(filters, context):
+    """
+    Fills in the {context.project} / {context.user} / {context.entity} tokens the app settings use.
+    """
+    tokens = {
+        '{context.project}': context.project,
+        '{context.user}': context.user,
+        '{context.entity}': context.entity,
+    }
+    resolved = []
+    for field, operator, value in filters or []:
+        if isinstance(value, string_types) and value in tokens:
+            value = tokens[value]
+        resolved.append([field, operator, value])
+    return resolved
+
+
+def mirror_path(project_id):
+    return os.path.join(configCONST.TEMP_FOLDER, MIRROR_FOLDER_NAME, '{}.sqlite'.format(project_id))
+
+
+def shared_path(project_id):
+    return os.path.join(configCONST.SG_MIRROR_SHARED_FOLDER, '{}.sqlite'.format(project_id))
+
+
+def _copy_over(source, dest):
+    ## copy2 keeps the mtime, which is how pull() tells the copies apart
+    tmp_path = '{}.{}.tmp'.format(dest, os.getpid())
+    shutil.copy2(source, tmp_path)
+    if os.path.isfile(dest):
+        os.remove(dest)
+    os.rename(tmp_path, dest)
+
+
+class ShotgunMirror(object):
+    def __init__(self, project_id, path=None, entities=None):
+        """
+        :param project_id: (int) the project being mirrored
+        :param path: (str) sqlite file, defaults to mirror_path(project_id)
+        :param entities: (dict) of entity type: fields, defaults to MIRROR_ENTITIES
+        """
+        self.project_id = project_id
+        self.path = path or mirror_path(project_id)
+        self.entities = MIRROR_ENTITIES if entities is None else entities
+        self._lock = threading.Lock()
+        self._pulled = 0
+        folder = os.path.dirname(self.path)
+        if folder and not os.path.isdir(folder):
+            os.makedirs(folder)
+        connection = self._connect()
+        try:
+            connection.executescript(SCHEMA)
+        finally:
+            connection.close()
+
+    def _connect(self):
+        ## a connection per call, the mirror is used from the ui thread and the sync thread
+        return sqlite3.connect(self.path, timeout=SQLITE_TIMEOUT)
+
+    def _state(self, connection, entity_type):
+        row = connection.execute('SELECT updated_at, synced, reconciled FROM sync_state WHERE type = ?',
+                                 (entity_type,)).fetchone()
+        return row or (None, None, None)
+
+    def sync(self, sg, force=False):
+        """
+        Pulls everything that changed on the server since the last sync.
+        :param sg: (Shotgun) connection, or anything with the same find()
+        :param force: (bool) sync even if the last one was within SYNC_INTERVAL
+        :return: (dict) of entity type: number of entities updated, -1 for skipped types
+        """
+        report = {}
+        with self._lock:
+            connection = self._connect()
+            try:
+                for entity_type, fields in self.entities.items():
+                    report[entity_type] = self._sync_type(connection, sg, entity_type, fields, force)
+            finally:
+                connection.close()
+        return report
+
+    def _sync_type(self, connection, sg, entity_type, fields, force):
+        now = time.time()
+        last_updated, synced, reconciled = self._state(connection, entity_type)
+        if not force and synced is not None and now - synced < SYNC_INTERVAL:
+            return -1
+
+        project = {'type': 'Project', 'id': self.project_id}
+        filters = [['project', 'is', project]]
+        if last_updated is not None:
+            since = datetime.datetime.fromtimestamp(last_updated - SYNC_OVERLAP)
+            filters.append(['updated_at', 'greater_than', since])
+        records = sg.find(entity_type, filters, list(fields) + ['updated_at'], order=[
+            {'field_name': 'updated_at', 'direction': 'asc'}])
+
+        rows = []
+        newest = last_updated
+        for record in records:
+            updated_at = _epoch(record['updated_at'])
+            newest = updated_at if newest is None else max(newest, updated_at)
+            link = record.get('entity') or {}
+            rows.append((entity_type, record['id'], updated_at, link.get('type'), link.get('id'),
+                         json.dumps(record, default=_json_default)))
+
+        stale_ids = []
+        full = last_updated is None
+        if not full and (reconciled is None or now - reconciled >= RECONCILE_INTERVAL):
+            server_ids = set(each['id'] for each in sg.find(entity_type, [['project', 'is', project]], ['id']))
+            local_ids = [row[0] for row in connection.execute('SELECT id FROM entities WHERE type = ?',
+                                                              (entity_type,))]
+            stale_ids = [(entity_type, each) for each in local_ids if each not in server_ids]
+            full = True
+
+        with connection:
+            if last_updated is None:
+                connection.execute('DELETE FROM entities WHERE type = ?', (entity_type,))
+            connection.executemany('INSERT OR REPLACE INTO entities (type, id, updated_at, entity_type, entity_id, data) '
+                                   'VALUES (?, ?, ?, ?, ?, ?)', rows)
+            connection.executemany('DELETE FROM entities WHERE type = ? AND id = ?', stale_ids)
+            connection.execute('INSERT OR REPLACE INTO sync_state (type, updated_at, synced, reconciled) '
+                               'VALUES (?, ?, ?, ?)', (entity_type, newest, now, now if full else reconciled))
+        return len(rows)
+
+    def sync_async(self, sg_factory):
+        """
+        Syncs on a daemon thread.
+        :param sg_factory: (callable) returning a shotgun connection for the thread, connections aren't thread safe
+        :return: (threading.Thread)
+        """
+        def _run():
+            try:
+                self.sync(sg_factory())
+            except Exception as e:
+                print('Shotgun mirror sync failed for project {}: {}'.format(self.project_id, e))
+
+        thread = threading.Thread(target=_run, name='ShotgunMirror')
+        thread.daemon = True
+        thread.start()
+        return thread
+
+    def publish(self, path=None):
+        """
+        Copies the mirror to the shared folder for the sessions to pull, only the sync job does this.
+        :param path: (str) defaults to shared_path(project_id)
+        """
+        path = path or shared_path(self.project_id)
+        folder = os.path.dirname(path)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        with self._lock:
+            _copy_over(self.path, path)
+
+    def pull(self, path=None):
+        """
+        Copies the shared mirror down if it isn't the copy already here.
+        :param path: (str) defaults to shared_path(project_id)
+        :return: (bool) True if a new copy was pulled
+        """
+        path = path or shared_path(self.project_id)
+        try:
+            shared_mtime = os.path.getmtime(path)
+        except OSError:
+            return False
+        with self._lock:
+            ## python 2's copy2 doesn't keep the mtime to the nanosecond
+            if os.path.isfile(self.path) and abs(os.path.getmtime(self.path) - shared_mtime) < 0.01:
+                return False
+            _copy_over(path, self.path)
+        return True
+
+    def refresh(self):
+        """
+        pull() at most once per SYNC_INTERVAL, for tools to call before they read.
+        :return: (bool) True if a new copy was pulled
+        """
+        now = time.time()
+        if now - self._pulled < SYNC_INTERVAL:
+            return False
+        self._pulled = now
+        return self.pull()
+
+    def is_synced(self, entity_type):
+        connection = self._connect()
+        try:
+            return self._state(connection, entity_type)[1] is not None
+        finally:
+            connection.close()
+
+    def _records(self, entity_type, filters):
+        if entity_type not in self.entities:
+            raise SgMirrorError('{} is not mirrored'.format(entity_type))
+        query = 'SELECT data FROM entities WHERE type = ?'
+        args = [entity_type]
+        for each in filters or []:
+            ## publishes and tasks are nearly always asked for by their entity, that one's indexed
+            if (isinstance(each, (list, tuple)) and len(each) == 3 and each[0] == 'entity' and each[1] == 'is' and
+                    isinstance(each[2], dict)):
+                query += ' AND entity_type = ? AND entity_id = ?'
+                args.extend([each[2].get('type'), each[2].get('id')])
+                break
+        connection = self._connect()
+        try:
+            return [json.loads(row[0]) for row in connection.execute(query, args)]
+        finally:
+            connection.close()
+
+    def find(self, entity_type, filters, fields=None):
+        """
+        :param fields: (list) to return, all mirrored fields by default
+        :return: (list) of entity dicts as sg.find() would return them
+        """
+        results = [record for record in self._records(entity_type, filters) if matches(record, filters)]
+        if fields is None:
+            return results
+        keep = set(fields) | set(['type', 'id'])
+        return [dict((key, value) for key, value in record.items() if key in keep) for record in results]
+
+    def hierarchy(self, entity_type, fields, filters=None):
+        """
+        Groups the entities the way the loader2 entities setting does eg [sg_asset_type, code].
+        :return: (dict) nested by the label of each field but the last, down to lists of entities sorted by the
+                 last field
+        """
+        tree = {}
+        records = self.find(entity_type, filters)
+        records.sort(key=lambda record: [str(_label(record.get(field)) or '') for field in fields])
+        for record in records:
+            branch = tree
+            for field in fields[:-1]:
+                branch = branch.setdefault(_label(record.get(field)), {})
+            branch.setdefault(None, []).append(record)
+        return tree
+
+    def publishes(self, entity=None, filters=None):
+        """
+        :param entity: (dict) only publishes linked to it
+        :param filters: (list) eg the loader2 publish_filters
+        :return: (list) newest version first
+        """
+        filters = list(filters or [])
+        if entity is not None:
+            filters.append(['entity', 'is', entity])
+        results = self.find('PublishedFile', filters)
+        results.sort(key=lambda record: record.get('version_number') or 0, reverse=True)
+        return results
+
+    def latest_publish(self, entity, name, published_file_type=None, task=None):
+        """
+        The newest version of a publish, what the breakdown compares scene references against.
+        :return: (dict) or None
+        """
+        filters = [['name', 'is', name]]
+        if published_file_type is not None:
+            filters.append(['published_file_type', 'is', published_file_type])
+        if task is not None:
+            filters.append(['task', 'is', task])
+        results = self.publishes(entity, filters)
+        return results[0] if results else None
+
+
+class FakeShotgun(object):
+    """
+    Just enough of the Shotgun api for the mirror to sync from, backed by a list of records.
+    """
+    def __init__(self, records=None):
+        self.records = records or []
+        self.calls = 0
+        ## (entity type, filters, number of records returned) for every find()
+        self.finds = []
+
+    def create(self, entity_type, data):
+        record = dict(data, type=entity_type, id=len(self.records) + 1)
+        record.setdefault('updated_at', datetime.datetime.now())
+        self.records.append(record)
+        return record
+
+    def update(self, entity_type, entity_id, data):
+        for record in self.records:
+            if record['type'] == entity_type and record['id'] == entity_id:
+                record.update(data)
+                record['updated_at'] = datetime.datetime.now()
+                return record
+
+    def delete(self, entity_type, entity_id):
+        ## like the server, deleting doesn't leave anything with a newer updated_at behind
+        self.records = [record for record in self.records
+                        if not (record['type'] == entity_type and record['id'] == entity_id)]
+        return True
+
+    def find(self, entity_type, filters, fields=None, order=None):
+        self.calls += 1
+        results = [record for record in self.records
+                   if record['type'] == entity_type and matches(record, filters)]
+        for each in order or []:
+            results.sort(key=lambda record: record.get(each['field_name']), reverse=each['direction'] == 'desc')
+        self.finds.append((entity_type, filters, len(results)))
+        keep = set(fields or []) | set(['type', 'id'])
+        return [dict((key, record.get(key)) for key in keep) for record in results]
+
+
+_MIRRORS = {}
+
+
+def get_mirror(project_id):
+    """
+    :return: (ShotgunMirror) for the project, one per session, pulled from the shared folder
+    """
+    if project_id not in _MIRRORS:
+        mirror = ShotgunMirror(project_id)
+        mirror.refresh()
+        _MIRRORS[project_id] = mirror
+    return _MIRRORS[project_id]
+
+
+def sync_shared(project_ids, sg):
+    """
+    The scheduled job, syncs each project's mirror from the server and publishes it for the sessions.
+    :return: (dict) of project id: sync report
+    """
+    reports = {}
+    for project_id in project_ids:
+        mirror = ShotgunMirror(project_id)
+        reports[project_id] = mirror.sync(sg)
+        mirror.publish()
+    return reports
+
+
+if __name__ == '__main__':
+    import sys
+    import tempfile
+
+    if len(sys.argv) > 2 and sys.argv[1] == 'sync':
+        sys.path.append(configCONST.TANKCORE_PYTHON_PATH)
+        from tank_vendor import shotgun_api3
+        script_sg = shotgun_api3.Shotgun(configCONST.SHOTGUN_URL, script_name=configCONST.SHOTGUN_TOOLKIT_NAME,
+                                         api_key=configCONST.SHOTGUN_TOOLKIT_API_KEY)
+        for synced_id, synced in sorted(sync_shared([int(each) for each in sys.argv[2:]], script_sg).items()):
+            print('project {} {}'.format(synced_id, json.dumps(synced, sort_keys=True)))
+        sys.exit(0)
+    if len(sys.argv) > 1 and sys.argv[1] == 'check':
+        check_project = {'type': 'Project', 'id': 1, 'name': 'check'}
+        other_project = {'type': 'Project', 'id': 2, 'name': 'other'}
+        last_week = datetime.datetime.now() - datetime.timedelta(days=7)
+        ## a minute apart, so only the newest of each type falls in the SYNC_OVERLAP of the next sync
+        stamps = [last_week + datetime.timedelta(minutes=each) for each in range(8)]
+        fake = FakeShotgun()
+        hero = fake.create('Asset', {'code': 'hero', 'project': check_project, 'sg_asset_type': 'CHAR',
+                                     'sg_status_list': 'ip', 'updated_at': stamps[0]})
+        chair = fake.create('Asset', {'code': 'chair', 'project': check_project, 'sg_asset_type': 'PROP',
+                                      'sg_status_list': 'ip', 'updated_at': stamps[1]})
+        fake.create('Asset', {'code': 'lamp', 'project': check_project, 'sg_asset_type': 'PROP',
+                              'sg_status_list': 'ip', 'updated_at': stamps[2]})
+        fake.create('Asset', {'code': 'elsewhere', 'project': other_project, 'sg_asset_type': 'PROP',
+                              'sg_status_list': 'ip', 'updated_at': stamps[3]})
+        hero_link = {'type': 'Asset', 'id': hero['id'], 'name': 'hero'}
+        for version, status in ((1, 'cmpt'), (2, 'cmpt'), (3, None)):
+            fake.create('PublishedFile', {'code': 'hero_rig', 'name': 'hero_rig', 'project': check_project,
+                                          'entity': hero_link, 'version_number': version, 'sg_status_list': status,
+                                          'updated_at': stamps[3 + version]})
+        fake.create('PublishedFile', {'code': 'chair_model', 'name': 'chair_model', 'project': check_project,
+                                      'entity': {'type': 'Asset', 'id': chair['id'], 'name': 'chair'},
+                                      'version_number': 1, 'sg_status_list': 'cmpt', 'updated_at': stamps[7]})
+
+        check_folder = tempfile.mkdtemp()
+        check_entities = {'Asset': MIRROR_ENTITIES['Asset'], 'PublishedFile': MIRROR_ENTITIES['PublishedFile']}
+        mirror = ShotgunMirror(1, os.path.join(check_folder, 'local.sqlite'), entities=check_entities)
+        try:
+            ## the first sync pulls the whole project and only that project
+            assert mirror.sync(fake) == {'Asset': 3, 'PublishedFile': 4}, 'full sync'
+            assert all(len(filters) == 1 for (_, filters, _) in fake.finds), 'the first sync filtered on updated_at'
+
+            ## within SYNC_INTERVAL nothing goes to the server
+            calls = fake.calls
+            assert mirror.sync(fake) == {'Asset': -1, 'PublishedFile': -1} and fake.calls == calls, 'skipped sync'
+
+            ## a forced sync only fetches what changed since the last one, plus lamp and chair_model again as the
+            ## newest of their type are inside the overlap
+            fake.update('Asset', chair['id'], {'sg_status_list': 'omt'})
+            fake.create('Asset', {'code': 'table', 'project': check_project, 'sg_asset_type': 'PROP',
+                                  'sg_status_list': 'ip'})
+            del fake.finds[:]
+            delta = mirror.sync(fake, force=True)
+            assert delta == {'Asset': 3, 'PublishedFile': 1}, 'delta sync {}'.format(delta)
+            assert all(filters[-1][:2] == ['updated_at', 'greater_than'] for (_, filters, _) in fake.finds), \
+                'the delta sync didn\'t filter on updated_at: {}'.format(fake.finds)
+            assert mirror.find('Asset', [['id', 'is', chair['id']]])[0]['sg_status_list'] == 'omt', 'update missed'
+
+            ## deletes are only noticed by the reconcile, bring it forward rather than wait an hour
+            fake.delete('Asset', hero['id'])
+            connection = mirror._connect()
+            with connection:
+                connection.execute('UPDATE sync_state SET reconciled = 0')
+            connection.close()
+            mirror.sync(fake, force=True)
+            assert not mirror.find('Asset', [['code', 'is', 'hero']]), 'deleted asset kept'
+
+            ## the loader2 hierarchy and publish queries
+            tree = mirror.hierarchy('Asset', ['sg_asset_type', 'code'])
+            assert sorted(tree) == ['PROP'], tree
+            assert [each['code'] for each in tree['PROP'][None]] == ['chair', 'lamp', 'table'], tree
+            found = mirror.publishes(hero_link, [['sg_status_list', 'is_not', None]])
+            assert [each['version_number'] for each in found] == [2, 1], found
+            assert mirror.latest_publish(hero_link, 'hero_rig')['version_number'] == 3, 'latest publish'
+            assert mirror.latest_publish(hero_link, 'chair_model') is None, 'latest publish of another entity'
+            try:
+                mirror.find('Asset', [['code', 'starts_with', 'c']])
+                raise AssertionError('an unsupported filter was answered')
+            except SgMirrorError:
+                pass
+
+            ## sessions pull the job's copy without going to the server
+            shared = os.path.join(check_folder, 'shared', '1.sqlite')
+            mirror.publish(shared)
+            session = ShotgunMirror(1, os.path.join(check_folder, 'session.sqlite'), entities=check_entities)
+            ## pull() tells the copies apart by mtime, date the session's empty one back to a previous day's run
+            os.utime(session.path, (time.time() - 60 * 60 * 24, time.time() - 60 * 60 * 24))
+            assert session.pull(shared) and not session.pull(shared), 'pull'
+            assert len(session.find('Asset', [])) == 3, 'pulled mirror'
+        finally:
+            shutil.rmtree(check_folder)
+        print('delta sync, reconcile, hierarchy, publish queries and pull ok')
+        sys.exit(0)
+    if len(sys.argv) < 2 or sys.argv[1] != 'bench':
+        print('usage: python sg_mirror.py sync project_id [project_id ...] | check | bench [assets]')
+        sys.exit(1)
+    asset_count = int(sys.argv[2]) if len(sys.argv) > 2 else 5000
+    fake_project = {'type': 'Project', 'id': 1, 'name': 'bench'}
+    fake = FakeShotgun()
+    yesterday = datetime.datetime.now() - datetime.timedelta(days=1)
+    asset_types = ['CHAR', 'PROP', 'BLD', 'LND', 'VEH']
+    for index in range(asset_count):
+        asset = fake.create('Asset', {'code': 'asset{:05d}'.format(index), 'project': fake_project,
+                                      'sg_asset_type': asset_types[index % len(asset_types)],
+                                      'sg_status_list': 'ip',
+                                      'updated_at': yesterday + datetime.timedelta(seconds=index)})
+        for version in range(1, 4):
+            fake.create('PublishedFile', {'code': asset['code'], 'name': asset['code'], 'project': fake_project,
+                                          'entity': {'type': 'Asset', 'id': asset['id'], 'name': asset['code']},
+                                          'version_number': version, 'sg_status_list': 'cmpt',
+                                          'updated_at': yesterday + datetime.timedelta(seconds=index)})
+
+    bench_path = os.path.join(tempfile.mkdtemp(), 'bench.sqlite')
+    mirror = ShotgunMirror(1, bench_path, entities={'Asset': MIRROR_ENTITIES['Asset'],
+                                                    'PublishedFile': MIRROR_ENTITIES['PublishedFile']})
+    start = time.time()
+    print('full sync {} in {:.3f}s'.format(mirror.sync(fake), time.time() - start))
+    fake.create('Asset', {'code': 'late', 'project': fake_project, 'sg_asset_type': 'PROP'})
+    start = time.time()
+    print('delta sync {} in {:.3f}s'.format(mirror.sync(fake, force=True), time.time() - start))
+    start = time.time()
+    asset_tree = mirror.hierarchy('Asset', ['sg_asset_type', 'code'])
+    print('hierarchy of {} types in {:.3f}s'.format(len(asset_tree), time.time() - start))
+    start = time.time()
+    found = mirror.publishes({'type': 'Asset', 'id': 1}, [['sg_status_list', 'is_not', None]])
+    print('{} publishes in {:.3f}s'.format(len(found), time.time() - start))
@@ -0,0 +1,486 @@
+"""
+Background, deduplicating snapshot store for tk-multi-snapshot.
+
+Every quickdaily runs snapshot_app.snapshot() which copies the whole work file into the maya_*_snapshot path while
+the artist waits, a 1GB scene freezes maya for as long as the copy takes. Most of those snapshots are of a work file
+that has barely changed, or not at all, since the last one. The copy_file hook hands snapshots to this store:
+    - a work file that hasn't changed (same size and mtime as one already stored) isn't read at all, the snapshot is
+      hardlinked to the stored copy straight away
+    - anything else is pinned as it was when the artist clicked with a hardlink in .store/pins, which costs nothing
+      however big the scene is, and copied from the pin on a background thread. A save that writes a new file over
+      the work file leaves the pin as it was. Where the pin can't be taken (no hardlinks) the copy is made from the
+      work file itself, and a snapshot whose source was saved in place before the copy finished is logged as
+      drifted
+    - the copy is written to a .part file and renamed, so a snapshot is either all there or not there at all
+    - snapshots of the same work file queued back to back, eg a burst of dailies, are merged: only the latest is
+      copied and the earlier snapshots are hardlinked to it, so they hold the scene as of the last click of the burst
+    - once copied the snapshot is hashed and either replaced by a hardlink to an identical object in the .store
+      folder next to the snapshots, or becomes that object. Where the share can't hardlink there's nothing to
+      deduplicate with and the snapshot is left a plain copy
+
+Only snapshot files are ever stored as objects, never the work file, and tk-multi-snapshot never writes to a snapshot
+once it's taken, so nothing saved later can change a stored object. Restoring a snapshot (the hook copying out of the
+snapshots folder) waits for that snapshot's copy if it's still queued, then is a plain copy, the app reopens the work
+file straight after.
+
+Each snapshot appends a line to .store/stats.jsonl with how long the artist waited and the bytes copied / saved,
+summarise() totals them up.
+
+From the tk-multi-snapshot copy_file hook:
+    snapshot_store.get_queue().submit(source_path, target_path)
+    snapshot_store.get_queue().wait_for(snapshot_path)
+
+    python snapshot_store.py report snapshots_folder [days]    totals of the logged stats, default the last 7 days
+    python snapshot_store.py bench [snapshots] [megabytes]     plain copies vs the store for a simulated week
+"""
+import atexit
+import errno
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+try:
+    import Queue as queue
+except ImportError:
+    import queue
+
+STORE_NAME = '.store'
+STATS_NAME = 'stats.jsonl'
+PINS_NAME = 'pins'
+## the folder the maya_*_snapshot templates write to
+SNAPSHOT_FOLDER_NAME = 'snapshots'
+COPY_CHUNK_SIZE = 4 * 1024 * 1024
+QUEUE_SIZE = 16
+
+
+def _stat_key(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime
+
+
+def is_snapshot_path(path):
+    """
+    :return: (bool) True if path is in a snapshots folder
+    """
+    return os.path.basename(os.path.dirname(os.path.abspath(path))) == SNAPSHOT_FOLDER_NAME
+
+
+def _makedirs(folder):
+    if not os.path.isdir(folder):
+        try:
+            os.makedirs(folder)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+
+
+def _replace_with_link(source, target):
+    """
+    Swaps target for a hardlink to source without target ever going missing.
+    :return: (bool) True if linked, False if the filesystem can't hardlink and target was left alone
+    """
+    tmp_path = '{}.{}.link'.format(target, threading.current_thread().ident)
+    try:
+        os.link(source, tmp_path)
+    except (OSError, AttributeError):
+        return False
+    _rename(tmp_path, target)
+    return True
+
+
+def _rename(source, target):
+    try:
+        os.rename(source, target)
+    except OSError:
+        ## windows won't rename over an existing file
+        os.remove(target)
+        os.rename(source, target)
+
+
+def _link_new(source, target):
+    try:
+        os.link(source, target)
+        return True
+    except (OSError, AttributeError):
+        return False
+
+
+def _same_file(first, second):
+    ## os.path.samefile isn't there on windows python 2
+    first_stat, second_stat = os.stat(first), os.stat(second)
+    return (first_stat.st_dev, first_stat.st_ino) == (second_stat.st_dev, second_stat.st_ino)
+
+
+def _hash_file(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(COPY_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _stats(start, source, size, copied, saved, linked):
+    return {
+        'time': start,
+        'source': source,
+        'size': size,
+        'bytes_copied': copied,
+        'bytes_saved': saved,
+        'hardlinked': linked,
+        'merged': 0,
+        'drifted': False,
+        'wait': time.time() - start,
+    }
+
+
+class SnapshotStore(object):
+    def __init__(self, root):
+        """
+        :param root: (str) the .store folder, has to be on the same volume as the snapshots for hardlinks
+        """
+        self.root = root
+        ## (work file path, size, mtime): object path of the stored copy of it
+        self._stamps = {}
+        self._lock = threading.Lock()
+        self._can_link = None
+
+    @classmethod
+    def for_target(cls, target_path):
+        return cls(os.path.join(os.path.dirname(target_path), STORE_NAME))
+
+    def object_path(self, digest):
+        return os.path.join(self.root, 'objects', digest[:2], digest[2:])
+
+    def can_link(self):
+        """
+        :return: (bool) True if the store's volume takes hardlinks, checked once with a probe file
+        """
+        if self._can_link is None:
+            _makedirs(self.root)
+            probe = os.path.join(self.root, '.probe.{}'.format(uuid.uuid4().hex))
+            with open(probe, 'w'):
+                pass
+            self._can_link = _link_new(probe, probe + '.link')
+            for each in (probe, probe + '.link'):
+                if os.path.exists(each):
+                    os.remove(each)
+        return self._can_link
+
+    def link_unchanged(self, stamp, target):
+        """
+        Links the snapshot to the stored copy of an unchanged work file, the only part the artist waits for.
+        :return: (bool) True if linked
+        """
+        with self._lock:
+            object_path = self._stamps.get(stamp)
+        if object_path is None or not os.path.isfile(object_path):
+            return False
+        if os.path.exists(target):
+            os.remove(target)
+        return _link_new(object_path, target)
+
+    def pin(self, source):
+        """
+        Hardlinks the work file as it is now into .store/pins, a later save replaces the work file but not the pin.
+        :return: (str) the pin, or None if it can't be hardlinked
+        """
+        if not self.can_link():
+            return None
+        folder = os.path.join(self.root, PINS_NAME)
+        _makedirs(folder)
+        pin_path = os.path.join(folder, uuid.uuid4().hex)
+        return pin_path if _link_new(source, pin_path) else None
+
+    def copy(self, source, stamp, target):
+        """
+        Writes target from source through a .part file.
+        :param stamp: (tuple) of the work file (path, size, mtime) when the snapshot was taken
+        :return: (bool) True if the copy doesn't match the stamp, the work file was saved in place before it finished
+        """
+        part_path = '{}.part'.format(target)
+        shutil.copy2(source, part_path)
+        drifted = _stat_key(source) != stamp[1:]
+        _rename(part_path, target)
+        return drifted
+
+    def dedupe(self, target, stamp=None):
+        """
+        Swaps the snapshot for a link to an identical stored object, or stores it. Runs in the background, only
+        where the store can hardlink.
+        :param stamp: (tuple) of the work file (path, size, mtime) the snapshot was copied from, if it matches it
+        :return: (int) bytes saved
+        """
+        digest = _hash_file(target)
+        object_path = self.object_path(digest)
+        saved = 0
+        with self._lock:
+            if os.path.isfile(object_path):
+                if not _same_file(object_path, target) and _replace_with_link(object_path, target):
+                    saved = os.path.getsize(object_path)
+            else:
+                _makedirs(os.path.dirname(object_path))
+                if not _link_new(target, object_path):
+                    return saved
+            if stamp is not None:
+                self._stamps[stamp] = object_path
+        return saved
+
+    def write_stats(self, stats):
+        try:
+            _makedirs(self.root)
+            with open(os.path.join(self.root, STATS_NAME), 'a') as f:
+                f.write('{}\n'.format(json.dumps(stats)))
+        except (IOError, OSError):
+            pass
+
+
+def summarise(store_root, since=None):
+    """
+    Totals up the stats a store has logged, eg summarise(root, since=time.time() - 7 * 86400) for the last week.
+    :return: (dict)
+    """
+    summary = {'snapshots': 0, 'linked': 0, 'merged': 0, 'drifted': 0, 'bytes_snapshotted': 0, 'bytes_copied': 0,
+               'bytes_saved': 0, 'wait': 0.0}
+    try:
+        with open(os.path.join(store_root, STATS_NAME), 'r') as f:
+            for line in f:
+                try:
+                    stats = json.loads(line)
+                except ValueError:
+                    continue
+                if since and stats['time'] < since:
+                    continue
+                summary['snapshots'] += 1 + stats.get('merged', 0)
+                summary['linked'] += 1 if stats['hardlinked'] else 0
+                summary['merged'] += stats.get('merged', 0)
+                summary['drifted'] += 1 if stats.get('drifted') else 0
+                summary['bytes_snapshotted'] += stats['size'] * (1 + stats.get('merged', 0))
+                summary['bytes_copied'] += stats['bytes_copied']
+                summary['bytes_saved'] += stats['bytes_saved']
+                summary['wait'] += stats['wait']
+    except (IOError, OSError):
+        pass
+    return summary
+
+
+class _Job(object):
+    def __init__(self, store, source, stamp, pin, target, stats):
+        self.store = store
+        self.source = source
+        self.stamp = stamp
+        self.pin = pin
+        self.targets = [target]
+        self.stats = stats
+        self.done = threading.Event()
+
+
+class SnapshotQueue(object):
+    """
+    Pins snapshots right away and copies and deduplicates them on one background thread.
+    """
+
+    def __init__(self, maxsize=QUEUE_SIZE):
+        self._queue = queue.Queue(maxsize)
+        self._stores = {}
+        ## work file: the job for it still waiting in the queue, a new snapshot of it merges into that
+        self._waiting = {}
+        ## snapshot path: the job writing it
+        self._pending = {}
+        self._lock = threading.Lock()
+        self.errors = []
+        self._thread = threading.Thread(target=self._work, name='SnapshotQueue')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _store_for(self, target):
+        root = os.path.join(os.path.dirname(target), STORE_NAME)
+        with self._lock:
+            if root not in self._stores:
+                self._stores[root] = SnapshotStore(root)
+            return self._stores[root]
+
+    def submit(self, source, target):
+        """
+        Queues the snapshot, only linking an unchanged work file or pinning it while the artist waits. A full queue
+        copies the snapshot before returning rather than blocking on it.
+        """
+        start = time.time()
+        store = self._store_for(target)
+        stamp = (source,) + _stat_key(source)
+        if store.can_link() and store.link_unchanged(stamp, target):
+            store.write_stats(_stats(start, source, stamp[1], 0, stamp[1], True))
+            return
+
+        pin = store.pin(source)
+        with self._lock:
+            job = self._waiting.get((store.root, source))
+            if job is not None:
+                ## the queued copy hasn't started, it takes this snapshot's pin and writes both
+                if job.pin:
+                    os.remove(job.pin)
+                job.pin, job.stamp = pin, stamp
+                job.targets.append(target)
+                job.stats['merged'] += 1
+                self._pending[target] = job
+                return
+            job = _Job(store, source, stamp, pin, target, _stats(start, source, stamp[1], 0, 0, False))
+            try:
+                self._queue.put_nowait(job)
+            except queue.Full:
+                job = None
+            else:
+                self._waiting[(store.root, source)] = job
+                self._pending[target] = job
+        if job is None:
+            job = _Job(store, source, stamp, pin, target, _stats(start, source, stamp[1], 0, 0, False))
+            self._run(job)
+            job.stats['wait'] = time.time() - start
+
+    def _run(self, job):
+        store, stats = job.store, job.stats
+        try:
+            stats['drifted'] = store.copy(job.pin or job.source, job.stamp, job.targets[0])
+            stats['bytes_copied'] = os.path.getsize(job.targets[0])
+            for target in job.targets[1:]:
+                if os.path.exists(target):
+                    os.remove(target)
+                if not store.can_link() or not _link_new(job.targets[0], target):
+                    shutil.copy2(job.targets[0], target)
+                    stats['bytes_copied'] += stats['size']
+            if store.can_link():
+                stats['bytes_saved'] = store.dedupe(job.targets[0], None if stats['drifted'] else job.stamp)
+        except (IOError, OSError) as e:
+            self.errors.append((job.targets, str(e)))
+            print('Failed to snapshot {} to {}: {}'.format(job.source, job.targets, e))
+        finally:
+            if job.pin and os.path.exists(job.pin):
+                os.remove(job.pin)
+            store.write_stats(stats)
+            with self._lock:
+                for target in job.targets:
+                    if self._pending.get(target) is job:
+                        del self._pending[target]
+            job.done.set()
+
+    def _work(self):
+        while True:
+            job = self._queue.get()
+            with self._lock:
+                if self._waiting.get((job.store.root, job.source)) is job:
+                    del self._waiting[(job.store.root, job.source)]
+            try:
+                self._run(job)
+            finally:
+                self._queue.task_done()
+
+    def wait_for(self, path):
+        """
+        Blocks until the snapshot at path is written, if it's still queued.
+        """
+        with self._lock:
+            job = self._pending.get(path)
+        if job is not None:
+            job.done.wait()
+
+    def wait(self):
+        """
+        Blocks until every queued snapshot is written and deduplicated.
+        """
+        self._queue.join()
+
+
+_QUEUE = []
+
+
+def get_queue():
+    """
+    :return: (SnapshotQueue) the sessions queue, drained before the session exits
+    """
+    if not _QUEUE:
+        _QUEUE.append(SnapshotQueue())
+        atexit.register(_QUEUE[0].wait)
+    return _QUEUE[0]
+
+
+def _folder_size(folder):
+    seen = set()
+    total = 0
+    for dir_path, dir_names, file_names in os.walk(folder):
+        for file_name in file_names:
+            stat = os.stat(os.path.join(dir_path, file_name))
+            if (stat.st_dev, stat.st_ino) not in seen:
+                seen.add((stat.st_dev, stat.st_ino))
+                total += stat.st_size
+    return total
+
+
+def bench(snapshots=40, megabytes=20):
+    """
+    Simulates a week of snapshots of one work file, saved between a third of them and with every fifth one a
+    burst of two dailies back to back, taken as plain copies and through the store.
+    :return: (dict) of 'plain' / 'store': {'wait': seconds the artist waited in total, 'disk': bytes on disk,
+             'files': snapshots written}
+    """
+    import random
+    root = tempfile.mkdtemp(prefix='snapshotBench_')
+    work_file = os.path.join(root, 'work', 'scene.ma')
+    os.makedirs(os.path.dirname(work_file))
+    block = os.urandom(1024 * 1024)
+    with open(work_file, 'wb') as f:
+        for _ in range(megabytes):
+            f.write(block)
+
+    results = {}
+    for mode in ('plain', 'store'):
+        folder = os.path.join(root, mode, SNAPSHOT_FOLDER_NAME)
+        os.makedirs(folder)
+        snapshot_queue = SnapshotQueue() if mode == 'store' else None
+        rand = random.Random(1)
+        wait = 0.0
+        for index in range(snapshots):
+            if rand.random() < 0.33:
+                ## saved the way maya does, a new file replacing the old
+                save_path = work_file + '.saving'
+                shutil.copy2(work_file, save_path)
+                with open(save_path, 'ab') as f:
+                    f.write(os.urandom(1024))
+                _rename(save_path, work_file)
+            target = os.path.join(folder, 'scene.v001.{:04d}.ma'.format(index))
+            start = time.time()
+            if snapshot_queue is None:
+                shutil.copy(work_file, target)
+            else:
+                snapshot_queue.submit(work_file, target)
+            wait += time.time() - start
+            if snapshot_queue is not None and index % 5 != 0:
+                ## snapshots are minutes apart, the copy is long done before the next one, bar the bursts
+                snapshot_queue.wait()
+        if snapshot_queue is not None:
+            snapshot_queue.wait()
+        results[mode] = {'wait': wait, 'disk': _folder_size(os.path.dirname(folder)),
+                         'files': len([name for name in os.listdir(folder) if name.endswith('.ma')])}
+    shutil.rmtree(root)
+    return results
+
+
+if __name__ == '__main__':
+    import sys
+
+    if len(sys.argv) > 2 and sys.argv[1] == 'report':
+        days = float(sys.argv[3]) if len(sys.argv) > 3 else 7
+        print(json.dumps(summarise(os.path.join(sys.argv[2], STORE_NAME), since=time.time() - days * 86400),
+                         indent=2, sort_keys=True))
+    elif len(sys.argv) > 1 and sys.argv[1] == 'bench':
+        bench_results = bench(*[int(each) for each in sys.argv[2:4]])
+        for bench_mode in ('plain', 'store'):
+            print('{:<6} waited {:.2f}s, {} snapshots, {:.1f}MB on disk'.format(
+                bench_mode, bench_results[bench_mode]['wait'], bench_results[bench_mode]['files'],
+                bench_results[bench_mode]['disk'] / 1048576.0))
+    else:
+        print('usage: python snapshot_store.py report snapshots_folder [days] | bench [snapshots] [megabytes]')
+        sys.exit(1)
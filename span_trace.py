@@ -0,0 +1,273 @@
+"""
+Lightweight span tracing for launches and publishes.
+
+Spans are timed sections of code. They are collected in memory and written as Chrome trace format json (open them in
+chrome://tracing or https://ui.perfetto.dev) into TEMP_FOLDER next to the LOGFILE_NAME log:
+    {TEMP_FOLDER}/{LOGFILE_NAME}.trace.{process}.{pid}.json
+
+Timestamps are wall clock microseconds so the launcher and the maya it starts line up when their files are loaded
+together. Tracing is off unless the SPAN_TRACE env var is set to 1, set it for the launch or the session being looked
+into. When it is off span() hands back a shared no-op and traced() leaves the function as it is, and nothing is ever
+written.
+
+The first trace file a process writes clears out trace files older than MAX_TRACE_AGE and all but the newest
+MAX_TRACE_FILES.
+
+Usage:
+    with span_trace.span('build bundle', category='launch', paths=12):
+        ...
+
+    @span_trace.traced('PickEnvironment.execute', category='core')
+    def execute(self, context, **kwargs):
+        ...
+
+    python span_trace.py [folder]    percentiles of every span name across all the trace files in folder
+"""
+import atexit
+import functools
+import json
+import os
+import sys
+import threading
+import time
+
+ENV_VAR = 'SPAN_TRACE'
+TRACE_NAME = '{}.trace.{}.{}.json'
+## stop collecting after this many events so a long running process can't grow without bounds
+MAX_EVENTS = 100000
+MAX_TRACE_AGE = 3 * 24 * 60 * 60
+MAX_TRACE_FILES = 200
+PERCENTILES = (50, 90, 99)
+
+_ENABLED = None
+_EVENTS = []
+_LOCK = threading.Lock()
+_CLEANED = []
+
+
+def enabled():
+    """
+    :return: (bool) True if spans are being recorded, worked out once on first use
+    """
+    global _ENABLED
+    if _ENABLED is None:
+        _ENABLED = os.environ.get(ENV_VAR, '') not in ('', '0')
+        if _ENABLED:
+            atexit.register(flush)
+            _record_config_import()
+    return _ENABLED
+
+
+def _record_config_import():
+    ## config_constants notes its own import times rather than importing this module
+    configCONST = sys.modules.get('config_constants')
+    start = getattr(configCONST, '_IMPORT_START', None)
+    end = getattr(configCONST, '_IMPORT_END', None)
+    if start is not None and end is not None:
+        _record('config_constants import', 'config', start * 1000000.0, (end - start) * 1000000.0, {})
+
+
+def _now():
+    return time.time() * 1000000.0
+
+
+def add_span(name, start, end=None, category='', **args):
+    """
+    Records a span timed by the caller, for code that can't import this module until it has finished.
+    :param start: (float) time.time() the span started
+    :param end: (float) time.time() the span ended, defaults to now
+    """
+    if not (_ENABLED or (_ENABLED is None and enabled())):
+        return
+    start = start * 1000000.0
+    end = end * 1000000.0 if end is not None else _now()
+    _record(name, category, start, end - start, args)
+
+
+def _record(name, category, start, duration, args):
+    event = {
+        'name': name,
+        'cat': category,
+        'ph': 'X',
+        'ts': start,
+        'dur': duration,
+        'pid': os.getpid(),
+        'tid': threading.current_thread().ident,
+    }
+    if args:
+        event['args'] = args
+    with _LOCK:
+        if len(_EVENTS) < MAX_EVENTS:
+            _EVENTS.append(event)
+
+
+class _Span(object):
+    __slots__ = ('name', 'category', 'args', 'start')
+
+    def __init__(self, name, category, args):
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = _now()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None:
+            self.args['error'] = repr(exc_value)
+        _record(self.name, self.category, self.start, _now() - self.start, self.args)
+        return False
+
+
+class _NullSpan(object):
+    __slots__ = ()
+    args = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+def span(name, category='', **args):
+    """
+    :return: context manager timing its block, a shared no-op when tracing is off
+    """
+    if _ENABLED is False or (_ENABLED is None and not enabled()):
+        return _NULL_SPAN
+    return _Span(name, category, args)
+
+
+def traced(name=None, category='', flush_after=False):
+    """
+    Decorator timing every call of a function.
+    :param name: (str) span name, defaults to the function name
+    :param flush_after: (bool) write the trace file after each call, for entry points in long running processes
+    """
+    def _decorate(func):
+        if not enabled():
+            return func
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def _wrapper(*args, **kwargs):
+            try:
+                with _Span(span_name, category, {}):
+                    return func(*args, **kwargs)
+            finally:
+                if flush_after:
+                    flush()
+        return _wrapper
+    return _decorate
+
+
+def trace_path():
+    import config_constants as configCONST
+    process = os.path.splitext(os.path.basename(sys.argv[0] if sys.argv and sys.argv[0] else 'python'))[0]
+    return os.path.join(configCONST.TEMP_FOLDER,
+                        TRACE_NAME.format(configCONST.LOGFILE_NAME, process or 'python', os.getpid()))
+
+
+def clean_traces(folder, max_age=MAX_TRACE_AGE, max_files=MAX_TRACE_FILES):
+    """
+    Removes old trace files from folder.
+    :return: (int) number removed
+    """
+    traces = []
+    for file_name in os.listdir(folder):
+        if '.trace.' in file_name and file_name.endswith('.json'):
+            path = os.path.join(folder, file_name)
+            try:
+                traces.append((os.path.getmtime(path), path))
+            except OSError:
+                continue
+    traces.sort(reverse=True)
+    cutoff = time.time() - max_age
+    removed = 0
+    for index, (mtime, path) in enumerate(traces):
+        if index >= max_files or mtime < cutoff:
+            try:
+                os.remove(path)
+                removed += 1
+            except OSError:
+                pass
+    return removed
+
+
+def flush():
+    """
+    Writes everything recorded by this process so far.
+    :return: (str) the trace file or None when there is nothing to write
+    """
+    with _LOCK:
+        events = list(_EVENTS)
+    if not events:
+        return None
+    path = trace_path()
+    tmp_path = '{}.tmp'.format(path)
+    try:
+        if not _CLEANED:
+            _CLEANED.append(clean_traces(os.path.dirname(path)))
+        with open(tmp_path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+        if os.path.isfile(path):
+            os.remove(path)
+        os.rename(tmp_path, path)
+    except (IOError, OSError) as e:
+        print('Failed to write span trace {}: {}'.format(path, e))
+        return None
+    return path
+
+
+def _percentile(ordered, percent):
+    index = int(round((len(ordered) - 1) * percent / 100.0))
+    return ordered[index]
+
+
+def aggregate(folder):
+    """
+    :param folder: (str) folder holding trace files, eg TEMP_FOLDER
+    :return: (dict) of span name: {'count', 'p50', 'p90', 'p99', 'max'} durations in milliseconds
+    """
+    durations = {}
+    for file_name in os.listdir(folder):
+        if '.trace.' not in file_name or not file_name.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(folder, file_name), 'r') as f:
+                events = json.load(f).get('traceEvents', [])
+        except (IOError, OSError, ValueError):
+            continue
+        for event in events:
+            if event.get('ph') == 'X':
+                durations.setdefault(event['name'], []).append(event['dur'] / 1000.0)
+
+    report = {}
+    for name, values in durations.items():
+        values.sort()
+        stats = {'count': len(values), 'max': values[-1]}
+        for percent in PERCENTILES:
+            stats['p{}'.format(percent)] = _percentile(values, percent)
+        report[name] = stats
+    return report
+
+
+if __name__ == '__main__':
+    if len(sys.argv) > 1:
+        trace_folder = sys.argv[1]
+    else:
+        import config_constants as configCONST
+        trace_folder = configCONST.TEMP_FOLDER
+
+    columns = ['count'] + ['p{}'.format(percent) for percent in PERCENTILES] + ['max']
+    results = aggregate(trace_folder)
+    print('{:<50}'.format('span (ms)') + ''.join('{:>10}'.format(column) for column in columns))
+    for span_name, span_stats in sorted(results.items(), key=lambda item: -item[1]['p50']):
+        print('{:<50}'.format(span_name[:50]) + '{:>10}'.format(span_stats['count']) +
+              ''.join('{:>10.1f}'.format(span_stats[column]) for column in columns[1:]))
@@ -0,0 +1,391 @@
+"""
+Local startup bundle for config_constants.SYS_PATHS.
+
+Every SYS_PATHS folder lives on the SHOTGUN_SOFTWARE_ROOT share, so each import in a maya session stats its way
+through all of them over the network. The launcher builds a bundle of them on local disk instead:
+    - the paths are deduplicated (normalised, first one wins) keeping their order
+    - each folder is mirrored into TEMP_FOLDER/startupBundle/{MAYA_VERSION}, only copying what changed since the
+      last launch, and its bytecode is precompiled there by the maya interpreter so nothing is compiled at import
+    - optionally folders without compiled extensions are packed into a zip on local disk for zipimport, one
+      directory entry on sys.path instead of a tree
+
+Launches after the first don't walk the share. Each folder is only rescanned when its stamp changes, the release
+file a deploy writes (one of STAMP_NAMES) if it has one, else the size and mtime of its top level entries. Every
+FULL_SCAN_AGE it is rescanned anyway to pick up edits deeper down in folders without a release file.
+
+The config itself (SHOTGUN_CONFIG_ROOT) and tk-core (TANKCORE_PYTHON_PATH) find their other files relative to their
+own __file__, so they always stay on the share, see share_only_paths().
+
+If a folder can't be bundled its network path is used as before. bundle.paths() is the ordered list to put on the
+maya PYTHONPATH.
+
+Usage:
+    bundle = StartupBundle(python_exe=mayapy, use_zip=True)
+    bundle.build()
+    os.environ['PYTHONPATH'] = os.pathsep.join(bundle.paths())
+
+    python startup_bundle.py build [--zip] [--full] [--python /path/to/mayapy]
+    python startup_bundle.py measure module [module ...]
+    python startup_bundle.py bench [--latency seconds]    a warm launch over a fake slow share, full scan vs stamps
+"""
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+import zipfile
+
+import config_constants as configCONST
+
+BUNDLE_FOLDER_NAME = 'startupBundle'
+MANIFEST_NAME = 'bundle.json'
+SKIP_NAMES = ('__pycache__', '.git', '.svn', '.DS_Store')
+SKIP_EXTENSIONS = ('.pyc', '.pyo')
+## a folder holding any of these can't be imported from a zip
+BINARY_EXTENSIONS = ('.pyd', '.so', '.dll', '.dylib', '.mll')
+## release files a deploy writes at the top of a folder, the first one found is the folder's stamp
+STAMP_NAMES = ('.release', 'VERSION', 'version.txt')
+## seconds before a folder is fully rescanned even though its stamp hasn't changed
+FULL_SCAN_AGE = 24 * 60 * 60
+
+
+def unique_paths(paths):
+    """
+    :return: (list) of the paths with duplicates removed, keeping the first of each
+    """
+    seen = set()
+    unique = []
+    for path in paths:
+        if not path:
+            continue
+        key = os.path.normcase(os.path.normpath(path))
+        if key not in seen:
+            seen.add(key)
+            unique.append(path)
+    return unique
+
+
+def bundle_root():
+    return os.path.join(configCONST.TEMP_FOLDER, BUNDLE_FOLDER_NAME, configCONST.MAYA_VERSION)
+
+
+def share_only_paths():
+    """
+    :return: (list) of folders that must be imported from where they are, along with everything under them
+    """
+    return [configCONST.SHOTGUN_CONFIG_ROOT, configCONST.TANKCORE_PYTHON_PATH]
+
+
+def _is_under(path, folders):
+    key = os.path.normcase(os.path.normpath(path))
+    for folder in folders:
+        folder_key = os.path.normcase(os.path.normpath(folder))
+        if key == folder_key or key.startswith(folder_key.rstrip(os.sep) + os.sep):
+            return True
+    return False
+
+
+def _tree_stamp(folder):
+    """
+    The cheap check for a folder having changed, one listdir and a stat per top level entry at most.
+    :return: (list)
+    """
+    names = sorted(os.listdir(folder))
+    for name in STAMP_NAMES:
+        if name in names:
+            stat = os.stat(os.path.join(folder, name))
+            return [name, stat.st_size, stat.st_mtime]
+    stamp = []
+    for name in names:
+        if name in SKIP_NAMES:
+            continue
+        stat = os.stat(os.path.join(folder, name))
+        stamp.append([name, stat.st_size, stat.st_mtime])
+    return stamp
+
+
+def _scan(folder):
+    """
+    :return: (tuple) of ({relative path: [size, mtime]}, True if the folder is pure python)
+    """
+    files = {}
+    pure = True
+    for dir_path, dir_names, file_names in os.walk(folder):
+        dir_names[:] = [each for each in dir_names if each not in SKIP_NAMES]
+        for file_name in file_names:
+            extension = os.path.splitext(file_name)[-1].lower()
+            if file_name in SKIP_NAMES or extension in SKIP_EXTENSIONS:
+                continue
+            if extension in BINARY_EXTENSIONS:
+                pure = False
+            path = os.path.join(dir_path, file_name)
+            stat = os.stat(path)
+            files[os.path.relpath(path, folder).replace(os.sep, '/')] = [stat.st_size, stat.st_mtime]
+    return files, pure
+
+
+def _sync(source, destination, files, previous):
+    """
+    Copies new and changed files into the mirror and removes the ones that have gone.
+    :return: (int) number of files copied
+    """
+    copied = 0
+    for relative_path, stamp in files.items():
+        target = os.path.join(destination, *relative_path.split('/'))
+        if previous.get(relative_path) == stamp and os.path.isfile(target):
+            continue
+        folder = os.path.dirname(target)
+        if not os.path.isdir(folder):
+            os.makedirs(folder)
+        shutil.copy2(os.path.join(source, *relative_path.split('/')), target)
+        copied += 1
+
+    for relative_path in set(previous) - set(files):
+        target = os.path.join(destination, *relative_path.split('/'))
+        for each in (target, '{}c'.format(target)):
+            if os.path.isfile(each):
+                os.remove(each)
+    return copied
+
+
+def _python_major(python_exe):
+    output = subprocess.check_output([python_exe, '-c', 'import sys; print(sys.version_info[0])'])
+    return int(output.strip())
+
+
+def _compile(python_exe, folder, legacy):
+    """
+    Compiles with the interpreter that will import the files, its bytecode is the only one that's any use.
+    :param legacy: (bool) write .pyc next to the .py, zipimport on python 3 doesn't look in __pycache__
+    """
+    command = [python_exe, '-m', 'compileall', '-q']
+    if legacy:
+        command.append('-b')
+    with open(os.devnull, 'w') as devnull:
+        ## compileall exits non zero for files that don't compile, those are just imported from source
+        subprocess.call(command + [folder], stdout=devnull, stderr=devnull)
+
+
+def _zip(folder, zip_path):
+    tmp_path = '{}.tmp'.format(zip_path)
+    with zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for dir_path, dir_names, file_names in os.walk(folder):
+            dir_names[:] = [each for each in dir_names if each != '__pycache__']
+            for file_name in file_names:
+                path = os.path.join(dir_path, file_name)
+                archive.write(path, os.path.relpath(path, folder))
+    if os.path.isfile(zip_path):
+        os.remove(zip_path)
+    os.rename(tmp_path, zip_path)
+
+
+class StartupBundle(object):
+    def __init__(self, paths=None, root=None, python_exe=None, use_zip=False, share_only=None):
+        """
+        :param paths: (list) of folders to bundle, defaults to configCONST.SYS_PATHS
+        :param root: (str) local folder for the bundle, defaults to bundle_root()
+        :param python_exe: (str) interpreter the bundle is for eg mayapy, defaults to this one
+        :param use_zip: (bool) pack the pure python folders into zips
+        :param share_only: (list) of folders to leave on the share, defaults to share_only_paths()
+        """
+        self.sources = unique_paths(configCONST.SYS_PATHS if paths is None else paths)
+        self.share_only = share_only_paths() if share_only is None else share_only
+        self.root = root or bundle_root()
+        self.python_exe = python_exe or sys.executable
+        self.use_zip = use_zip
+        self.manifest_path = os.path.join(self.root, MANIFEST_NAME)
+        self.manifest = self._read_manifest()
+
+    def _read_manifest(self):
+        try:
+            with open(self.manifest_path, 'r') as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {'entries': {}}
+
+    def _write_manifest(self):
+        tmp_path = '{}.tmp'.format(self.manifest_path)
+        with open(tmp_path, 'w') as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        if os.path.isfile(self.manifest_path):
+            os.remove(self.manifest_path)
+        os.rename(tmp_path, self.manifest_path)
+
+    def _local_name(self, source):
+        key = os.path.normcase(os.path.normpath(source))
+        return '{}_{}'.format(os.path.basename(source.rstrip('/\\')) or 'root',
+                              hashlib.sha1(key.encode('utf-8')).hexdigest()[:10])
+
+    def build(self, full=False):
+        """
+        Brings the bundle up to date with the network folders.
+        :param full: (bool) rescan every folder whatever its stamp says
+        :return: (dict) of source path: what was done
+        """
+        if not os.path.isdir(self.root):
+            os.makedirs(self.root)
+
+        legacy = None
+        report = {}
+        entries = self.manifest.setdefault('entries', {})
+        for source in self.sources:
+            start = time.time()
+            if _is_under(source, self.share_only):
+                report[source] = 'left on the share'
+                entries.pop(source, None)
+                continue
+            if not os.path.isdir(source):
+                report[source] = 'missing'
+                entries.pop(source, None)
+                continue
+
+            entry = entries.get(source, {})
+            mirror = os.path.join(self.root, self._local_name(source))
+            zip_path = '{}.zip'.format(mirror)
+            try:
+                stamp = _tree_stamp(source)
+                if not full and entry.get('stamp') == stamp and start - entry.get('scanned', 0) < FULL_SCAN_AGE:
+                    pure = entry.get('pure', False)
+                    files = entry.get('files')
+                else:
+                    files, pure = _scan(source)
+                    entry['scanned'] = start
+                wants_zip = self.use_zip and pure
+                if (entry.get('files') == files and entry.get('zip') == wants_zip and
+                        entry.get('python') == self.python_exe and os.path.isdir(mirror) and (not wants_zip or os.path.isfile(zip_path))):
+                    entry['stamp'] = stamp
+                    entries[source] = entry
+                    report[source] = 'unchanged'
+                    continue
+
+                copied = _sync(source, mirror, files, entry.get('files', {}))
+                if legacy is None:
+                    legacy = self.use_zip and _python_major(self.python_exe) >= 3
+                _compile(self.python_exe, mirror, legacy and wants_zip)
+                if wants_zip:
+                    _zip(mirror, zip_path)
+                elif os.path.isfile(zip_path):
+                    os.remove(zip_path)
+
+                entries[source] = {
+                    'files': files,
+                    'stamp': stamp,
+                    'scanned': entry['scanned'],
+                    'pure': pure,
+                    'mirror': mirror,
+                    'zip': wants_zip,
+                    'python': self.python_exe,
+                    'path': zip_path if wants_zip else mirror,
+                }
+                report[source] = 'copied {} files in {:.2f}s'.format(copied, time.time() - start)
+            except (IOError, OSError, subprocess.CalledProcessError) as e:
+                ## fall back to the network path for this one
+                entries.pop(source, None)
+                report[source] = 'failed: {}'.format(e)
+
+        self._write_manifest()
+        return report
+
+    def paths(self):
+        """
+        :return: (list) of the bundled paths in SYS_PATHS order, network paths for anything not bundled
+        """
+        entries = self.manifest.get('entries', {})
+        return [entries[source]['path'] if source in entries else source for source in self.sources]
+
+
+def measure_imports(paths, modules, python_exe=None, runs=3):
+    """
+    Times importing modules in a fresh interpreter with only paths added to sys.path. Run it once with
+    configCONST.SYS_PATHS and once with the bundle paths to see what the bundle saves on the share.
+    :return: (dict) of module: best import time in seconds
+    """
+    script = ('import sys, time, json\n'
+              'sys.path[1:1] = json.loads(sys.argv[1])\n'
+              'start = time.time()\n'
+              '__import__(sys.argv[2])\n'
+              'print(time.time() - start)\n')
+    timings = {}
+    for module in modules:
+        best = None
+        for _ in range(runs):
+            output = subprocess.check_output([python_exe or sys.executable, '-c', script, json.dumps(paths), module])
+            elapsed = float(output.strip().splitlines()[-1])
+            best = elapsed if best is None else min(best, elapsed)
+        timings[module] = best
+    return timings
+
+
+def bench(folders=20, files=50, latency=0.002):
+    """
+    Times a warm build, nothing changed since the last one, over a fake share where every stat, listdir and scandir
+    takes latency seconds the way they do over SMB from a busy file server.
+    :return: (dict) of 'full' / 'stamped': seconds the build took
+    """
+    import tempfile
+    root = tempfile.mkdtemp(prefix='bundleBench_')
+    share = os.path.join(root, 'share')
+    sources = []
+    for index in range(folders):
+        package = os.path.join(share, 'lib{:02d}'.format(index), 'pkg{:02d}'.format(index))
+        os.makedirs(package)
+        for file_index in range(files):
+            with open(os.path.join(package, 'mod{:03d}.py'.format(file_index)), 'w') as f:
+                f.write('VALUE = {}\n'.format(file_index))
+        sources.append(os.path.dirname(package))
+    bundle = StartupBundle(paths=sources, root=os.path.join(root, 'bundle'), share_only=[])
+    bundle.build()
+
+    real = {}
+
+    def _slow(name):
+        call = real[name] = getattr(os, name)
+
+        def _on_share(path, *args, **kwargs):
+            if isinstance(path, str) and path.startswith(share):
+                time.sleep(latency)
+            return call(path, *args, **kwargs)
+        return _on_share
+
+    names = [name for name in ('stat', 'listdir', 'scandir') if hasattr(os, name)]
+    results = {}
+    try:
+        for name in names:
+            setattr(os, name, _slow(name))
+        for mode in ('full', 'stamped'):
+            start = time.time()
+            bundle.build(full=mode == 'full')
+            results[mode] = time.time() - start
+    finally:
+        for name in names:
+            setattr(os, name, real[name])
+        shutil.rmtree(root)
+    return results
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Build or measure the local SYS_PATHS startup bundle')
+    parser.add_argument('action', choices=('build', 'measure', 'bench'))
+    parser.add_argument('modules', nargs='*')
+    parser.add_argument('--zip', action='store_true', help='pack the pure python folders into zips')
+    parser.add_argument('--python', help='interpreter the bundle is for, eg mayapy')
+    parser.add_argument('--full', action='store_true', help='rescan every folder, not just the changed stamps')
+    parser.add_argument('--latency', type=float, default=0.002, help='seconds per filesystem call for bench')
+    args = parser.parse_args()
+
+    if args.action == 'bench':
+        for bench_mode, seconds in sorted(bench(latency=args.latency).items()):
+            print('{:<8} warm build {:.3f}s'.format(bench_mode, seconds))
+        sys.exit(0)
+
+    bundle = StartupBundle(python_exe=args.python, use_zip=args.zip)
+    if args.action == 'build':
+        for source, result in bundle.build(full=args.full).items():
+            print('{}: {}'.format(source, result))
+    else:
+        print('network: {}'.format(measure_imports(bundle.sources, args.modules, args.python)))
+        print('bundle:  {}'.format(measure_imports(bundle.paths(), args.modules, args.python)))
@@ -0,0 +1,341 @@
+"""
+Validates core/templates.yml and compiles its path templates into an index that resolves a path back to its
+template and fields without trying every definition in turn.
+
+The templates are compiled into a trie keyed on path segments. Literal segments are dict lookups, segments holding
+keys are small regexes, so resolving a path only ever tests the templates sharing its shape. Every candidate that
+survives the walk is confirmed with the full template regex, which also pulls out the fields.
+
+The compiled index is cached as json next to templates.yml, keyed on a hash of the yml, so tools like the batch
+breakdown only pay for the compile once per change to the templates. To validate and build the cache by hand:
+    python template_index.py [path/to/templates.yml]
+"""
+import hashlib
+import json
+import os
+import re
+import sys
+
+try:
+    from tank_vendor import yaml
+except ImportError:
+    import yaml
+
+CONFIG_ROOT = os.path.dirname(os.path.abspath(__file__))
+TEMPLATES_PATH = os.path.join(CONFIG_ROOT, 'core', 'templates.yml')
+INDEX_VERSION = 1
+
+## Regexes for the key types, see the keys section in templates.yml
+KEY_PATTERNS = {
+    'int': r'\d+',
+    'sequence': r'(?:\d+|%0?\d*d|#+|@+|\$F\d*)',
+    'str': r'[^/]+?',
+}
+ALPHANUMERIC_PATTERN = r'[A-Za-z0-9]+'
+KEY_TOKEN = re.compile(r'\{([^}]+)\}')
+
+
+class TemplateIndexError(Exception):
+    pass
+
+
+class _UniqueKeyLoader(yaml.SafeLoader):
+    """
+    SafeLoader that refuses duplicate mapping keys instead of silently keeping the last one.
+    """
+    pass
+
+
+def _construct_unique_mapping(loader, node, deep=False):
+    seen = {}
+    for key_node, _ in node.value:
+        key = loader.construct_object(key_node, deep=deep)
+        if key in seen:
+            raise TemplateIndexError(
+                'Duplicate key {!r} on line {} (first defined on line {})'.format(
+                    key, key_node.start_mark.line + 1, seen[key]))
+        seen[key] = key_node.start_mark.line + 1
+    return loader.construct_mapping(node, deep=deep)
+
+
+_UniqueKeyLoader.add_constructor(yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG, _construct_unique_mapping)
+
+
+def load_templates(path=TEMPLATES_PATH):
+    """
+    Loads and validates templates.yml.
+    :param path: (str) path to templates.yml
+    :return: (dict) the parsed templates file
+    :raises TemplateIndexError: on duplicate keys, undefined keys or undefined aliases
+    """
+    with open(path, 'r') as f:
+        data = yaml.load(f, Loader=_UniqueKeyLoader) or {}
+
+    keys = data.get('keys') or {}
+    for name, definition in _resolve_path_definitions(data.get('paths') or {}).items():
+        for key in KEY_TOKEN.findall(definition['definition']):
+            if key not in keys:
+                raise TemplateIndexError('Template {} uses undefined key {{{}}}'.format(name, key))
+
+    return data
+
+
+def _resolve_path_definitions(paths):
+    """
+    Expands the @alias shorthands of the paths section.
+    :return: (dict) template name: {'definition': str, 'root_name': str}
+    """
+    aliases = dict((name, value) for name, value in paths.items() if not isinstance(value, dict))
+
+    def expand(definition, seen=()):
+        if not definition.startswith('@'):
+            return definition
+        alias, _, rest = definition[1:].partition('/')
+        if alias not in aliases:
+            raise TemplateIndexError('Undefined template alias @{}'.format(alias))
+        if alias in seen:
+            raise TemplateIndexError('Recursive template alias @{}'.format(alias))
+        base = expand(aliases[alias], seen + (alias,)).rstrip('/')
+        return '{}/{}'.format(base, rest) if rest else base
+
+    resolved = {}
+    for name, value in paths.items():
+        if isinstance(value, dict):
+            if 'definition' not in value:
+                raise TemplateIndexError('Template {} has no definition'.format(name))
+            resolved[name] = {'definition': expand(value['definition']), 'root_name': value.get('root_name')}
+
+    return resolved
+
+
+def _key_pattern(key_def):
+    if key_def.get('choices'):
+        choices = key_def['choices']
+        return '(?:{})'.format('|'.join(re.escape(str(each)) for each in sorted(choices, key=len, reverse=True)))
+    if key_def.get('filter_by') == 'alphanumeric':
+        return ALPHANUMERIC_PATTERN
+    return KEY_PATTERNS.get(key_def.get('type', 'str'), KEY_PATTERNS['str'])
+
+
+def _compile_segment(segment, keys, groups, backrefs=True):
+    """
+    Turns one path segment into a regex. Keys seen before in the same template become back references so
+    {version} has to hold the same value everywhere it is used.
+    """
+    pattern = []
+    position = 0
+    for match in KEY_TOKEN.finditer(segment):
+        pattern.append(re.escape(segment[position:match.start()]))
+        key = match.group(1)
+        if key in groups and backrefs:
+            pattern.append('(?P={})'.format(groups[key]))
+        else:
+            group = groups.setdefault(key, 'k{}'.format(len(groups)))
+            pattern.append('(?P<{}>{})'.format(group, _key_pattern(keys.get(key, {}))))
+        position = match.end()
+    pattern.append(re.escape(segment[position:]))
+    return ''.join(pattern)
+
+
+def compile_index_data(data):
+    """
+    Compiles a loaded templates file into plain data that can be cached as json.
+    :param data: (dict) as returned by load_templates
+    :return: (dict)
+    """
+    keys = data.get('keys') or {}
+    templates = {}
+    for name, value in _resolve_path_definitions(data.get('paths') or {}).items():
+        definition = value['definition'].strip('/')
+        segments = definition.split('/')
+        groups = {}
+        full = '/'.join(_compile_segment(each, keys, groups) for each in segments)
+        templates[name] = {
+            'definition': definition,
+            'root_name': value['root_name'],
+            'regex': '^{}$'.format(full),
+            ## segment regexes without back references, each segment has to stand on its own in the trie
+            'segments': [each if not KEY_TOKEN.search(each) else
+                         '^{}$'.format(_compile_segment(each, keys, {}, backrefs=False)) for each in segments],
+            'literal': [not KEY_TOKEN.search(each) for each in segments],
+            'groups': dict((group, key) for key, group in groups.items()),
+            'types': dict((key, keys.get(key, {}).get('type', 'str')) for key in groups),
+        }
+
+    return {'version': INDEX_VERSION, 'templates': templates}
+
+
+class _Node(object):
+    __slots__ = ('literal', 'patterns', 'templates')
+
+    def __init__(self):
+        self.literal = {}
+        self.patterns = {}
+        self.templates = []
+
+
+class TemplateIndex(object):
+    """
+    Path to template resolver built from compiled index data.
+    """
+
+    def __init__(self, index_data):
+        self._templates = index_data['templates']
+        self._regexes = {}
+        self._root = _Node()
+        self._segment_regexes = {}
+
+        for name in sorted(self._templates):
+            template = self._templates[name]
+            self._regexes[name] = re.compile(template['regex'])
+            node = self._root
+            for segment, is_literal in zip(template['segments'], template['literal']):
+                if is_literal:
+                    node = node.literal.setdefault(segment, _Node())
+                else:
+                    if segment not in self._segment_regexes:
+                        self._segment_regexes[segment] = re.compile(segment)
+                    node = node.patterns.setdefault(segment, _Node())
+            node.templates.append(name)
+
+    @property
+    def template_names(self):
+        return sorted(self._templates)
+
+    def definition(self, name):
+        return self._templates[name]['definition']
+
+    def _candidates(self, segments):
+        nodes = [self._root]
+        for segment in segments:
+            next_nodes = []
+            for node in nodes:
+                child = node.literal.get(segment)
+                if child is not None:
+                    next_nodes.append(child)
+                for pattern, child in node.patterns.items():
+                    if self._segment_regexes[pattern].match(segment):
+                        next_nodes.append(child)
+            if not next_nodes:
+                return []
+            nodes = next_nodes
+
+        return [name for node in nodes for name in node.templates]
+
+    def _fields(self, name, match):
+        template = self._templates[name]
+        fields = {}
+        for group, value in match.groupdict().items():
+            key = template['groups'][group]
+            fields[key] = int(value) if template['types'][key] == 'int' else value
+        return fields
+
+    def matches(self, path, root=None):
+        """
+        :param path: (str) absolute path, or relative to the project root if root is None
+        :param root: (str) project root to strip from the path
+        :return: (list) of (template name, fields dict) for every template matching the path
+        """
+        relative = path.replace('\\', '/')
+        if root:
+            root = root.replace('\\', '/').rstrip('/') + '/'
+            if not relative.startswith(root):
+                return []
+            relative = relative[len(root):]
+        relative = relative.strip('/')
+
+        found = []
+        for name in self._candidates(relative.split('/')):
+            match = self._regexes[name].match(relative)
+            if match:
+                found.append((name, self._fields(name, match)))
+
+        return found
+
+    def resolve(self, path, root=None):
+        """
+        :return: (tuple) of (template name, fields dict) for the first template matching the path, or (None, None)
+        """
+        found = self.matches(path, root=root)
+        if found:
+            return found[0]
+        return None, None
+
+    def resolve_many(self, paths, root=None):
+        """
+        :param paths: (list) of paths, eg every reference path in a scene
+        :return: (dict) path: (template name, fields dict)
+        """
+        return dict((path, self.resolve(path, root=root)) for path in paths)
+
+
+def _file_hash(path):
+    with open(path, 'rb') as f:
+        return hashlib.sha1(f.read()).hexdigest()
+
+
+def index_cache_path(templates_path=TEMPLATES_PATH):
+    return os.path.join(os.path.dirname(templates_path), '.templates_index.json')
+
+
+def build_index(templates_path=TEMPLATES_PATH, cache_path=None):
+    """
+    Validates and compiles templates.yml and writes the cached index.
+    :return: (dict) the compiled index data
+    """
+    cache_path = cache_path or index_cache_path(templates_path)
+    index_data = compile_index_data(load_templates(templates_path))
+    index_data['source_hash'] = _file_hash(templates_path)
+
+    tmp_path = '{}.{}.tmp'.format(cache_path, os.getpid())
+    with open(tmp_path, 'w') as f:
+        json.dump(index_data, f, sort_keys=True)
+    if os.path.isfile(cache_path):
+        os.remove(cache_path)
+    os.rename(tmp_path, cache_path)
+
+    return index_data
+
+
+_INDEXES = {}
+
+
+def get_index(templates_path=TEMPLATES_PATH, cache_path=None):
+    """
+    Returns the TemplateIndex for templates.yml, from the cached artefact when it is current, rebuilding it when
+    the yml has changed. Indexes are kept for the rest of the session.
+    """
+    cache_path = cache_path or index_cache_path(templates_path)
+    source_hash = _file_hash(templates_path)
+    cached = _INDEXES.get(templates_path)
+    if cached and cached[0] == source_hash:
+        return cached[1]
+
+    index_data = None
+    try:
+        with open(cache_path, 'r') as f:
+            index_data = json.load(f)
+    except (IOError, OSError, ValueError):
+        pass
+
+    if (not index_data or index_data.get('source_hash') != source_hash
+            or index_data.get('version') != INDEX_VERSION):
+        try:
+            index_data = build_index(templates_path, cache_path)
+        except (IOError, OSError):
+            ## Read only config, compile in memory
+            index_data = compile_index_data(load_templates(templates_path))
+
+    index = TemplateIndex(index_data)
+    _INDEXES[templates_path] = (source_hash, index)
+    return index
+
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else TEMPLATES_PATH
+    try:
+        built = build_index(path)
+    except TemplateIndexError as e:
+        sys.stderr.write('{}\n'.format(e))
+        sys.exit(1)
+    print('Compiled {} templates to {}'.format(len(built['templates']), index_cache_path(path)))
@@ -0,0 +1,256 @@
+"""
+Cached thumbnails from the newest playblast or render.
+
+The ThumbnailHook uses this to hand the apps a thumbnail instead of asking for a screenshot every time. The newest
+playblast is found from the playblast templates for the context, a listing of the one review folder. The middle
+frame is decoded and scaled down to THUMBNAIL_WIDTH on a background thread and the result is kept in
+TEMP_FOLDER/thumbnails under a key made from the source path and its mtime. The hook calls request() on the UI
+thread so it never waits for it, it returns None straight away if the thumbnail isn't cached yet and the caller
+carries on with the screenshot. Once ready every later publish from the same source gets it straight from the cache.
+
+Without a playblast template for the context, request_newest() walks the maya project movies and images folders for
+the newest movie or rendered image sequence on a background thread. It hands back the thumbnail of the newest source
+the last walk found, so the walk never holds up the UI.
+
+Movies and exrs are decoded by ffmpeg (FFMPEG_PATH env var, or ffmpeg off the PATH) which streams and scales the
+single frame it needs. Without ffmpeg, 8 bit images are read with a Qt QImageReader set to decode at the scaled size.
+
+Usage:
+    thumbnail_path = get_cache().request(newest_file(playblast_paths))
+    thumbnail_path = get_cache().request_newest([movies_dir, images_dir])
+"""
+import hashlib
+import os
+import re
+import subprocess
+import threading
+
+import config_constants as configCONST
+
+THUMBNAIL_WIDTH = 512
+CACHE_FOLDER_NAME = 'thumbnails'
+MOVIE_EXTENSIONS = ('.mov', '.mp4', '.avi', '.m4v')
+IMAGE_EXTENSIONS = ('.exr', '.png', '.jpg', '.jpeg', '.tif', '.tiff', '.iff', '.dpx')
+## 8 bit formats qt can decode itself
+QT_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.tif', '.tiff')
+FRAME_PATTERN = re.compile(r'^(?P<head>.*?)(?P<frame>\d+)(?P<tail>\.[^.]+)$')
+## how deep below the render folder to look for sequences eg images/<layer>/<pass>/
+MAX_SCAN_DEPTH = 3
+
+
+def _ffmpeg():
+    return os.environ.get('FFMPEG_PATH', 'ffmpeg')
+
+
+def _ffprobe():
+    ## only the file name, the folder ffmpeg is installed in can have ffmpeg in it too
+    folder, file_name = os.path.split(_ffmpeg())
+    return os.path.join(folder, file_name.replace('ffmpeg', 'ffprobe'))
+
+
+def newest_file(paths):
+    """
+    :return: (str) the most recently modified of paths, or None
+    """
+    newest = (0, None)
+    for path in paths:
+        try:
+            newest = max(newest, (os.path.getmtime(path), path))
+        except OSError:
+            continue
+    return newest[1]
+
+
+def _mid_frame(files):
+    """
+    :param files: (list) of image file names in one folder
+    :return: (str) the middle frame file name of the longest sequence in the folder
+    """
+    sequences = {}
+    for file_name in files:
+        match = FRAME_PATTERN.match(file_name)
+        if match:
+            key = (match.group('head'), match.group('tail'))
+            sequences.setdefault(key, []).append((int(match.group('frame')), file_name))
+    if not sequences:
+        return None
+    frames = max(sequences.values(), key=len)
+    frames.sort()
+    return frames[len(frames) // 2][1]
+
+
+def find_newest_source(folders):
+    """
+    Finds the newest playblast movie or the middle frame of the newest image sequence.
+    :param folders: (list) of folders to search eg the maya project movies and images folders
+    :return: (str) file path or None
+    """
+    newest = (0, None)
+    for folder in folders:
+        if not folder or not os.path.isdir(folder):
+            continue
+        for dir_path, dir_names, file_names in os.walk(folder):
+            if dir_path[len(folder):].count(os.sep) >= MAX_SCAN_DEPTH:
+                del dir_names[:]
+            images = []
+            for file_name in file_names:
+                extension = os.path.splitext(file_name)[-1].lower()
+                if extension in MOVIE_EXTENSIONS:
+                    path = os.path.join(dir_path, file_name)
+                    newest = max(newest, (os.path.getmtime(path), path))
+                elif extension in IMAGE_EXTENSIONS:
+                    images.append(file_name)
+            if images:
+                mid_frame = _mid_frame(images)
+                if mid_frame:
+                    ## the folder mtime changes as frames are added, that's when the sequence was last written
+                    newest = max(newest, (os.path.getmtime(dir_path), os.path.join(dir_path, mid_frame)))
+    return newest[1]
+
+
+def _movie_duration(path):
+    try:
+        output = subprocess.check_output(
+            [_ffprobe(), '-v', 'error', '-show_entries', 'format=duration',
+             '-of', 'default=noprint_wrappers=1:nokey=1', path])
+        return float(output.strip())
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        return 0.0
+
+
+def _generate_ffmpeg(source, output):
+    seek = []
+    if os.path.splitext(source)[-1].lower() in MOVIE_EXTENSIONS:
+        seek = ['-ss', '{:.3f}'.format(_movie_duration(source) / 2.0)]
+    with open(os.devnull, 'w') as devnull:
+        subprocess.check_call(
+            [_ffmpeg(), '-y', '-v', 'error'] + seek +
+            ['-i', source, '-frames:v', '1', '-vf', 'scale={}:-2'.format(THUMBNAIL_WIDTH), output],
+            stdout=devnull, stderr=devnull)
+    return os.path.isfile(output)
+
+
+def _generate_qt(source, output):
+    from tank.platform.qt import QtCore, QtGui
+
+    reader = QtGui.QImageReader(source)
+    size = reader.size()
+    if not size.isValid() or size.width() == 0:
+        return False
+    height = max(1, int(size.height() * THUMBNAIL_WIDTH / float(size.width())))
+    reader.setScaledSize(QtCore.QSize(THUMBNAIL_WIDTH, height))
+    image = reader.read()
+    return not image.isNull() and image.save(output, 'JPG')
+
+
+class ThumbnailCache(object):
+    def __init__(self, folder=None):
+        """
+        :param folder: (str) where the thumbnails are kept, defaults to TEMP_FOLDER/thumbnails
+        """
+        self.folder = folder or os.path.join(configCONST.TEMP_FOLDER, CACHE_FOLDER_NAME)
+        ## thumbnail path: the thread making it
+        self._running = {}
+        self._failed = set()
+        ## tuple of folders: the newest source the last walk of them found
+        self._newest = {}
+        self._scanning = set()
+        self._lock = threading.Lock()
+
+    def cache_path(self, source):
+        key = '{}|{}'.format(os.path.normcase(os.path.abspath(source)), os.path.getmtime(source))
+        return os.path.join(self.folder, '{}.jpg'.format(hashlib.sha1(key.encode('utf-8')).hexdigest()))
+
+    def request(self, source, wait=0):
+        """
+        :param source: (str) movie or image file
+        :param wait: (float) seconds to wait for a thumbnail that isn't cached yet, never from the UI thread
+        :return: (str) the cached thumbnail, or None if it isn't ready in time in which case it carries on being
+                 generated in the background for next time
+        """
+        if not source or not os.path.isfile(source):
+            return None
+        path = self.cache_path(source)
+        if os.path.isfile(path):
+            return path
+
+        with self._lock:
+            if path in self._failed:
+                return None
+            thread = self._running.get(path)
+            if thread is None:
+                thread = threading.Thread(target=self._generate, args=(source, path), name='ThumbnailCache')
+                thread.daemon = True
+                self._running[path] = thread
+                thread.start()
+        if wait:
+            thread.join(wait)
+            if os.path.isfile(path):
+                return path
+        return None
+
+    def request_newest(self, folders):
+        """
+        Walks folders for the newest source in the background and requests its thumbnail.
+        :param folders: (list) of folders eg the maya project movies and images folders
+        :return: (str) the thumbnail of the newest source found by the last walk, or None
+        """
+        key = tuple(folders)
+        with self._lock:
+            source = self._newest.get(key)
+            scan = key not in self._scanning
+            self._scanning.add(key)
+        if scan:
+            thread = threading.Thread(target=self._scan, args=(key,), name='ThumbnailCacheScan')
+            thread.daemon = True
+            thread.start()
+        return self.request(source) if source else None
+
+    def _scan(self, key):
+        try:
+            source = find_newest_source(list(key))
+            with self._lock:
+                self._newest[key] = source
+            self.request(source)
+        except (IOError, OSError) as e:
+            print('Failed to look for a thumbnail source in {}: {}'.format(key, e))
+        finally:
+            with self._lock:
+                self._scanning.discard(key)
+
+    def _generate(self, source, path):
+        tmp_path = '{}.{}.tmp.jpg'.format(os.path.splitext(path)[0], threading.current_thread().ident)
+        created = False
+        try:
+            if not os.path.isdir(self.folder):
+                os.makedirs(self.folder)
+            try:
+                created = _generate_ffmpeg(source, tmp_path)
+            except (OSError, subprocess.CalledProcessError):
+                if os.path.splitext(source)[-1].lower() in QT_EXTENSIONS:
+                    created = _generate_qt(source, tmp_path)
+            if created:
+                os.rename(tmp_path, path)
+        except (IOError, OSError) as e:
+            print('Failed to make a thumbnail for {}: {}'.format(source, e))
+            created = False
+        finally:
+            if os.path.isfile(tmp_path):
+                os.remove(tmp_path)
+            with self._lock:
+                self._running.pop(path, None)
+                if not created:
+                    ## don't keep retrying a source that can't be decoded this session
+                    self._failed.add(path)
+
+
+_CACHE = []
+
+
+def get_cache():
+    """
+    :return: (ThumbnailCache) for the session
+    """
+    if not _CACHE:
+        _CACHE.append(ThumbnailCache())
+    return _CACHE[0]
@@ -0,0 +1,262 @@
+"""
+Next free {version} for the versioned publish templates.
+
+Finding the next version of eg maya_shot_anim_alembic_versionFolder (@shot_root/publish/alembic_anim/v{version}/)
+or asset_alembic_cache ({name}_ABC.v{version}.abc) meant listing the whole publish folder on the share. The allocator
+keeps a high water mark per template next to the versions instead:
+    {publish folder}/.version_hwm.{key}.json
+where key is a hash of the versioned folder or file name pattern, so the hwm is shared by everything publishing to
+the same versions however they got there.
+
+A version is reserved by creating a marker file with O_EXCL:
+    {publish folder}/.version_reserved.{key}.v{version}
+only one publisher can create a given marker so two publishing at once never get the same version. A version whose
+folder or file already exists is skipped with one stat of the template's own padding, so publishes made without the
+allocator are never clobbered. When the hwm is missing or unreadable it is rebuilt from a single scandir of the
+publish folder, and so is an hwm that one of the PROBE_AHEAD versions past it has already been published to without
+the allocator, so a new publish never lands below one that's already there. That's at most PROBE_AHEAD stats before
+reserving, the scandir only happens when a probe hits, and it counts every padding.
+
+Markers are removed by commit() once the publish is written, or by release() when it is abandoned.
+
+Usage:
+    reservation = allocate_for_template(tk.templates['maya_shot_anim_alembic_versionFolder'], fields,
+                                        minimum=fields['version'])
+    fields['version'] = reservation.version
+    ... publish ...
+    reservation.commit()
+
+    reservation = VersionAllocator('/projects/x/.../publish/alembic', 'hero_ABC.v{version}.abc').reserve()
+"""
+import errno
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+VERSION_KEY = '{version}'
+HWM_NAME = '.version_hwm.{}.json'
+MARKER_NAME = '.version_reserved.{}.v{}'
+## reservations older than this are from publishes that died, they no longer hold their version back
+MARKER_MAX_AGE = 24 * 60 * 60
+## a version the templates will never produce, swapped back for {version} to find the versioned part of a path
+SENTINEL_VERSION = 987654321
+MAX_ATTEMPTS = 1000
+## the version key's format_spec in core/templates.yml
+DEFAULT_FORMAT_SPEC = '03'
+## versions past the hwm checked for publishes made without the allocator before the hwm is trusted
+PROBE_AHEAD = 5
+
+
+class VersionAllocatorError(Exception):
+    pass
+
+
+def _list_names(folder):
+    if scandir is not None:
+        return [entry.name for entry in scandir(folder)]
+    return os.listdir(folder)
+
+
+class Reservation(object):
+    def __init__(self, allocator, version, marker):
+        self.allocator = allocator
+        self.version = version
+        self.marker = marker
+
+    @property
+    def path(self):
+        """
+        :return: (str) the versioned folder or file this reservation is for
+        """
+        return self.allocator.path(self.version)
+
+    def _remove_marker(self):
+        try:
+            os.remove(self.marker)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+
+    def commit(self):
+        """
+        Call once the publish is written, its folder or file holds the version from then on.
+        """
+        if not os.path.exists(self.path):
+            raise VersionAllocatorError('Nothing was published to {}'.format(self.path))
+        self._remove_marker()
+
+    def release(self):
+        """
+        Gives up the reservation, the version stays skipped as the hwm has already moved past it.
+        """
+        self._remove_marker()
+
+
+class VersionAllocator(object):
+    def __init__(self, folder, pattern, format_spec=DEFAULT_FORMAT_SPEC):
+        """
+        :param folder: (str) the publish folder the versions live in eg .../publish/alembic_anim
+        :param pattern: (str) name of the versioned folder or file with {version} in it eg v{version} or
+                        hero_ABC.v{version}.abc
+        :param format_spec: (str) how the template pads the version, the version key's format_spec
+        """
+        if pattern.count(VERSION_KEY) != 1:
+            raise VersionAllocatorError('{} needs exactly one {}'.format(pattern, VERSION_KEY))
+        self.folder = folder
+        self.pattern = pattern
+        self.format_spec = format_spec
+        self.key = hashlib.sha1(pattern.encode('utf-8')).hexdigest()[:12]
+        self.hwm_path = os.path.join(folder, HWM_NAME.format(self.key))
+        head, tail = pattern.split(VERSION_KEY)
+        self._regex = re.compile(r'^{}(\d+){}$'.format(re.escape(head), re.escape(tail)))
+        self._marker_regex = re.compile(r'^{}(\d+)$'.format(re.escape(MARKER_NAME.format(self.key, ''))))
+
+    def path(self, version):
+        return os.path.join(self.folder, self.pattern.replace(VERSION_KEY, format(version, self.format_spec)))
+
+    def _exists(self, version):
+        ## only the template's own padding, the scandir in rebuild() catches versions written with any other
+        return os.path.exists(self.path(version))
+
+    def _read_hwm(self):
+        try:
+            with open(self.hwm_path, 'r') as f:
+                data = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if data.get('pattern') != self.pattern:
+            return None
+        return int(data['version'])
+
+    def _write_hwm(self, version):
+        ## never move the hwm backwards if another publisher got further while we were reserving
+        current = self._read_hwm()
+        if current is not None and current >= version:
+            return
+        tmp_path = '{}.{}.{}.tmp'.format(self.hwm_path, os.getpid(), threading.current_thread().ident)
+        try:
+            with open(tmp_path, 'w') as f:
+                json.dump({'pattern': self.pattern, 'version': version, 'time': time.time()}, f)
+            if os.path.isfile(self.hwm_path):
+                os.remove(self.hwm_path)
+            os.rename(tmp_path, self.hwm_path)
+        except (IOError, OSError) as e:
+            ## the markers keep versions unique without it, the next publish just rebuilds it
+            print('Failed to write the version hwm {}: {}'.format(self.hwm_path, e))
+            if os.path.isfile(tmp_path):
+                os.remove(tmp_path)
+
+    def rebuild(self):
+        """
+        Works the hwm out from one listing of the publish folder.
+        :return: (int) the highest version published or reserved, 0 if there are none
+        """
+        highest = 0
+        if not os.path.isdir(self.folder):
+            return highest
+        now = time.time()
+        for name in _list_names(self.folder):
+            match = self._regex.match(name)
+            if match:
+                highest = max(highest, int(match.group(1)))
+                continue
+            match = self._marker_regex.match(name)
+            if match and now - os.path.getmtime(os.path.join(self.folder, name)) < MARKER_MAX_AGE:
+                highest = max(highest, int(match.group(1)))
+        self._write_hwm(highest)
+        return highest
+
+    def latest(self):
+        """
+        :return: (int) the hwm, without listing the folder unless it has to be rebuilt
+        """
+        hwm = self._read_hwm()
+        if hwm is None:
+            return self.rebuild()
+        ## published past the hwm by something that didn't go through the allocator
+        if any(self._exists(version) for version in range(hwm + 1, hwm + PROBE_AHEAD + 1)):
+            return self.rebuild()
+        return hwm
+
+    def _claim(self, marker):
+        try:
+            handle = os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+            try:
+                if time.time() - os.path.getmtime(marker) < MARKER_MAX_AGE:
+                    return False
+                ## left behind by a publish that died, take it over
+                os.remove(marker)
+            except OSError:
+                return False
+            return self._claim(marker)
+        os.write(handle, '{} {}'.format(os.getpid(), time.time()).encode('utf-8'))
+        os.close(handle)
+        return True
+
+    def reserve(self, minimum=1):
+        """
+        :param minimum: (int) lowest version to hand out eg the work file's version, so publishes keep following it
+                        while it is free
+        :return: (Reservation) for the next free version
+        """
+        if not os.path.isdir(self.folder):
+            os.makedirs(self.folder)
+        version = max(self.latest(), minimum - 1)
+        for _ in range(MAX_ATTEMPTS):
+            version += 1
+            marker = os.path.join(self.folder, MARKER_NAME.format(self.key, version))
+            if self._exists(version) or not self._claim(marker):
+                continue
+            if self._exists(version):
+                ## published without the allocator between the stat and the claim
+                os.remove(marker)
+                continue
+            self._write_hwm(version)
+            return Reservation(self, version, marker)
+        raise VersionAllocatorError('No free version in {} after {} attempts'.format(self.folder, MAX_ATTEMPTS))
+
+
+def split_template_path(template, fields):
+    """
+    :param template: (TemplatePath) a toolkit template with {version} in it
+    :param fields: (dict) every other field the template needs
+    :return: (tuple) of (publish folder, versioned folder or file name pattern)
+    """
+    fields = dict(fields)
+    fields['version'] = SENTINEL_VERSION
+    parts = template.apply_fields(fields).replace('\\', '/').split('/')
+    sentinel = str(SENTINEL_VERSION)
+    for index, part in enumerate(parts):
+        if sentinel in part:
+            ## the file name in eg v{version}/{name}.v{version}.atom follows its folder's version
+            return '/'.join(parts[:index]), part.replace(sentinel, VERSION_KEY)
+    raise VersionAllocatorError('Template {} has no version in it'.format(template))
+
+
+def version_format_spec(template):
+    """
+    :return: (str) how the template pads {version}, from its version key
+    """
+    return getattr(template.keys.get('version'), 'format_spec', None) or DEFAULT_FORMAT_SPEC
+
+
+def allocate_for_template(template, fields, minimum=1):
+    """
+    :return: (Reservation) of the next free version, no lower than minimum, for the template with these fields
+    """
+    folder, pattern = split_template_path(template, fields)
+    return VersionAllocator(folder, pattern, version_format_spec(template)).reserve(minimum)